@@ -2,27 +2,45 @@
 
 import streamlit as st
 import logging
+import time
 from utils import initialize_session_state, load_css
 from auth import github_auth
-from github_ops import list_repos, list_files, get_file_content, update_file
+from github_ops import list_repos, list_files, get_file_content, save_file, warm_repo_list
 from ui_components import (
     repo_management_dialog,
     file_management_dialog,
     file_selector_dialog,
+    code_search_dialog,
+    batch_commit_dialog,
     dialog_update,
-    execute_code_sandbox
+    execute_code_sandbox,
+    large_file_viewer,
+    rate_budget_caption,
+    sandbox_link
 )
-from llm_utils import generate_code_with_llm
+from llm_cache import response_cache
+from metrics import configure_logging, start_metrics_server
+from sandbox_runner import warm_sandbox_pool
 from code_editor import code_editor
 from github import GithubException  
 
+@st.fragment
 def code_editor_and_prompt():
     """
-    Displays the code editor and handles prompt-based code generation.
+    Displays the code editor and handles its events.
+
+    Runs as a fragment, so editor events rerun only the editor. The component is
+    keyed by a version that changes only when the buffer was replaced outside the
+    editor (file opened, code generated), so other reruns do not remount it with
+    the whole buffer.
     """
     if 'file_content' not in st.session_state:
         st.session_state.file_content = ""
 
+    if st.session_state.get('large_file'):
+        large_file_viewer()
+        return
+
     custom_btns = [
         {
             "name": "Copy",
@@ -100,8 +118,13 @@ def code_editor_and_prompt():
         "info": [{"name": info_msg, "style": {"width": "100%"}}]
     }
 
+    if st.session_state.file_content != st.session_state.editor_text:
+        st.session_state.editor_version += 1
+        st.session_state.editor_text = st.session_state.file_content
+
     response_dict = code_editor(
         st.session_state.file_content,
+        key=f"code_editor_{st.session_state.editor_version}",
         buttons=custom_btns,
         options={"wrap": True, "showLineNumbers": True},
         theme="contrast",
@@ -112,20 +135,215 @@ def code_editor_and_prompt():
         component_props={"style": code_style}
     )
 
-    if len(response_dict['id']) != 0:
+    # The component keeps returning its last event, so handle each event once.
+    if len(response_dict['id']) != 0 and response_dict['id'] != st.session_state.get('editor_event_id'):
+        st.session_state.editor_event_id = response_dict['id']
         if response_dict['type'] == "submit":
             execute_code_sandbox()
+            # Rerun the app: the "Sandbox" link outside this fragment still points at the old snapshot.
+            st.rerun()
         elif response_dict['type'] == "selection":
             # Handle selection type - FUTURE FEATURE
             pass
         elif response_dict['type'] == "saved":
-            st.session_state.file_content = response_dict['text']
+            # The editor already shows this text, so keep its version.
+            st.session_state.file_content = st.session_state.editor_text = response_dict['text']
             dialog_update()
 
+def stream_generation(user_prompt: str, placeholder, patch: bool = False) -> None:
+    """
+    Streams generated code into a placeholder as tokens arrive.
+
+    The partial output is kept in the session state, so a generation stopped with
+    the "Stop generation" button (which interrupts this run) lands in the editor.
+    A stream cut off by a provider error leaves the file as it was.
+    In patch mode the streamed SEARCH/REPLACE blocks are applied once complete;
+    if they do not apply, the full file is regenerated instead.
+
+    Args:
+        user_prompt (str): User's prompt for code generation.
+        placeholder: Streamlit placeholder that shows the partial code.
+        patch (bool): Request a patch instead of the full file.
+    """
+    from llm_utils import stream_code_with_llm, apply_generated_patch, fits_full_rewrite
+
+    app_code = st.session_state.file_content
+    if app_code.strip() and not patch and not fits_full_rewrite(app_code):
+        st.warning(
+            f"This file is too long for {st.session_state.selected_llm} to rewrite in one answer, asking for a patch instead.",
+            icon=':material/info:'
+        )
+        patch = True
+    patch = patch and bool(app_code.strip())
+    chunks = stream_code_with_llm(user_prompt, app_code, patch=patch)
+    if chunks is None:
+        return
+    st.session_state.generation_partial = ""
+    with placeholder.container():
+        st.button("Stop generation", key=f"stop_generation_{'patch' if patch else 'full'}", icon=":material/stop_circle:")
+        code_view = st.empty()
+    completed = False
+    last_render = 0.0
+    try:
+        for chunk in chunks:
+            st.session_state.generation_partial += chunk
+            # Throttle redraws so long completions do not flood the websocket.
+            if time.perf_counter() - last_render > 0.15:
+                code_view.code(st.session_state.generation_partial, language="diff" if patch else "python")
+                last_render = time.perf_counter()
+        completed = True
+    finally:
+        chunks.close()
+        # A partial patch cannot be applied, so only full-file output is kept.
+        if not completed and not patch and st.session_state.generation_partial.strip():
+            st.session_state.file_content = st.session_state.generation_partial
+            st.session_state.generation_cancelled = True
+
+    if st.session_state.last_generation.get('failed'):
+        # The provider already showed its error; a cut-off answer must not replace the file.
+        placeholder.empty()
+        return
+    generated_code = st.session_state.generation_partial.strip()
+    if patch and generated_code:
+        generated_code = apply_generated_patch(generated_code, app_code)
+        if generated_code is None:
+            if not fits_full_rewrite(app_code):
+                placeholder.empty()
+                st.error("The patch did not apply cleanly, and the file is too long to regenerate in full.", icon=':material/sentiment_dissatisfied:')
+                return
+            st.warning("The patch did not apply cleanly, regenerating the full file.", icon=':material/info:')
+            stream_generation(user_prompt, placeholder, patch=False)
+            return
+    if generated_code:
+        st.session_state.file_content = generated_code
+        st.success("Code generated successfully!", icon=':material/sentiment_satisfied:')
+        st.rerun()
+    else:
+        placeholder.empty()
+        st.error("Failed to generate code. Please check your API key.", icon=':material/sentiment_dissatisfied:')
+
+@st.fragment
+def repo_actions_menu():
+    """
+    Displays the "Repo actions" menu. Runs as a fragment, so its buttons rerun only
+    the menu; the dialogs and logout rerun the app when they change the session.
+    """
+    with st.popover("Repo actions", use_container_width=True):
+        repo_col1, repo_col6, repo_col2, repo_col3, repo_col5, repo_col4 = st.columns([5, 5, 5, 5, 5, 5], vertical_alignment="bottom")
+        with repo_col1:
+            if st.button("Choose file from a repo"):
+                file_selector_dialog()
+        with repo_col6:
+            if st.button("Search code"):
+                code_search_dialog()
+        with repo_col2:
+            if st.button("Create/Delete Repositories"):
+                repo_management_dialog()
+        with repo_col3:
+            if st.button("Create/Delete Files in Repo"):
+                file_management_dialog()
+        with repo_col5:
+            if st.button("Stage & commit changes"):
+                batch_commit_dialog()
+        with repo_col4:
+            if st.button("Logout"):  # FUTURE FEATURE
+                st.session_state.authenticated = False
+                st.session_state.github_token = ''
+                if 'g' in st.session_state:
+                    del st.session_state.g
+                st.rerun()
+        rate_budget_caption()
+
+@st.fragment
+def prompt_popover(generation_placeholder):
+    """
+    Displays the "Enter prompt" popover. Runs as a fragment, so editing the prompt
+    and its options reruns only the popover; a finished or stopped generation
+    reruns the app to load the code into the editor.
+
+    Args:
+        generation_placeholder: Streamlit placeholder that shows streamed code.
+    """
+    # "Stop generation" is drawn by this fragment, so stopping reruns only the fragment.
+    if st.session_state.get('generation_cancelled'):
+        st.rerun()
+    with st.popover("Enter prompt", use_container_width=True):
+        st.session_state.selected_llm = st.selectbox("Choose LLM:", ["Sonnet-3.5", "GPT-4o"])
+        user_prompt = st.text_area(
+            label="User prompt",
+            label_visibility="collapsed",
+            placeholder="Enter your prompt for code generation and click.",
+            height=300
+        )
+        edit_mode = st.radio(
+            "Edit mode:", ["Full file", "Patch"], key='edit_mode', horizontal=True,
+            help="Patch mode asks the LLM only for the changed lines and applies them locally."
+        )
+        stream_output = st.toggle("Stream output", value=True, key='stream_output')
+        st.checkbox("Bypass response cache", key='bypass_llm_cache',
+                    help="Always call the LLM, even if this prompt and file were answered before.")
+        st.number_input(
+            "Repository context (tokens):", min_value=0, max_value=32000, step=1000, key='context_budget',
+            help="Sends the excerpts of other files in the repository that are most relevant to the "
+                 "prompt, up to this many tokens. 0 sends the current file only."
+        )
+        if st.button("Execute prompt", key='exec_prompt'):
+            if not user_prompt.strip():
+                st.error("Prompt cannot be empty.", icon=':material/sentiment_dissatisfied:')
+            elif stream_output:
+                stream_generation(user_prompt, generation_placeholder, patch=edit_mode == "Patch")
+            else:
+                # llm_utils pulls in the provider SDKs, so load it only when a prompt runs.
+                from llm_utils import generate_code_with_llm
+                with st.spinner("Executing your prompt..."):
+                    generated_code = generate_code_with_llm(
+                        user_prompt, st.session_state.file_content, patch=edit_mode == "Patch"
+                    )
+                    if generated_code:
+                        st.session_state.file_content = generated_code
+                        st.success("Code generated successfully!", icon=':material/sentiment_satisfied:')
+                        st.rerun()
+                    else:
+                        st.error("Failed to generate code. Please check your API key.", icon=':material/sentiment_dissatisfied:')
+        last_generation = st.session_state.get('last_generation')
+        if last_generation:
+            first_token = last_generation['first_token']
+            st.caption(
+                f"Last generation ({last_generation['llm']}): first token "
+                f"{f'{first_token:.1f}s' if first_token is not None else 'n/a'}, "
+                f"total {last_generation['total']:.1f}s, "
+                f"{last_generation['input_tokens']:,} in / {last_generation['output_tokens']:,} out tokens"
+                f"{'' if last_generation['tokens_reported'] or last_generation['cache_hit'] else ' (estimated)'}"
+                f"{' (stopped early)' if last_generation['cancelled'] else ''}"
+                f"{' (cached)' if last_generation['cache_hit'] else ''}"
+            )
+        token_totals = st.session_state.get('token_totals')
+        if token_totals:
+            st.caption(
+                f"This session: {token_totals['requests']} generations, "
+                f"{token_totals['input_tokens']:,} in / {token_totals['output_tokens']:,} out tokens, "
+                f"{token_totals['seconds']:.0f}s"
+            )
+        last_context = st.session_state.get('last_context')
+        if last_context:
+            st.caption(
+                f"Repository context: {last_context['snippets']} excerpts from "
+                f"{last_context['files']} files, ~{last_context['tokens']} tokens"
+            )
+        cache_stats = response_cache.stats()
+        st.caption(
+            f"Response cache: {cache_stats['hit_rate']:.0%} hit rate "
+            f"({cache_stats['memory_hits'] + cache_stats['disk_hits']} hits / {cache_stats['misses']} misses)"
+        )
+
 def main():
     """
     Main function to run the Streamlit application.
     """
+    # Structured logs and the Prometheus endpoint are opt-in (LOG_FORMAT=json, METRICS_PORT)
+    configure_logging()
+    start_metrics_server()
+
     # Initialize session state
     initialize_session_state()
 
@@ -140,60 +358,30 @@ def main():
         g = github_auth()
         if g:
             st.session_state.g = g
+            warm_sandbox_pool()
+            warm_repo_list(g)
         else:
             st.stop()  # Stop execution if authentication fails
 
+    if st.session_state.pop('generation_cancelled', False):
+        st.warning("Generation stopped. The partial output was kept in the editor.", icon=':material/info:')
+    if st.session_state.pop('sandbox_saved', False):
+        st.success(f"Code saved to the sandbox. [Open sandbox]({sandbox_link()})", icon=':material/sentiment_satisfied:')
+
     # UI Layout
     try:
         link_col1, link_col2, popmenu_col3, prompt_col = st.columns([1, 1, 1, 6], vertical_alignment="bottom")
+        generation_placeholder = st.empty()
         with link_col1:
             st.page_link("app.py", label="Code editor", icon=":material/terminal:")
         with link_col2:
-            st.page_link("https://streamcoder.ploomberapp.io/sandbox", label="Sandbox", icon=":material/play_circle:")
-            #st.page_link("https://streamcoder.streamlit.app/sandbox", label="Sandbox", icon=":material/play_circle:")
+            st.page_link(sandbox_link(), label="Sandbox", icon=":material/play_circle:")
         with popmenu_col3:
-            with st.popover("Repo actions", use_container_width=True):
-                repo_col1, repo_col2, repo_col3, repo_col4 = st.columns([5, 5, 5, 5], vertical_alignment="bottom")
-                with repo_col1:
-                    if st.button("Choose file from a repo"):
-                        file_selector_dialog()
-                with repo_col2:
-                    if st.button("Create/Delete Repositories"):
-                        repo_management_dialog()
-                with repo_col3:
-                    if st.button("Create/Delete Files in Repo"):
-                        file_management_dialog()
-                with repo_col4:
-                    if st.button("Logout"):  # FUTURE FEATURE
-                        st.session_state.authenticated = False
-                        st.session_state.github_token = ''
-                        if 'g' in st.session_state:
-                            del st.session_state.g
-                        st.rerun()
+            repo_actions_menu()
         with prompt_col:
             editor_col1, editor_col2 = st.columns([4, 1], vertical_alignment="bottom")
             with editor_col1:
-                user_prompt=""
-                with st.popover("Enter prompt", use_container_width=True):
-                    st.session_state.selected_llm = st.selectbox("Choose LLM:", ["Sonnet-3.5", "GPT-4o"])
-                    user_prompt = st.text_area(
-                        label="User prompt",
-                        label_visibility="collapsed",
-                        placeholder="Enter your prompt for code generation and click.",
-                        height=300
-                    )
-                    if st.button("Execute prompt", key='exec_prompt'):
-                        if user_prompt.strip():
-                            with st.spinner("Executing your prompt..."):
-                                generated_code = generate_code_with_llm(user_prompt, st.session_state.file_content)
-                                if generated_code:
-                                    st.session_state.file_content = generated_code
-                                    st.success("Code generated successfully!", icon=':material/sentiment_satisfied:')
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to generate code. Please check your API key.", icon=':material/sentiment_dissatisfied:')
-                        else:
-                            st.error("Prompt cannot be empty.", icon=':material/sentiment_dissatisfied:')
+                prompt_popover(generation_placeholder)
             with editor_col2:
                 pass  # Placeholder for potential future features
 
@@ -4,6 +4,17 @@ from github import Github, GithubException
 import streamlit as st
 import logging
 from os import environ
+from clients import get_github_client, get_authenticated_login
+
+def get_github_token() -> str:
+    """
+    Returns the GitHub token from the HUBGIT_TOKEN environment variable, or from
+    the Streamlit secrets if it is not set.
+
+    Returns:
+        str: GitHub token.
+    """
+    return environ.get("HUBGIT_TOKEN") or st.secrets["HUBGIT_TOKEN"]
 
 def github_auth() -> Github:
     """
@@ -12,14 +23,15 @@ def github_auth() -> Github:
     Returns:
         Github: Authenticated GitHub client.
     """
-    github_token = environ.get("HUBGIT_TOKEN") or st.secrets["HUBGIT_TOKEN"]
+    github_token = get_github_token()
     if github_token:
         try:
-            g = Github(github_token)
-            user = g.get_user()
+            # Shared per-token client; the identity lookup only hits the API once per process.
+            g = get_github_client(github_token)
+            login = get_authenticated_login(g)
             st.session_state.github_token = github_token
             st.session_state.authenticated = True
-            logging.info(f"Authenticated as {user.login}")
+            logging.info(f"Authenticated as {login}")
             return g
         except GithubException as e:
             logging.error(f"GitHub Authentication Failed: {e.status} - {e.data}")
@@ -0,0 +1,321 @@
+# fake_github.py
+
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+def _blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def _file_content(path: str, size: int, rng: random.Random) -> bytes:
+    """
+    Deterministic Python-looking source of roughly `size` bytes.
+    """
+    lines = [f"# {path}", "", "import streamlit as st", ""]
+    while sum(len(line) + 1 for line in lines) < size:
+        n = rng.randrange(10_000)
+        lines.append(f"def function_{n}(value: int) -> int:")
+        lines.append(f"    \"\"\"Returns value scaled by {n}.\"\"\"")
+        lines.append(f"    return value * {n} + {rng.randrange(100)}")
+        lines.append("")
+    return ("\n".join(lines) + "\n").encode()
+
+class FakeRepo:
+    """
+    In-memory repository: a flat map of path -> bytes plus a linear commit history.
+    """
+
+    def __init__(self, name: str, files: Dict[str, bytes]):
+        self.name = name
+        self.files = dict(files)
+        self.blobs: Dict[str, bytes] = {_blob_sha(data): data for data in files.values()}
+        self.trees: Dict[str, List[Dict]] = {}
+        self.commits: Dict[str, Dict] = {}
+        self.head = self._commit("Initial commit", [])
+
+    def _tree_sha(self) -> str:
+        entries = sorted((path, _blob_sha(data)) for path, data in self.files.items())
+        sha = hashlib.sha1(json.dumps(entries).encode()).hexdigest()
+        if sha not in self.trees:
+            self.trees[sha] = [
+                {"path": path, "mode": "100644", "type": "blob", "sha": blob, "size": len(self.files[path])}
+                for path, blob in entries
+            ]
+        return sha
+
+    def _commit(self, message: str, parents: List[str], tree: Optional[str] = None) -> str:
+        tree = tree or self._tree_sha()
+        sha = hashlib.sha1(f"{tree}{parents}{message}{time.time_ns()}".encode()).hexdigest()
+        self.commits[sha] = {"tree": tree, "parents": parents, "message": message}
+        return sha
+
+    def write(self, path: str, data: bytes, message: str) -> str:
+        """
+        Commits new content for one file on top of the head, as the contents API does.
+
+        Returns:
+            str: The new head commit SHA.
+        """
+        self.files[path] = data
+        self.blobs[_blob_sha(data)] = data
+        self.head = self._commit(message, [self.head])
+        return self.head
+
+def generate_repo(name: str, file_count: int, mean_size: int, seed: int = 0) -> FakeRepo:
+    """
+    Builds a repository of `file_count` Python files spread over nested directories.
+
+    Args:
+        name (str): Repository name.
+        file_count (int): Number of files.
+        mean_size (int): Mean file size in bytes (sizes vary from half to 1.5x).
+        seed (int): Random seed, so runs are comparable.
+
+    Returns:
+        FakeRepo: The repository.
+    """
+    rng = random.Random(seed)
+    files = {}
+    for index in range(file_count):
+        path = f"pkg_{index % 20}/module_{index % 7}/file_{index}.py"
+        files[path] = _file_content(path, rng.randint(mean_size // 2, mean_size * 3 // 2), rng)
+    files["app.py"] = _file_content("app.py", mean_size, rng)
+    return FakeRepo(name, files)
+
+class FakeGitHub:
+    """
+    Serves the subset of the GitHub REST API the app uses, with per-request
+    latency, ETags (304 answers) and X-RateLimit headers.
+
+    Args:
+        repos (List[FakeRepo]): Repositories of the single fake user.
+        latency_ms (float): Delay added to every response.
+        login (str): Login of the authenticated user.
+    """
+
+    def __init__(self, repos: List[FakeRepo], latency_ms: float = 0.0, login: str = "bench"):
+        self.repos = {repo.name: repo for repo in repos}
+        self.latency_ms = latency_ms
+        self.login = login
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.remaining = 5000
+        self.reset = int(time.time()) + 3600
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, port: int = 0) -> "FakeGitHub":
+        fake = self
+
+        class Handler(_Handler):
+            github = fake
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-github", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    # Payloads
+
+    def repo_json(self, repo: FakeRepo) -> Dict:
+        return {
+            "id": abs(hash(repo.name)) % 10**8,
+            "name": repo.name,
+            "full_name": f"{self.login}/{repo.name}",
+            "owner": {"login": self.login, "id": 1, "type": "User", "url": f"{self.url}/users/{self.login}"},
+            "private": False,
+            "default_branch": "main",
+            "url": f"{self.url}/repos/{self.login}/{repo.name}",
+        }
+
+    def ref_json(self, repo: FakeRepo) -> Dict:
+        return {
+            "ref": "refs/heads/main",
+            "url": f"{self.url}/repos/{self.login}/{repo.name}/git/refs/heads/main",
+            "object": {"sha": repo.head, "type": "commit", "url": f"{self.url}/repos/{self.login}/{repo.name}/git/commits/{repo.head}"},
+        }
+
+    def content_json(self, repo: FakeRepo, path: str, include_content: bool = True) -> Dict:
+        data = repo.files[path]
+        payload = {
+            "type": "file",
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "sha": _blob_sha(data),
+            "size": len(data),
+            "url": f"{self.url}/repos/{self.login}/{repo.name}/contents/{path}",
+        }
+        if include_content:
+            large = len(data) > 1024 * 1024
+            payload["encoding"] = "none" if large else "base64"
+            payload["content"] = "" if large else base64.b64encode(data).decode()
+        return payload
+
+    def commit_json(self, repo: FakeRepo, sha: str) -> Dict:
+        commit = repo.commits[sha]
+        base = f"{self.url}/repos/{self.login}/{repo.name}/git"
+        return {
+            "sha": sha,
+            "url": f"{base}/commits/{sha}",
+            "message": commit["message"],
+            "tree": {"sha": commit["tree"], "url": f"{base}/trees/{commit['tree']}"},
+            "parents": [{"sha": parent, "url": f"{base}/commits/{parent}"} for parent in commit["parents"]],
+        }
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    github: FakeGitHub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def _dispatch(self, verb: str) -> None:
+        github = self.github
+        if github.latency_ms:
+            time.sleep(github.latency_ms / 1000)
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        with github.lock:
+            github.requests += 1
+            try:
+                status, payload = self._route(verb, path, query, body)
+            except KeyError:
+                status, payload = 404, {"message": "Not Found"}
+        self._respond(status, payload)
+
+    def _route(self, verb: str, path: str, query: Dict[str, str], body: Dict) -> Tuple[int, object]:
+        github = self.github
+        if path == "/user":
+            return 200, {"login": github.login, "id": 1, "type": "User", "url": f"{github.url}/users/{github.login}"}
+        if path == "/user/repos":
+            return 200, [github.repo_json(repo) for repo in github.repos.values()]
+        match = re.fullmatch(r"/repos/([^/]+)/([^/]+)(/.*)?", path)
+        if not match:
+            return 404, {"message": "Not Found"}
+        repo = github.repos[match.group(2)]
+        rest = match.group(3) or ""
+        if rest == "":
+            return 200, github.repo_json(repo)
+        if rest in ("/git/ref/heads/main", "/git/refs/heads/main"):
+            if verb == "PATCH":
+                if not body.get("force") and repo.head not in self._ancestors(repo, body["sha"]):
+                    return 422, {"message": "Update is not a fast forward"}
+                repo.head = body["sha"]
+                repo.files = {entry["path"]: repo.blobs[entry["sha"]] for entry in repo.trees[repo.commits[repo.head]["tree"]]}
+            return 200, github.ref_json(repo)
+        if rest.startswith("/git/trees"):
+            if verb == "POST":
+                return 201, self._create_tree(repo, body)
+            sha = rest.rsplit("/", 1)[1]
+            tree_sha = repo.commits[sha]["tree"] if sha in repo.commits else sha
+            return 200, {"sha": tree_sha, "url": f"{github.url}{path}", "tree": repo.trees[tree_sha], "truncated": False}
+        if rest.startswith("/git/blobs"):
+            if verb == "POST":
+                data = base64.b64decode(body["content"]) if body.get("encoding") == "base64" else body["content"].encode()
+                sha = _blob_sha(data)
+                repo.blobs[sha] = data
+                return 201, {"sha": sha, "url": f"{github.url}{path}/{sha}"}
+            data = repo.blobs[rest.rsplit("/", 1)[1]]
+            if "raw" in (self.headers.get("Accept") or ""):
+                return 200, data
+            return 200, {"sha": _blob_sha(data), "size": len(data), "encoding": "base64", "content": base64.b64encode(data).decode()}
+        if rest.startswith("/git/commits"):
+            if verb == "POST":
+                sha = repo._commit(body["message"], body.get("parents", []), tree=body["tree"])
+                return 201, github.commit_json(repo, sha)
+            return 200, github.commit_json(repo, rest.rsplit("/", 1)[1])
+        if rest.startswith("/contents/"):
+            file_path = rest[len("/contents/"):]
+            if verb == "PUT":
+                return self._put_contents(repo, file_path, body)
+            return 200, github.content_json(repo, file_path)
+        return 404, {"message": "Not Found"}
+
+    @staticmethod
+    def _ancestors(repo: FakeRepo, sha: str) -> set:
+        seen, pending = set(), [sha]
+        while pending:
+            current = pending.pop()
+            if current in seen or current not in repo.commits:
+                continue
+            seen.add(current)
+            pending.extend(repo.commits[current]["parents"])
+        return seen
+
+    def _create_tree(self, repo: FakeRepo, body: Dict) -> Dict:
+        entries = {entry["path"]: entry for entry in repo.trees.get(body.get("base_tree"), [])}
+        for element in body["tree"]:
+            if element.get("sha") is None:
+                entries.pop(element["path"], None)
+            else:
+                entries[element["path"]] = {
+                    "path": element["path"], "mode": element["mode"], "type": "blob",
+                    "sha": element["sha"], "size": len(repo.blobs[element["sha"]]),
+                }
+        tree = sorted(entries.values(), key=lambda entry: entry["path"])
+        sha = hashlib.sha1(json.dumps([(entry["path"], entry["sha"]) for entry in tree]).encode()).hexdigest()
+        repo.trees[sha] = tree
+        return {"sha": sha, "url": f"{self.github.url}/repos/{self.github.login}/{repo.name}/git/trees/{sha}", "tree": tree}
+
+    def _put_contents(self, repo: FakeRepo, file_path: str, body: Dict) -> Tuple[int, object]:
+        current = repo.files.get(file_path)
+        if current is not None and body.get("sha") != _blob_sha(current):
+            return 409, {"message": f"{file_path} does not match {body.get('sha')}"}
+        repo.write(file_path, base64.b64decode(body["content"]), body["message"])
+        return 200, {
+            "content": self.github.content_json(repo, file_path, include_content=False),
+            "commit": self.github.commit_json(repo, repo.head),
+        }
+
+    def _respond(self, status: int, payload: object) -> None:
+        github = self.github
+        if isinstance(payload, bytes):
+            body, content_type = payload, "application/octet-stream"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json; charset=utf-8"
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if self.command == "GET" and status == 200 and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""  # conditional hits do not count against the quota
+        else:
+            with github.lock:
+                github.remaining = max(0, github.remaining - 1)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Limit", "5000")
+        self.send_header("X-RateLimit-Remaining", str(github.remaining))
+        self.send_header("X-RateLimit-Reset", str(github.reset))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,184 @@
+# fake_llm.py
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional
+
+# Roughly what a BPE tokenizer averages on source code.
+CHARS_PER_TOKEN = 4
+
+class FakeLLM:
+    """
+    Serves Anthropic Messages (`/v1/messages`) and OpenAI Chat Completions
+    (`/v1/chat/completions`) compatible endpoints, blocking or streamed as SSE.
+
+    The completion echoes the user message, which carries the whole file, so it
+    is as long as a full-file regeneration, and arrives at a configurable time
+    to first token and token rate. Patch-mode requests get a one-block patch of
+    the file's first line instead, which applies cleanly.
+
+    Args:
+        ttft_ms (float): Delay before the first token.
+        tokens_per_second (float): Output rate after the first token.
+    """
+
+    def __init__(self, ttft_ms: float = 300.0, tokens_per_second: float = 400.0):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, port: int = 0) -> "FakeLLM":
+        fake = self
+
+        class Handler(_Handler):
+            llm = fake
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-llm", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def tokens(self, text: str) -> List[str]:
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)] or [""]
+
+    def paced(self, tokens: List[str], batch: int = 8) -> Iterator[str]:
+        """
+        Yields batches of tokens on the configured schedule.
+        """
+        started = time.perf_counter()
+        time.sleep(self.ttft_ms / 1000)
+        for index in range(0, len(tokens), batch):
+            due = started + self.ttft_ms / 1000 + index / self.tokens_per_second
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield "".join(tokens[index:index + batch])
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    llm: FakeLLM = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        with self.llm.lock:
+            self.llm.requests += 1
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        path = self.path.split("?")[0]
+        if path.endswith("/messages"):
+            self._anthropic(body)
+        elif path.endswith("/chat/completions"):
+            self._openai(body)
+        else:
+            self._json(404, {"error": {"type": "not_found", "message": path}})
+
+    @staticmethod
+    def _completion(system: str, user_text: str) -> str:
+        if "<<<<<<< SEARCH" not in system or "Current file:\n" not in user_text:
+            return user_text
+        first_line = user_text.split("Current file:\n", 1)[1].split("\n", 1)[0]
+        return f"<<<<<<< SEARCH\n{first_line}\n=======\n{first_line}  # edited\n>>>>>>> REPLACE\n"
+
+    @staticmethod
+    def _text(content) -> str:
+        if isinstance(content, str):
+            return content
+        return "".join(part.get("text", "") for part in content)
+
+    def _json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _event(self, data: dict, event: Optional[str] = None) -> None:
+        prefix = f"event: {event}\n" if event else ""
+        self.wfile.write(f"{prefix}data: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def _anthropic(self, body: dict) -> None:
+        llm = self.llm
+        user_text = self._text(body["messages"][-1]["content"])
+        prompt_tokens = (len(self._text(body.get("system", ""))) + len(user_text)) // CHARS_PER_TOKEN
+        tokens = llm.tokens(self._completion(self._text(body.get("system", "")), user_text))[:body.get("max_tokens", 4096)]
+        message_id = f"msg_{uuid.uuid4().hex[:24]}"
+        usage = {"input_tokens": prompt_tokens, "output_tokens": len(tokens)}
+        if not body.get("stream"):
+            text = "".join(llm.paced(tokens, batch=len(tokens)))
+            self._json(200, {
+                "id": message_id, "type": "message", "role": "assistant", "model": body["model"],
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+            })
+            return
+        self._start_stream()
+        try:
+            self._event({"type": "message_start", "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": body["model"], "content": [],
+                "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": prompt_tokens, "output_tokens": 1},
+            }}, "message_start")
+            self._event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+            for text in llm.paced(tokens):
+                self._event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}, "content_block_delta")
+            self._event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            self._event({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                         "usage": {"output_tokens": len(tokens)}}, "message_delta")
+            self._event({"type": "message_stop"}, "message_stop")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client cancelled the generation
+
+    def _openai(self, body: dict) -> None:
+        llm = self.llm
+        messages = body["messages"]
+        user_text = self._text(messages[-1]["content"])
+        prompt_tokens = sum(len(self._text(message["content"])) for message in messages) // CHARS_PER_TOKEN
+        system = "".join(self._text(message["content"]) for message in messages if message["role"] == "system")
+        tokens = llm.tokens(self._completion(system, user_text))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+        if not body.get("stream"):
+            text = "".join(llm.paced(tokens, batch=len(tokens)))
+            self._json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"]}
+        self._start_stream()
+        try:
+            for text in llm.paced(tokens):
+                self._event(dict(chunk, choices=[{"index": 0, "delta": {"content": text}, "finish_reason": None}]))
+            self._event(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._event(dict(chunk, choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
@@ -0,0 +1,375 @@
+# run.py
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from random import Random
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+# Outside `streamlit run` every st call warns about the missing script context.
+# Done at import, so the sandbox workers, which import this module, are quiet too;
+# streamlit resets logger levels when it loads its config, but not `disabled`.
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+from fake_github import FakeGitHub, generate_repo
+from fake_llm import FakeLLM
+
+RESULTS_FILE = os.path.join(BENCH_DIR, "results.jsonl")
+REPO_NAME = "bench-repo"
+SCENARIOS = [
+    "open_repo_cold",
+    "open_repo_warm",
+    "load_and_save",
+    "save_with_upstream_change",
+    "generate_anthropic_stream",
+    "generate_anthropic_complete",
+    "generate_openai_stream",
+    "generate_openai_complete",
+    "sandbox_run",
+    "sandbox_rerun_edited",
+    "search_paths",
+]
+
+# Paths in the tree the file search scenario queries, and what it types: every
+# prefix of each query is searched, as a search-as-you-type box would.
+SEARCH_PATHS = 100_000
+SEARCH_QUERIES = ["github_ops", "src handlers", "ghops", "test_", "readme"]
+_PATH_WORDS = [
+    "src", "lib", "core", "utils", "api", "server", "client", "models", "views", "tests", "components",
+    "github", "ops", "index", "config", "handlers", "services", "data", "io", "common", "internal",
+    "auth", "cache", "search", "merge", "sandbox", "metrics", "token", "frontend", "backend", "docs",
+    "schema", "router", "session", "storage", "queue", "worker", "scheduler", "billing", "invoice",
+    "account", "profile", "settings", "widgets", "layout", "theme", "i18n", "locale", "email", "notify",
+    "upload", "image", "video", "player", "parser", "lexer", "compiler", "runtime", "plugin", "adapter",
+    "migrations", "fixtures", "mocks", "helpers", "middleware", "gateway", "proxy", "crypto", "payments",
+]
+_PATH_EXTENSIONS = [".py", ".ts", ".tsx", ".js", ".md", ".json", ".go", ".rs"]
+
+SANDBOX_SCRIPT = '''
+import streamlit as st
+st.title("Benchmark")
+total = 0
+for i in range(200):
+    total += i * i
+    st.write(f"Row {i}: {total}")
+st.metric("Total", total)
+'''
+
+# Incremental sandbox runs: an expensive first cell, and a last cell the
+# scenario edits before every run.
+SANDBOX_CELLS_SCRIPT = '''
+import streamlit as st
+# %%
+table = [sum(i * j for j in range(300)) for i in range(3000)]
+# %%
+st.metric("Rows", len(table))
+# %%
+st.write("Edit {iteration}:", table[{iteration} % len(table)])
+'''
+
+def sample_source(lines: int) -> str:
+    """
+    Returns a Python file of `lines` lines for the generation scenarios.
+    """
+    body = []
+    for index in range(0, lines - 1, 4):
+        body += [f"def step_{index}(value: int) -> int:", f"    \"\"\"Step {index}.\"\"\"", f"    return value + {index}", ""]
+    return "import streamlit as st\n" + "\n".join(body[:lines - 1]) + "\n"
+
+def sample_paths(count: int, seed: int = 0) -> List[str]:
+    """
+    Returns `count` distinct file paths of a large mixed-language tree, about
+    twenty files per directory.
+    """
+    random = Random(seed)
+    directories = [""]
+    while len(directories) < count // 20:
+        parent = random.choice(directories)
+        directories.append(f"{parent}{random.choice(_PATH_WORDS)}{random.choice(['', '', '_v2', '-legacy', '2'])}/")
+    paths = set()
+    while len(paths) < count:
+        name = "_".join(random.choice(_PATH_WORDS) for _ in range(random.randint(1, 3)))
+        paths.add(f"{random.choice(directories)}{name}{random.choice(_PATH_EXTENSIONS)}")
+    return sorted(paths)
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """
+    Returns median, p95 and min of timings given in seconds, in milliseconds.
+    """
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "median_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "min_ms": round(ordered[0] * 1000, 2),
+    }
+
+def measure(run: Callable[[int], Optional[Dict[str, float]]], runs: int, warmup: int, setup: Optional[Callable[[], None]] = None) -> Dict:
+    """
+    Times a scenario.
+
+    Args:
+        run (Callable[[int], Optional[Dict[str, float]]]): Scenario body, called with the
+            iteration number. May return extra timings in seconds (e.g. first token).
+        runs (int): Measured iterations.
+        warmup (int): Unmeasured iterations run first.
+        setup (Optional[Callable[[], None]]): Called before every iteration, untimed.
+
+    Returns:
+        Dict: Summary of the total and extra timings, or the error that stopped the scenario.
+    """
+    totals: List[float] = []
+    extras: Dict[str, List[float]] = {}
+    for iteration in range(warmup + runs):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        try:
+            extra = run(iteration) or {}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}", "runs": len(totals)}
+        elapsed = time.perf_counter() - started
+        if iteration < warmup:
+            continue
+        totals.append(elapsed)
+        for name, value in extra.items():
+            extras.setdefault(name, []).append(value)
+    result = dict(summarize(totals), runs=len(totals))
+    for name, values in extras.items():
+        result[name] = summarize(values)
+    return result
+
+def previous_result(path: str, params: Dict) -> Optional[Dict]:
+    """
+    Returns the latest stored run with the same parameters.
+    """
+    if not os.path.exists(path):
+        return None
+    latest = None
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("params") == params:
+                latest = entry
+    return latest
+
+def git_revision() -> str:
+    completed = subprocess.run(
+        ["git", "describe", "--always", "--dirty"], cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    return completed.stdout.strip() or "unknown"
+
+def build_scenarios(args: argparse.Namespace, github: FakeGitHub) -> Dict[str, Dict]:
+    """
+    Binds the scenarios to the app code, which is only imported once the
+    environment points it at the stand-in servers.
+    """
+    import streamlit as st
+    from blob_cache import blob_cache
+    from clients import get_github_client
+    from github_cache import clear_cache
+    from github_ops import _fetch_tree_entries, fetch_file, list_file_entries, list_repos, save_file
+    from llm_utils import generate_code_with_llm, stream_code_with_llm
+    from path_index import PathIndex
+    from sandbox_compiler import compile_sandbox_code, split_sandbox_cells
+    from sandbox_runner import get_sandbox_pool
+
+    g = get_github_client(os.environ["HUBGIT_TOKEN"])
+    app_code = sample_source(args.generate_lines)
+
+    def cold_caches():
+        clear_cache()
+        _fetch_tree_entries.clear()
+        blob_cache.clear()
+
+    def open_repo(iteration):
+        if REPO_NAME not in list_repos(g):
+            raise RuntimeError("repository list does not contain the benchmark repository")
+        entries = list_file_entries(g, REPO_NAME)
+        if len(entries) < args.files:
+            raise RuntimeError(f"listed {len(entries)} files, expected {args.files}")
+        if fetch_file(g, REPO_NAME, "app.py") is None:
+            raise RuntimeError("app.py could not be read")
+
+    def load_and_save(iteration):
+        file = fetch_file(g, REPO_NAME, "app.py")
+        result = save_file(g, REPO_NAME, "app.py", file.text + f"# edit {iteration}\n", "Benchmark edit", file.sha, file.text)
+        if result.status != "saved":
+            raise RuntimeError(f"save ended with status '{result.status}'")
+
+    def save_with_upstream_change(iteration):
+        file = fetch_file(g, REPO_NAME, "app.py")
+        # Someone else commits to the top of the file while it is being edited.
+        repo = github.repos[REPO_NAME]
+        repo.write("app.py", f"# upstream {iteration}\n".encode() + repo.files["app.py"], "Upstream edit")
+        result = save_file(g, REPO_NAME, "app.py", file.text + f"# edit {iteration}\n", "Benchmark edit", file.sha, file.text)
+        if result.status != "merged":
+            raise RuntimeError(f"save ended with status '{result.status}'")
+
+    def generate(selected_llm: str, streamed: bool):
+        def run(iteration):
+            st.session_state.selected_llm = selected_llm
+            st.session_state.bypass_llm_cache = True
+            prompt = f"Add type hints ({iteration})."
+            if streamed:
+                chunks = stream_code_with_llm(prompt, app_code)
+                text = "".join(chunks) if chunks is not None else ""
+            else:
+                text = generate_code_with_llm(prompt, app_code) or ""
+            if not text:
+                raise RuntimeError("no completion, see the log for the API error")
+            generation = st.session_state.last_generation
+            return {"first_token": generation["first_token"]} if streamed else None
+        return run
+
+    def sandbox_run(iteration):
+        code, _, _ = compile_sandbox_code(SANDBOX_SCRIPT)
+        result = get_sandbox_pool().run(code, SANDBOX_SCRIPT)
+        if not result.ok:
+            raise RuntimeError(result.error)
+        return {"exec": result.exec_time}
+
+    def sandbox_rerun_edited(iteration):
+        script = SANDBOX_CELLS_SCRIPT.replace("{iteration}", str(iteration))
+        result = get_sandbox_pool().run_cells("bench", split_sandbox_cells(script), script)
+        if not result.ok:
+            raise RuntimeError(result.error)
+        return {"exec": result.exec_time}
+
+    path_indexes = []
+
+    def fresh_path_index():
+        # Built once, untimed; each iteration starts without remembered lookups.
+        if not path_indexes:
+            path_indexes.append(PathIndex(sample_paths(SEARCH_PATHS)))
+        path_indexes[0]._lookups.clear()
+
+    def search_paths(iteration):
+        index = path_indexes[0]
+        slowest = 0.0
+        for query in SEARCH_QUERIES:
+            for end in range(1, len(query) + 1):
+                started = time.perf_counter()
+                index.search(query[:end])
+                slowest = max(slowest, time.perf_counter() - started)
+        return {"slowest_query": slowest}
+
+    return {
+        "open_repo_cold": {"run": open_repo, "setup": cold_caches},
+        "open_repo_warm": {"run": open_repo},
+        "load_and_save": {"run": load_and_save},
+        "save_with_upstream_change": {"run": save_with_upstream_change},
+        "generate_anthropic_stream": {"run": generate("Sonnet-3.5", streamed=True)},
+        "generate_anthropic_complete": {"run": generate("Sonnet-3.5", streamed=False)},
+        "generate_openai_stream": {"run": generate("GPT-4o", streamed=True)},
+        "generate_openai_complete": {"run": generate("GPT-4o", streamed=False)},
+        "sandbox_run": {"run": sandbox_run},
+        "sandbox_rerun_edited": {"run": sandbox_rerun_edited},
+        "search_paths": {"run": search_paths, "setup": fresh_path_index},
+    }
+
+def format_delta(current: Dict, previous: Optional[Dict]) -> str:
+    if not previous or "median_ms" not in previous or "median_ms" not in current or not previous["median_ms"]:
+        return ""
+    change = (current["median_ms"] - previous["median_ms"]) / previous["median_ms"] * 100
+    return f"{change:+.1f}%"
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Time the app's GitHub, LLM and sandbox code paths end to end against local stand-in servers."
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run (default: all).")
+    parser.add_argument("--runs", type=int, default=5, help="Measured iterations per scenario.")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured iterations run before each scenario.")
+    parser.add_argument("--files", type=int, default=5000, help="Number of files in the benchmark repository.")
+    parser.add_argument("--file-size", type=int, default=2048, help="Mean file size in bytes.")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Latency added to every GitHub response.")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="LLM time to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="LLM output rate.")
+    parser.add_argument("--generate-lines", type=int, default=2000, help="Lines of the file sent for generation.")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON lines file the results are appended to.")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the results file.")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    params = {
+        "files": args.files,
+        "file_size": args.file_size,
+        "latency_ms": args.latency_ms,
+        "ttft_ms": args.ttft_ms,
+        "tokens_per_second": args.tokens_per_second,
+        "generate_lines": args.generate_lines,
+        "runs": args.runs,
+    }
+
+    github = FakeGitHub([generate_repo(REPO_NAME, args.files, args.file_size)], latency_ms=args.latency_ms).start()
+    llm = FakeLLM(ttft_ms=args.ttft_ms, tokens_per_second=args.tokens_per_second).start()
+    # Set unconditionally, so a benchmark never reaches the real services with real keys.
+    os.environ.update({
+        "GITHUB_API_URL": github.url,
+        "HUBGIT_TOKEN": "bench-github-token",
+        "ANTHROPIC_BASE_URL": llm.url,
+        "ANTHROPIC_API_KEY": "bench-anthropic-key",
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+        "OPENAI_API_KEY": "bench-openai-key",
+        "LLM_CACHE_DIR": "",
+    })
+
+    from rate_governor import INTERACTIVE, request_scope
+    scenarios = build_scenarios(args, github)
+    results = {}
+    try:
+        for name in names:
+            print(f"Running {name}...", file=sys.stderr)
+            with request_scope("bench", INTERACTIVE):
+                results[name] = measure(scenarios[name]["run"], args.runs, args.warmup, scenarios[name].get("setup"))
+    finally:
+        github.stop()
+        llm.stop()
+
+    previous = previous_result(args.results, params)
+    print(f"\n{'Scenario':<30} {'Median':>10} {'p95':>10} {'Runs':>5} {'vs last':>9}")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<30} {'error':>10} {'':>10} {result['runs']:>5}   {result['error']}")
+            continue
+        delta = format_delta(result, (previous or {}).get("scenarios", {}).get(name))
+        print(f"{name:<30} {result['median_ms']:>8.1f}ms {result['p95_ms']:>8.1f}ms {result['runs']:>5} {delta:>9}")
+        for extra in ("first_token", "exec", "slowest_query"):
+            if extra in result:
+                print(f"  {extra:<28} {result[extra]['median_ms']:>8.1f}ms {result[extra]['p95_ms']:>8.1f}ms")
+    if previous:
+        print(f"\nCompared with {previous['revision']} from {previous['timestamp']}.")
+    print(f"GitHub requests: {github.requests}, LLM requests: {llm.requests}")
+
+    if not args.no_save:
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "params": params,
+            "scenarios": results,
+        }
+        with open(args.results, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    return 1 if any("error" in result for result in results.values()) else 0
+
+# The sandbox forkserver imports __main__, which must not start a benchmark.
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# blob_cache.py
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+class BlobCache:
+    """
+    Size-bounded LRU of file data keyed by git blob SHA, shared by every session
+    in the process. Blobs are immutable, so entries never need revalidation.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __contains__(self, sha: str) -> bool:
+        with self._lock:
+            return sha in self._entries
+
+    def get(self, sha: str) -> Optional[bytes]:
+        """
+        Looks a blob up.
+
+        Args:
+            sha (str): Blob SHA.
+
+        Returns:
+            Optional[bytes]: Blob data, or None on a miss.
+        """
+        with self._lock:
+            data = self._entries.get(sha)
+            if data is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(sha)
+            self._stats["hits"] += 1
+            return data
+
+    def put(self, sha: str, data: bytes) -> None:
+        """
+        Stores a blob, evicting the least recently used ones beyond the size bound.
+
+        Args:
+            sha (str): Blob SHA.
+            data (bytes): Complete blob data.
+        """
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(sha, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[sha] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """
+        Drops every cached blob (counters are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns hit/miss/eviction counters and the current size.
+        """
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._size)
+
+blob_cache = BlobCache(max_bytes=int(os.environ.get("BLOB_CACHE_MB", "128")) * 1024 * 1024)
@@ -0,0 +1,199 @@
+# clients.py
+
+import hashlib
+import importlib.util
+import logging
+import threading
+from os import environ
+from typing import Any, Dict, Tuple
+from github import Github
+from rate_governor import GovernedRetry, GovernedToken, governor
+
+# One client per credential for the whole process. Every client keeps its own
+# keep-alive connection pool, so repeated calls skip TCP/TLS setup.
+_clients: Dict[tuple, Any] = {}
+# Login, name and commit email of the user behind each credential.
+_users: Dict[str, Tuple[str, str, str]] = {}
+_lock = threading.Lock()
+
+GITHUB_POOL_SIZE = int(environ.get("GITHUB_POOL_SIZE", "16"))
+LLM_MAX_CONNECTIONS = int(environ.get("LLM_MAX_CONNECTIONS", "20"))
+
+def _fingerprint(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+def _get_or_create(kind: str, secret: str, factory):
+    key = (kind, _fingerprint(secret))
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+            logging.info(f"Created pooled {kind} client.")
+        return client
+
+def get_github_client(token: str) -> Github:
+    """
+    Returns the shared GitHub client for a token.
+
+    Args:
+        token (str): GitHub token.
+
+    Returns:
+        Github: Client with a pooled keep-alive session, whose requests go through
+        the rate governor.
+    """
+    base_url = environ.get("GITHUB_API_URL", "https://api.github.com")
+
+    def create():
+        credential = _fingerprint(token)
+        auth = GovernedToken(token, credential)
+        g = Github(
+            auth=auth,
+            base_url=base_url,
+            pool_size=GITHUB_POOL_SIZE,
+            retry=GovernedRetry(credential, total=3, backoff_factor=1),
+        )
+        # Lets the governor read the X-RateLimit-* headers PyGithub keeps per client.
+        auth.requester = g.requester
+        return g
+    return _get_or_create("github", token, create)
+
+def credential_of(g: Github) -> str:
+    """
+    Returns the fingerprint the rate governor tracks the client's credential under.
+
+    Args:
+        g (Github): GitHub client.
+
+    Returns:
+        str: Credential fingerprint.
+    """
+    return _fingerprint(getattr(getattr(g.requester, "auth", None), "token", "") or "")
+
+def github_rate_budget(g: Github) -> dict:
+    """
+    Returns the remaining GitHub quota of the client's credential and the calling
+    session's share of it; see `RateGovernor.snapshot`.
+
+    Args:
+        g (Github): GitHub client.
+
+    Returns:
+        dict: Quota snapshot.
+    """
+    return governor.snapshot(credential_of(g))
+
+def get_authenticated_login(g: Github) -> str:
+    """
+    Returns the login of the client's user, looked up once per credential.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+
+    Returns:
+        str: User login.
+
+    Raises:
+        GithubException: If the lookup fails (e.g. the token is invalid).
+    """
+    return _user_of(g)[0]
+
+def get_commit_identity(g: Github) -> Tuple[str, str]:
+    """
+    Returns the name and email commits made for the client's user are authored
+    with. Users without a public email get their GitHub noreply address, which
+    still attributes the commits to them.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+
+    Returns:
+        Tuple[str, str]: Author name and email.
+
+    Raises:
+        GithubException: If the lookup fails (e.g. the token is invalid).
+    """
+    return _user_of(g)[1:]
+
+def _user_of(g: Github) -> Tuple[str, str, str]:
+    fingerprint = credential_of(g)
+    user = _users.get(fingerprint)
+    if user is None:
+        # One /user request fills all attributes.
+        authenticated = g.get_user()
+        login = authenticated.login
+        user = (login, authenticated.name or login, authenticated.email or f"{authenticated.id}+{login}@users.noreply.github.com")
+        with _lock:
+            _users[fingerprint] = user
+    return user
+
+_raw_session = None
+
+def get_raw_session():
+    """
+    Returns the shared `requests` session used for streamed (raw media type)
+    GitHub downloads, which PyGithub's JSON requester cannot stream.
+
+    Returns:
+        requests.Session: Keep-alive session.
+    """
+    global _raw_session
+    with _lock:
+        if _raw_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _raw_session = requests.Session()
+            _raw_session.mount("https://", HTTPAdapter(pool_connections=GITHUB_POOL_SIZE, pool_maxsize=GITHUB_POOL_SIZE))
+        return _raw_session
+
+def _http_client(sdk):
+    """
+    Builds an SDK's default HTTP client with keep-alive pooling, using HTTP/2 when
+    the `h2` package is installed. The client comes from the SDK itself, so it is
+    built on whichever httpx distribution that SDK depends on.
+
+    Args:
+        sdk (module): `anthropic` or `openai`.
+    """
+    # Limits is not re-exported by the SDKs; take it from the package their client subclasses.
+    http = importlib.import_module(sdk.DefaultHttpxClient.__base__.__module__.partition(".")[0])
+    return sdk.DefaultHttpxClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=http.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=120,
+        ),
+        timeout=sdk.Timeout(600, connect=10),
+    )
+
+def get_anthropic_client(api_key: str):
+    """
+    Returns the shared Anthropic client for an API key.
+
+    Args:
+        api_key (str): Anthropic API key.
+
+    Returns:
+        anthropic.Anthropic: Pooled client.
+    """
+    def create():
+        import anthropic
+        return anthropic.Anthropic(api_key=api_key, http_client=_http_client(anthropic))
+    return _get_or_create("anthropic", api_key, create)
+
+def get_openai_client(api_key: str):
+    """
+    Returns the shared OpenAI client for an API key.
+
+    Args:
+        api_key (str): OpenAI API key.
+
+    Returns:
+        openai.OpenAI: Pooled client.
+    """
+    def create():
+        import openai
+        return openai.OpenAI(api_key=api_key, http_client=_http_client(openai))
+    return _get_or_create("openai", api_key, create)
@@ -0,0 +1,411 @@
+# code_search.py
+
+import logging
+import re
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from os import environ
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from github import Github
+from clients import get_authenticated_login
+from github_ops import fetch_files, list_tree
+from metrics import annotate_current_span, timed
+
+# Files larger than this, and beyond this many per repository, are not indexed.
+SEARCH_MAX_FILE_BYTES = int(float(environ.get("SEARCH_MAX_FILE_KB", "512")) * 1024)
+SEARCH_MAX_FILES_PER_REPO = int(environ.get("SEARCH_MAX_FILES_PER_REPO", "20000"))
+# Total file text the index holds, shared by every session in the process.
+SEARCH_INDEX_BYTES = int(float(environ.get("SEARCH_INDEX_MB", "256")) * 1024 * 1024)
+# A repository's tree is looked up again at most this often.
+SEARCH_REFRESH_SECONDS = float(environ.get("SEARCH_REFRESH_SECONDS", "60"))
+# Blobs fetched per batch while indexing, so progress can be shown in between.
+_FETCH_BATCH = 64
+# Matching lines returned per file and per query.
+MAX_MATCHES_PER_FILE = 5
+MAX_SEARCH_RESULTS = 200
+# Matching lines are cut to this many characters for display.
+_MAX_LINE_CHARS = 200
+
+def _trigrams(text: str) -> Set[str]:
+    """
+    Returns the distinct lowercase trigrams of a text.
+    """
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    Extracts runs of literal characters every match of a regular expression must
+    contain. Only the top level of the pattern is read, so the result is a
+    (possibly empty) subset of what is required, never more.
+
+    Args:
+        pattern (str): Regular expression.
+
+    Returns:
+        List[str]: Literal runs; empty if no characters are known to be required,
+        e.g. for a top-level alternation.
+    """
+    if re.search(r"\(\?[a-zA-Z]*x", pattern):
+        # Verbose patterns: whitespace and comments are not literal.
+        return []
+    runs, run, depth, i = [], "", 0, 0
+
+    def flush():
+        nonlocal run
+        if run:
+            runs.append(run)
+        run = ""
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            i += 2
+            if depth == 0 and not escaped.isalnum():
+                run += escaped
+            else:
+                # Character classes (\d, \w, ...), anchors and back-references.
+                flush()
+            continue
+        if char == "[":
+            # Skip the character class, including a leading "]" or "^]".
+            end = i + 1
+            if end < len(pattern) and pattern[end] == "^":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            while end < len(pattern) and pattern[end] != "]":
+                end += 2 if pattern[end] == "\\" else 1
+            i = end + 1
+            flush()
+            continue
+        if char == "(":
+            depth += 1
+            flush()
+        elif char == ")":
+            depth = max(0, depth - 1)
+            flush()
+        elif char == "|":
+            if depth == 0:
+                return []
+        elif char in "*?{":
+            # The preceding character is optional (or repeated a variable number of times).
+            run = run[:-1]
+            flush()
+            quantifier = re.match(r"\{\d*(,\d*)?\}", pattern[i:]) if char == "{" else None
+            if quantifier:
+                i += quantifier.end() - 1
+        elif char == "+":
+            flush()
+        elif char in ".^$":
+            flush()
+        elif depth == 0:
+            run += char
+        i += 1
+    flush()
+    return runs
+
+@dataclass
+class SearchHit:
+    """
+    One matching line.
+
+    Attributes:
+        repo (str): Repository name.
+        path (str): File path.
+        line (int): Line number, starting at 1.
+        text (str): The line, cut to a display length.
+    """
+    repo: str
+    path: str
+    line: int
+    text: str
+
+class ContentIndex:
+    """
+    Trigram index of file contents, keyed by blob SHA and shared by every session
+    in the process. Blobs are immutable, so a blob is indexed once however many
+    repositories, branches or commits contain it, and a refresh only indexes the
+    blobs that are new. Each repository maps its paths to blob SHAs.
+    """
+
+    def __init__(self, max_bytes: int = SEARCH_INDEX_BYTES):
+        self.max_bytes = max_bytes
+        # Document ids grow monotonically, so posting lists stay sorted.
+        self._texts: List[Optional[str]] = []
+        self._shas: List[Optional[str]] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        # Blobs seen but not indexed (binary or too large), so they are not fetched again.
+        self._skipped: Set[str] = set()
+        self._repos: Dict[str, Dict[str, str]] = {}
+        self._refreshed: Dict[str, float] = {}
+        self._locations: Optional[Dict[str, List[Tuple[str, str]]]] = None
+        self._size = 0
+        self._dropped = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, sha: str) -> bool:
+        with self._lock:
+            return sha in self._doc_ids or sha in self._skipped
+
+    def add(self, sha: str, text: Optional[str]) -> bool:
+        """
+        Indexes a blob, unless it is already indexed or the index is full.
+
+        Args:
+            sha (str): Blob SHA.
+            text (Optional[str]): Blob text, or None for a blob that is not indexed.
+
+        Returns:
+            bool: Whether the blob is indexed (or deliberately skipped) afterwards.
+        """
+        if text is None:
+            with self._lock:
+                self._skipped.add(sha)
+            return True
+        grams = _trigrams(text)
+        with self._lock:
+            if sha in self._doc_ids:
+                return True
+            if self._size + len(text) > self.max_bytes:
+                self._drop_unreferenced()
+                if self._size + len(text) > self.max_bytes:
+                    return False
+            doc = len(self._texts)
+            self._texts.append(text)
+            self._shas.append(sha)
+            self._doc_ids[sha] = doc
+            self._size += len(text)
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    self._postings[gram] = postings = array("I")
+                postings.append(doc)
+            return True
+
+    def set_repo(self, repo: str, files: Dict[str, str]) -> None:
+        """
+        Records which blob each path of a repository points at.
+
+        Args:
+            repo (str): Repository name.
+            files (Dict[str, str]): Blob SHA per path.
+        """
+        with self._lock:
+            self._repos[repo] = files
+            self._refreshed[repo] = time.monotonic()
+            self._locations = None
+
+    def is_fresh(self, repo: str) -> bool:
+        """
+        Tells whether a repository was refreshed within SEARCH_REFRESH_SECONDS.
+        """
+        with self._lock:
+            return time.monotonic() - self._refreshed.get(repo, float("-inf")) < SEARCH_REFRESH_SECONDS
+
+    def _drop_unreferenced(self) -> None:
+        """
+        Drops the text of blobs no repository points at any more; their posting
+        entries are skipped at query time until the postings are rebuilt.
+        """
+        referenced = {sha for files in self._repos.values() for sha in files.values()}
+        for sha in [sha for sha in self._doc_ids if sha not in referenced]:
+            doc = self._doc_ids.pop(sha)
+            self._size -= len(self._texts[doc])
+            self._texts[doc] = None
+            self._shas[doc] = None
+            self._dropped += 1
+        if self._dropped > len(self._doc_ids):
+            self._compact()
+
+    def _compact(self) -> None:
+        """
+        Renumbers the remaining documents and rebuilds the postings without the
+        dropped ones.
+        """
+        texts, shas, doc_ids, postings = [], [], {}, {}
+        for sha, doc in sorted(self._doc_ids.items(), key=lambda item: item[1]):
+            doc_ids[sha] = len(texts)
+            texts.append(self._texts[doc])
+            shas.append(sha)
+        for doc, text in enumerate(texts):
+            for gram in _trigrams(text):
+                postings.setdefault(gram, array("I")).append(doc)
+        self._texts, self._shas, self._doc_ids, self._postings, self._dropped = texts, shas, doc_ids, postings, 0
+        logging.info(f"Compacted the code search index to {len(texts)} blobs.")
+
+    def _candidates(self, literals: List[str]) -> Optional[Set[int]]:
+        """
+        Returns the documents containing every trigram of the literals, or None
+        if the literals give no trigram to filter on.
+        """
+        grams = set()
+        for literal in literals:
+            grams |= _trigrams(literal)
+        if not grams:
+            return None
+        postings = sorted((self._postings.get(gram, array("I")) for gram in grams), key=len)
+        found = set(postings[0])
+        for other in postings[1:]:
+            if not found:
+                break
+            found.intersection_update(other)
+        return found
+
+    @timed("code_search.search")
+    def search(
+        self,
+        query: str,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        repos: Optional[Iterable[str]] = None,
+        limit: int = MAX_SEARCH_RESULTS,
+    ) -> Tuple[List[SearchHit], bool]:
+        """
+        Finds the lines matching a query in the indexed repositories.
+
+        Args:
+            query (str): Substring, or regular expression if `regex`.
+            regex (bool): Whether the query is a regular expression.
+            case_sensitive (bool): Whether letter case must match.
+            repos (Optional[Iterable[str]]): Repositories to search, default all indexed.
+            limit (int): Maximum number of matching lines.
+
+        Returns:
+            Tuple[List[SearchHit], bool]: Matching lines, by repository and path, and
+            whether the results were cut off at `limit`.
+
+        Raises:
+            re.error: If `regex` and the query is not a valid regular expression.
+        """
+        pattern = re.compile(query if regex else re.escape(query), 0 if case_sensitive else re.IGNORECASE)
+        literals = required_literals(query) if regex else [query]
+        with self._lock:
+            if self._locations is None:
+                self._locations = {}
+                for repo, files in self._repos.items():
+                    for path, sha in files.items():
+                        self._locations.setdefault(sha, []).append((repo, path))
+            locations = self._locations
+            candidates = self._candidates(literals)
+            docs = self._doc_ids.values() if candidates is None else candidates
+            texts = {self._shas[doc]: self._texts[doc] for doc in docs if self._texts[doc] is not None}
+            wanted = set(self._repos if repos is None else repos)
+        annotate_current_span(candidates=len(texts))
+
+        files = sorted(
+            (repo, path, sha) for sha in texts for repo, path in locations.get(sha, ()) if repo in wanted
+        )
+        needle = query if case_sensitive else query.lower()
+
+        def match_starts(text: str) -> Iterator[int]:
+            if not regex:
+                # Plain str.find on a lowercased copy is much faster than a
+                # case-insensitive regex, as long as lowercasing keeps offsets.
+                haystack = text if case_sensitive else text.lower()
+                if len(haystack) == len(text):
+                    position = haystack.find(needle)
+                    while position >= 0:
+                        yield position
+                        position = haystack.find(needle, position + 1)
+                    return
+            for match in pattern.finditer(text):
+                yield match.start()
+
+        hits: List[SearchHit] = []
+        for repo, path, sha in files:
+            text = texts[sha]
+            line, position, found = 1, 0, 0
+            for start in match_starts(text):
+                if found >= MAX_MATCHES_PER_FILE:
+                    break
+                if len(hits) >= limit:
+                    return hits, True
+                matched_line = line + text.count("\n", position, start)
+                if found and matched_line == line:
+                    continue
+                line, position = matched_line, start
+                start = text.rfind("\n", 0, position) + 1
+                end = text.find("\n", position)
+                hits.append(SearchHit(repo, path, line, text[start:end if end >= 0 else len(text)].strip()[:_MAX_LINE_CHARS]))
+                found += 1
+        return hits, False
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of indexed repositories, files and blobs and the text size.
+        """
+        with self._lock:
+            return {
+                "repos": len(self._repos),
+                "files": sum(len(files) for files in self._repos.values()),
+                "blobs": len(self._doc_ids),
+                "bytes": self._size,
+            }
+
+content_index = ContentIndex()
+
+def repo_key(g: Github, repo_name: str) -> str:
+    """
+    Returns the name a repository is indexed under: its full name, since the
+    index is shared by every user of the process.
+    """
+    return f"{get_authenticated_login(g)}/{repo_name}"
+
+@timed("code_search.refresh")
+def refresh_index(
+    g: Github,
+    repo_names: List[str],
+    progress: Optional[Callable[[str, int, int], None]] = None,
+    force: bool = False,
+) -> int:
+    """
+    Brings the content index up to date with the default branch of each
+    repository. Costs one (conditional) ref lookup per repository not refreshed
+    within SEARCH_REFRESH_SECONDS, plus downloads of blobs the index does not
+    have yet; blobs in the blob cache cost no request.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_names (List[str]): Repositories to index.
+        progress (Optional[Callable[[str, int, int], None]]): Called with the
+            repository, the blobs indexed so far and the blobs to index.
+        force (bool): Refresh repositories even if they were refreshed recently.
+
+    Returns:
+        int: Number of blobs newly indexed.
+    """
+    indexed = 0
+    for repo_name in repo_names:
+        key = repo_key(g, repo_name)
+        if not force and content_index.is_fresh(key):
+            continue
+        head_sha, entries = list_tree(g, repo_name)
+        if head_sha is None:
+            continue
+        files = dict(sorted(
+            (path, sha) for path, (sha, size) in entries.items() if size <= SEARCH_MAX_FILE_BYTES
+        )[:SEARCH_MAX_FILES_PER_REPO])
+        # Mapped first, so that making room for the new blobs keeps this repository's.
+        content_index.set_repo(key, files)
+        # One path per new blob: identical files are fetched and indexed once.
+        missing: Dict[str, str] = {}
+        for path, sha in files.items():
+            if sha not in content_index and sha not in missing:
+                missing[sha] = path
+        paths = list(missing.values())
+        for start in range(0, len(paths), _FETCH_BATCH):
+            batch = fetch_files(g, repo_name, paths[start:start + _FETCH_BATCH], max_bytes=SEARCH_MAX_FILE_BYTES)
+            for file in batch.values():
+                # Binary and cut-off files are remembered as skipped; failed reads are retried next time.
+                if not content_index.add(file.sha, None if file.binary or file.truncated else file.text):
+                    logging.warning(f"Code search index is full ({SEARCH_INDEX_BYTES} bytes), '{repo_name}' is partly indexed.")
+                    break
+                indexed += 1
+            if progress:
+                progress(repo_name, min(start + _FETCH_BATCH, len(paths)), len(paths))
+    annotate_current_span(blobs=indexed)
+    return indexed
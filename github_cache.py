@@ -0,0 +1,149 @@
+# github_cache.py
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from github import Github
+from clients import credential_of
+from metrics import span
+
+class ConditionalCache:
+    """
+    Bounded LRU store of GitHub GET responses together with their validators
+    (ETag / Last-Modified), shared by every session in the process.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hits": 0, "misses": 0, "revalidations": 0}
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple, headers: Dict[str, str], data: Any) -> None:
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._entries[key] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "headers": headers,
+                "data": data,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+_cache = ConditionalCache()
+
+def conditional_get(g: Github, url: str, parameters: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, str], Any]:
+    """
+    Performs a GET against the GitHub REST API, revalidating any cached copy with
+    If-None-Match / If-Modified-Since. A 304 answer is served from the cache and
+    does not count against the rate limit.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        url (str): API path (e.g. "/user/repos") or absolute URL.
+        parameters (Optional[Dict[str, Any]]): Query parameters.
+
+    Returns:
+        Tuple[Dict[str, str], Any]: Response headers and decoded JSON payload.
+
+    Raises:
+        GithubException: If the request fails.
+    """
+    # Keyed by credential, so cached payloads are never shared between tokens.
+    key = (credential_of(g), url, tuple(sorted((parameters or {}).items())))
+    entry = _cache.get(key)
+    request_headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            request_headers["If-None-Match"] = entry["etag"]
+        elif entry["last_modified"]:
+            request_headers["If-Modified-Since"] = entry["last_modified"]
+        _cache.count("revalidations")
+    _cache.count("requests")
+
+    with span("github.conditional_get") as request_span:
+        headers, data = g.requester.requestJsonAndCheck("GET", url, parameters=parameters, headers=request_headers)
+        # PyGithub hands back an empty payload for 304 Not Modified.
+        request_span.set(cache_hit=entry is not None and data is None, bytes_in=int(headers.get("content-length") or 0))
+
+    if entry is not None and data is None:
+        _cache.count("hits")
+        logging.debug(f"GitHub cache hit (304) for {url}")
+        return entry["headers"], entry["data"]
+
+    _cache.count("misses")
+    _cache.put(key, headers, data)
+    return headers, data
+
+def _next_page_url(headers: Dict[str, str]) -> Optional[str]:
+    """
+    Extracts the rel="next" URL from a GitHub Link header, if any.
+    """
+    for link in headers.get("link", "").split(","):
+        parts = link.split(";")
+        if len(parts) > 1 and 'rel="next"' in parts[1]:
+            return parts[0].strip()[1:-1]
+    return None
+
+def conditional_get_all(g: Github, url: str, parameters: Optional[Dict[str, Any]] = None) -> list:
+    """
+    Follows GitHub pagination, revalidating each page through `conditional_get`.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        url (str): API path of the first page.
+        parameters (Optional[Dict[str, Any]]): Query parameters for the first page.
+
+    Returns:
+        list: Concatenated items of every page.
+    """
+    items = []
+    next_url, next_parameters = url, dict(parameters or {}, per_page=100)
+    while next_url:
+        headers, data = conditional_get(g, next_url, next_parameters)
+        items.extend(data or [])
+        # The next-page URL already carries the query string.
+        next_url, next_parameters = _next_page_url(headers), None
+    return items
+
+def cache_stats() -> Dict[str, int]:
+    """
+    Returns the process-wide hit/miss/revalidation counters of the GitHub cache.
+
+    Returns:
+        Dict[str, int]: Counter values and the current number of cached entries.
+    """
+    return _cache.stats()
+
+def clear_cache() -> None:
+    """
+    Drops every cached GitHub response (counters are kept).
+    """
+    _cache.clear()
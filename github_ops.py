@@ -1,11 +1,34 @@
 # github_ops.py
 
-from github import Github, GithubException
+from github import Github, GithubException, InputGitTreeElement
+from github.Repository import Repository
 import streamlit as st
 import base64
 import logging
-from typing import List, Optional
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from os import environ
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import quote
+from github_cache import conditional_get, conditional_get_all
+from clients import credential_of, get_authenticated_login, get_commit_identity, get_raw_session
+from blob_cache import blob_cache
+from merge_utils import git_blob_sha, has_conflict_markers, merge3
+from metrics import annotate_current_span, fail_current_span, record_cache, timed
+from rate_governor import BACKGROUND, bind, governor, observe_headers
+from working_copy import WorkingCopy, WorkingCopyConflict, WorkingCopyError, get_working_copy
 
+# Files are read up to this many bytes; larger ones are cut off.
+MAX_FILE_BYTES = int(float(environ.get("GITHUB_MAX_FILE_MB", "20")) * 1024 * 1024)
+# Text files above this size open in the read-only viewer instead of the editor.
+EDITOR_MAX_BYTES = int(float(environ.get("EDITOR_MAX_KB", "512")) * 1024)
+# "working_copy" serves listings, reads and writes from a local partial clone of
+# the repository (see working_copy.py) instead of REST calls.
+GITHUB_BACKEND = environ.get("GITHUB_BACKEND", "api")
+
+@timed("github.get_repo")
 def get_repo(g: Github, repo_name: str):
     """
     Retrieves a repository object by name.
@@ -18,8 +41,10 @@ def get_repo(g: Github, repo_name: str):
         Repository object if found, else None.
     """
     try:
-        return g.get_user().get_repo(repo_name)
+        headers, data = conditional_get(g, f"/repos/{get_authenticated_login(g)}/{repo_name}")
+        return g.create_from_raw_data(Repository, data, headers)
     except GithubException as e:
+        fail_current_span(e)
         st.error(
             f"Error accessing repository '{repo_name}': {e.data.get('message', str(e))}",
             icon=':material/sentiment_dissatisfied:'
@@ -27,6 +52,20 @@ def get_repo(g: Github, repo_name: str):
         logging.error(f"GitHub Exception while accessing repo '{repo_name}': {e}")
     return None
 
+def _working_copy(g: Github, repo_name: str) -> Optional[WorkingCopy]:
+    """
+    Returns the synced local clone of a repository if the working-copy backend
+    is enabled, else None.
+    """
+    if GITHUB_BACKEND != "working_copy":
+        return None
+    repo = get_repo(g, repo_name)
+    if repo is None:
+        return None
+    copy = get_working_copy(repo.clone_url, repo.default_branch, getattr(g.requester.auth, "token", None))
+    copy.sync()
+    return copy
+
 def encode_content(content: str) -> str:
     """
     Encodes content to base64.
@@ -51,6 +90,7 @@ def decode_content(encoded_content: str) -> str:
     """
     return base64.b64decode(encoded_content).decode()
 
+@timed("github.list_repos")
 def list_repos(g: Github) -> List[str]:
     """
     Fetches and returns a list of repository names for the authenticated user.
@@ -62,14 +102,122 @@ def list_repos(g: Github) -> List[str]:
         List[str]: List of repository names.
     """
     try:
-        user = g.get_user()
-        repos = user.get_repos()
-        return [""] + [repo.name for repo in repos]
+        repos = conditional_get_all(g, "/user/repos")
+        return [""] + [repo["name"] for repo in repos]
     except GithubException as e:
+        fail_current_span(e)
         logging.error(f"Error listing repositories: {e}")
         st.error(f"Error listing repositories: {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
         return []
 
+@timed("github.get_branch_head")
+def get_branch_head(g: Github, repo, branch: Optional[str] = None) -> str:
+    """
+    Resolves the commit SHA at the head of a branch with a single (conditional)
+    ref lookup.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo: Repository object.
+        branch (Optional[str]): Branch name, defaults to the repository's default branch.
+
+    Returns:
+        str: Commit SHA the branch currently points at.
+    """
+    _, ref = conditional_get(g, f"/repos/{repo.full_name}/git/ref/heads/{quote(branch or repo.default_branch)}")
+    return ref["object"]["sha"]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _fetch_tree_entries(_repo, repo_full_name: str, head_sha: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Fetches every file reachable from a commit with one recursive tree request.
+
+    The cache key is the repository name plus the head commit SHA, so entries stay
+    valid until the branch moves; `_repo` is excluded from hashing.
+
+    Args:
+        _repo: Repository object.
+        repo_full_name (str): Full name of the repository (owner/name).
+        head_sha (str): Commit SHA to list.
+
+    Returns:
+        Dict[str, Tuple[str, int]]: Blob SHA and size per file path.
+    """
+    tree = _repo.get_git_tree(head_sha, recursive=True)
+    if not tree.raw_data.get("truncated"):
+        return {element.path: (element.sha, element.size or 0) for element in tree.tree if element.type == "blob"}
+
+    # GitHub caps recursive trees (100k entries / 7 MB); walk the rest level by level.
+    logging.warning(f"Recursive tree for '{repo_full_name}' is truncated, walking subtrees.")
+    files = {}
+    pending = [("", head_sha)]
+    while pending:
+        prefix, sha = pending.pop(0)
+        for element in _repo.get_git_tree(sha).tree:
+            path = f"{prefix}{element.path}"
+            if element.type == "tree":
+                pending.append((f"{path}/", element.sha))
+            elif element.type == "blob":
+                files[path] = (element.sha, element.size or 0)
+    return files
+
+def _tree_entries(g: Github, repo) -> Dict[str, Tuple[str, int]]:
+    """
+    Returns the cached tree of the repository's default branch, after one
+    (conditional) ref lookup.
+    """
+    return _fetch_tree_entries(repo, repo.full_name, get_branch_head(g, repo))
+
+@timed("github.list_tree")
+def list_tree(g: Github, repo_name: str) -> Tuple[Optional[str], Dict[str, Tuple[str, int]]]:
+    """
+    Lists all files in the specified repository together with the commit they
+    were listed at, so callers can key derived data (such as search indexes) on it.
+
+    Costs one ref lookup per call; the recursive tree itself is fetched once per
+    branch head commit.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+
+    Returns:
+        Tuple[Optional[str], Dict[str, Tuple[str, int]]]: Head commit SHA of the
+        default branch (None on failure) and the blob SHA and size per file path.
+    """
+    if not repo_name:
+        return None, {}
+    try:
+        copy = _working_copy(g, repo_name)
+        if copy is not None:
+            return copy.head(), copy.list_entries()
+    except WorkingCopyError as e:
+        logging.error(f"Working copy of '{repo_name}' failed, listing through the API: {e}")
+    repo = get_repo(g, repo_name)
+    if not repo:
+        return None, {}
+    try:
+        head_sha = get_branch_head(g, repo)
+        return head_sha, _fetch_tree_entries(repo, repo.full_name, head_sha)
+    except GithubException as e:
+        fail_current_span(e)
+        logging.error(f"Error listing files in repo '{repo_name}': {e}")
+        st.error(f"Error listing files in repository '{repo_name}': {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
+        return None, {}
+
+def list_file_entries(g: Github, repo_name: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Lists all files in the specified repository with their blob SHAs and sizes.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+
+    Returns:
+        Dict[str, Tuple[str, int]]: Blob SHA and size per file path.
+    """
+    return list_tree(g, repo_name)[1]
+
 def list_files(g: Github, repo_name: str) -> List[str]:
     """
     Lists all files in the specified repository.
@@ -81,25 +229,326 @@ def list_files(g: Github, repo_name: str) -> List[str]:
     Returns:
         List[str]: List of file paths.
     """
-    if not repo_name:
-        return []
+    return list(list_file_entries(g, repo_name))
+
+def is_binary(data: bytes) -> bool:
+    """
+    Guesses whether file data is binary, using git's heuristic (a NUL byte in the
+    first 8000 bytes) plus a UTF-8 check of the same sample.
+
+    Args:
+        data (bytes): File data, or its beginning.
+
+    Returns:
+        bool: True if the data should not be treated as text.
+    """
+    sample = data[:8000]
+    if b"\0" in sample:
+        return True
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the sample is still text.
+        return e.start < len(sample) - 3
+    return False
+
+@dataclass
+class FileData:
+    """
+    A file read from a repository.
+
+    Attributes:
+        path (str): Path in the repository.
+        sha (str): Blob SHA.
+        size (int): Full size in bytes.
+        data (bytes): File data, cut off at the byte cap if `truncated`.
+        truncated (bool): Whether `data` stops short of `size`.
+        binary (bool): Whether the file looks binary.
+    """
+    path: str
+    sha: str
+    size: int
+    data: bytes
+    truncated: bool
+    binary: bool
+
+    @property
+    def text(self) -> Optional[str]:
+        """
+        The data decoded as UTF-8, or None for binary files.
+        """
+        if self.binary:
+            return None
+        # A truncated read can end inside a multi-byte character.
+        return self.data.decode("utf-8", errors="replace" if self.truncated else "strict")
+
+def _stream_blob(g: Github, repo_full_name: str, sha: str, max_bytes: int) -> Tuple[bytes, bool]:
+    """
+    Streams a blob with the raw media type, stopping after `max_bytes`.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_full_name (str): Full name of the repository (owner/name).
+        sha (str): Blob SHA.
+        max_bytes (int): Byte cap.
+
+    Returns:
+        Tuple[bytes, bool]: Data read and whether it was cut off at the cap.
+    """
+    token = getattr(g.requester.auth, "token", "") or ""
+    url = f"{g.requester.base_url}/repos/{repo_full_name}/git/blobs/{sha}"
+    headers = {"Accept": "application/vnd.github.raw+json"}
+    if token:
+        headers["Authorization"] = f"token {token}"
+    credential = credential_of(g)
+    governor.admit(credential)
+    chunks, received = [], 0
+    with get_raw_session().get(url, headers=headers, stream=True, timeout=(10, 120)) as response:
+        observe_headers(credential, response.status_code, response.headers)
+        if response.status_code in (403, 429) and "Retry-After" in response.headers:
+            governor.back_off(credential, float(response.headers["Retry-After"]))
+        if response.status_code != 200:
+            raise GithubException(response.status_code, {"message": response.text[:200]}, dict(response.headers))
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            received += len(chunk)
+            if received > max_bytes:
+                break
+    return b"".join(chunks)[:max_bytes], received > max_bytes
+
+def _download_blob(g: Github, repo_full_name: str, sha: str, max_bytes: int) -> Tuple[bytes, bool]:
+    """
+    Returns blob data from the blob cache or streams it, caching complete reads.
+    Runs in worker threads, so no Streamlit calls.
+    """
+    data = blob_cache.get(sha)
+    record_cache("github.blob_cache", data is not None)
+    if data is not None:
+        return data[:max_bytes], len(data) > max_bytes
+    data, truncated = _stream_blob(g, repo_full_name, sha, max_bytes)
+    if not truncated:
+        blob_cache.put(sha, data)
+    return data, truncated
+
+@timed("github.fetch_files")
+def fetch_files(
+    g: Github,
+    repo_name: str,
+    paths: List[str],
+    max_bytes: int = MAX_FILE_BYTES,
+    max_workers: int = 8,
+) -> Dict[str, FileData]:
+    """
+    Reads several files of any size or type in parallel. Paths are resolved to
+    blob SHAs through the cached tree, blobs already in the blob cache cost no
+    request, and the rest are streamed from the blob endpoint up to `max_bytes`
+    each. Nothing is decoded to text here.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+        paths (List[str]): Paths of the files.
+        max_bytes (int): Byte cap per file.
+        max_workers (int): Maximum number of concurrent downloads.
+
+    Returns:
+        Dict[str, FileData]: The files that could be read, by path.
+    """
+    try:
+        copy = _working_copy(g, repo_name)
+        if copy is not None:
+            return _read_working_copy(copy, repo_name, paths, max_bytes)
+    except WorkingCopyError as e:
+        logging.error(f"Working copy of '{repo_name}' failed, reading through the API: {e}")
     repo = get_repo(g, repo_name)
     if not repo:
-        return []
+        return {}
     try:
-        contents = repo.get_contents("")
-        files = []
-        while contents:
-            file_content = contents.pop(0)
-            if file_content.type == "dir":
-                contents.extend(repo.get_contents(file_content.path))
-            else:
-                files.append(file_content.path)
-        return files
+        entries = _tree_entries(g, repo)
     except GithubException as e:
+        fail_current_span(e)
         logging.error(f"Error listing files in repo '{repo_name}': {e}")
         st.error(f"Error listing files in repository '{repo_name}': {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
-        return []
+        return {}
+
+    missing = [path for path in paths if path not in entries]
+    if missing:
+        st.error(f"Not found in '{repo_name}': {', '.join(missing)}", icon=':material/sentiment_dissatisfied:')
+    wanted = {path: entries[path] for path in paths if path in entries}
+    files = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(wanted)))) as pool:
+        futures = {
+            path: pool.submit(bind(_download_blob), g, repo.full_name, sha, max_bytes)
+            for path, (sha, _) in wanted.items()
+        }
+        for path, future in futures.items():
+            sha, size = wanted[path]
+            try:
+                data, truncated = future.result()
+            except Exception as e:
+                fail_current_span(e)
+                logging.error(f"Error fetching file '{path}' from repo '{repo_name}': {e}")
+                st.error(f"Error fetching file '{path}': {e}", icon=':material/sentiment_dissatisfied:')
+                continue
+            files[path] = FileData(path, sha, size, data, truncated or len(data) < size, is_binary(data))
+    annotate_current_span(bytes_in=sum(len(file.data) for file in files.values()))
+    return files
+
+def _read_working_copy(copy: WorkingCopy, repo_name: str, paths: List[str], max_bytes: int) -> Dict[str, FileData]:
+    """
+    The working-copy side of `fetch_files`: missing blobs are downloaded in one
+    batch, then read from the clone.
+    """
+    entries = copy.list_files()
+    missing = [path for path in paths if path not in entries]
+    if missing:
+        st.error(f"Not found in '{repo_name}': {', '.join(missing)}", icon=':material/sentiment_dissatisfied:')
+    wanted = [path for path in paths if path in entries]
+    copy.prefetch(wanted)
+    files = {}
+    for path in wanted:
+        data = copy.read_blob(entries[path])
+        files[path] = FileData(path, entries[path], len(data), data[:max_bytes], len(data) > max_bytes, is_binary(data[:max_bytes]))
+    annotate_current_span(bytes_in=sum(len(file.data) for file in files.values()))
+    return files
+
+def fetch_file(g: Github, repo_name: str, file_path: str, max_bytes: int = MAX_FILE_BYTES) -> Optional[FileData]:
+    """
+    Reads one file of any size or type; see `fetch_files`.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+        file_path (str): Path to the file.
+        max_bytes (int): Byte cap for the read.
+
+    Returns:
+        Optional[FileData]: The file if successful, else None.
+    """
+    return fetch_files(g, repo_name, [file_path], max_bytes=max_bytes).get(file_path)
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=int(environ.get("PREFETCH_WORKERS", "4")), thread_name_prefix="prefetch")
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+def _prefetch_blob(g: Github, repo_full_name: str, sha: str) -> None:
+    try:
+        _download_blob(g, repo_full_name, sha, EDITOR_MAX_BYTES)
+    except Exception as e:
+        logging.debug(f"Prefetch of blob {sha} in '{repo_full_name}' failed: {e}")
+    finally:
+        with _prefetch_lock:
+            _prefetching.discard(sha)
+
+def _prefetch_working_copy(copy: WorkingCopy, paths: List[str]) -> None:
+    try:
+        copy.prefetch(paths)
+    except WorkingCopyError as e:
+        logging.debug(f"Prefetch into {copy.directory} failed: {e}")
+
+def prefetch_files(g: Github, repo_name: str, entries: Dict[str, Tuple[str, int]], paths: List[str], limit: int = 16) -> int:
+    """
+    Downloads likely-next files into the blob cache in the background, so that
+    opening them later costs no request. Files too large for the editor, blobs
+    already cached and blobs already being fetched are skipped.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+        entries (Dict[str, Tuple[str, int]]): Output of `list_file_entries`.
+        paths (List[str]): Candidate paths, most likely first.
+        limit (int): Maximum number of downloads to schedule.
+
+    Returns:
+        int: Number of downloads scheduled.
+    """
+    try:
+        copy = _working_copy(g, repo_name)
+    except WorkingCopyError as e:
+        logging.debug(f"Working copy of '{repo_name}' failed, prefetching through the API: {e}")
+        copy = None
+    if copy is not None:
+        # The clone downloads all wanted blobs in one request.
+        wanted = [path for path in paths if entries.get(path, (None, 0))[1] <= EDITOR_MAX_BYTES][:limit]
+        if wanted:
+            _prefetch_executor.submit(bind(_prefetch_working_copy, priority=BACKGROUND), copy, wanted)
+        return len(wanted)
+    repo_full_name = f"{get_authenticated_login(g)}/{repo_name}"
+    scheduled = 0
+    for path in paths:
+        if scheduled >= limit:
+            break
+        sha, size = entries.get(path, (None, 0))
+        if sha is None or size > EDITOR_MAX_BYTES or sha in blob_cache:
+            continue
+        with _prefetch_lock:
+            if sha in _prefetching:
+                continue
+            _prefetching.add(sha)
+        _prefetch_executor.submit(bind(_prefetch_blob, priority=BACKGROUND), g, repo_full_name, sha)
+        scheduled += 1
+    return scheduled
+
+def prefetch_candidates(paths: List[str], current: Optional[str], recent: List[str], limit: int = 16) -> List[str]:
+    """
+    Orders the files a user is likely to open next: the current file, recently
+    opened files, then the current file's directory neighbours, nearest first.
+
+    Args:
+        paths (List[str]): All file paths of the repository.
+        current (Optional[str]): File currently selected or open.
+        recent (List[str]): Recently opened files, most recent first.
+        limit (int): Maximum number of candidates.
+
+    Returns:
+        List[str]: Candidate paths, most likely first.
+    """
+    candidates = ([current] if current else []) + list(recent)
+    if current:
+        directory = posixpath.dirname(current)
+        siblings = [path for path in paths if posixpath.dirname(path) == directory]
+        index = siblings.index(current) if current in siblings else 0
+        candidates += [path for _, path in sorted(enumerate(siblings), key=lambda item: abs(item[0] - index))]
+    return list(dict.fromkeys(candidates))[:limit]
+
+def warm_repo_list(g: Github) -> None:
+    """
+    Loads the repository list into the conditional GitHub cache in the background,
+    so the first file selector opens from a revalidated copy.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+    """
+    def warm():
+        try:
+            conditional_get_all(g, "/user/repos")
+        except Exception as e:
+            logging.debug(f"Warming the repository list failed: {e}")
+    _prefetch_executor.submit(bind(warm, priority=BACKGROUND))
+
+def get_file_with_sha(g: Github, repo_name: str, file_path: str) -> Optional[Tuple[str, str]]:
+    """
+    Retrieves the content of a text file together with its blob SHA.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+        file_path (str): Path to the file.
+
+    Returns:
+        Optional[Tuple[str, str]]: (content, blob SHA) if successful, else None
+        (also for binary files and files over the byte cap).
+    """
+    file = fetch_file(g, repo_name, file_path)
+    if file is None:
+        return None
+    if file.binary or file.truncated:
+        st.error(
+            f"'{file_path}' is {'binary' if file.binary else 'larger than the read limit'} and cannot be edited as text.",
+            icon=':material/sentiment_dissatisfied:'
+        )
+        return None
+    return file.text, file.sha
 
 def get_file_content(g: Github, repo_name: str, file_path: str) -> Optional[str]:
     """
@@ -113,48 +562,149 @@ def get_file_content(g: Github, repo_name: str, file_path: str) -> Optional[str]
     Returns:
         Optional[str]: Content of the file if successful, else None.
     """
-    repo = get_repo(g, repo_name)
-    if not repo:
-        return None
-    try:
-        content = repo.get_contents(file_path)
-        return decode_content(content.content)
-    except GithubException as e:
-        logging.error(f"Error fetching file '{file_path}' from repo '{repo_name}': {e}")
-        st.error(f"Error fetching file '{file_path}': {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
-    return None
+    loaded = get_file_with_sha(g, repo_name, file_path)
+    return loaded[0] if loaded else None
 
-def update_file(g: Github, repo_name: str, file_path: str, content: str, commit_message: str) -> bool:
+@dataclass
+class SaveResult:
+    """
+    Outcome of `save_file` and the editing session state that follows from it.
+
+    Attributes:
+        status (str): "unchanged", "saved", "merged", "conflict" or "error".
+        content (str): Editor content after the save (the marked-up merge on "conflict").
+        sha (str): Blob SHA of the new editing base.
+        base_content (str): Content of the new editing base.
     """
-    Updates an existing file in the repository.
+    status: str
+    content: str
+    sha: str
+    base_content: str
+
+@timed("github.save_file")
+def save_file(
+    g: Github,
+    repo_name: str,
+    file_path: str,
+    content: str,
+    commit_message: str,
+    base_sha: str,
+    base_content: str,
+) -> SaveResult:
+    """
+    Saves an edited file against the blob it was loaded from.
+
+    Nothing is committed when the content hashes to `base_sha`. The update is sent
+    with `base_sha`, so GitHub (or the working copy) rejects it if the file changed
+    upstream; in that case the upstream version is three-way merged with the edits.
+    A clean merge is committed, a conflicting one is returned with conflict markers
+    for the user to resolve.
 
     Args:
         g (Github): Authenticated GitHub client.
         repo_name (str): Name of the repository.
         file_path (str): Path to the file.
-        content (str): New content for the file.
+        content (str): Edited content.
         commit_message (str): Commit message.
+        base_sha (str): Blob SHA the edits started from; empty to start from upstream.
+        base_content (str): Content the edits started from.
 
     Returns:
-        bool: True if update was successful, else False.
+        SaveResult: Outcome and the new editing base.
     """
-    repo = get_repo(g, repo_name)
-    if not repo:
-        return False
+    if has_conflict_markers(content):
+        st.error("Resolve the conflict markers in the editor before saving.", icon=':material/sentiment_dissatisfied:')
+        return SaveResult("error", content, base_sha, base_content)
+    if not base_sha:
+        # No tracked base (e.g. a session from before SHA tracking): start from upstream.
+        current = get_file_with_sha(g, repo_name, file_path)
+        if current is None:
+            return SaveResult("error", content, base_sha, base_content)
+        base_content, base_sha = current
+    if git_blob_sha(content) == base_sha:
+        st.warning(f"No changes to '{file_path}', nothing to commit.", icon=':material/info:')
+        return SaveResult("unchanged", content, base_sha, base_content)
+    annotate_current_span(bytes_out=len(content.encode()))
     try:
-        contents = repo.get_contents(file_path)
-        repo.update_file(contents.path, commit_message, content, contents.sha)
-        st.success(f"File '{file_path}' updated successfully. This message will self-destruct in 5 seconds...", icon=':material/sentiment_satisfied:')
-        logging.info(f"File '{file_path}' in repo '{repo_name}' updated successfully.")
-        return True
+        copy = _working_copy(g, repo_name)
+        repo = None if copy is not None else get_repo(g, repo_name)
+        if copy is None and not repo:
+            return SaveResult("error", content, base_sha, base_content)
+
+        def update(text: str, sha: str) -> str:
+            # Returns the new blob SHA; the working copy commits locally and pushes later.
+            if copy is not None:
+                copy.commit({file_path: text}, commit_message, expected={file_path: sha}, author=get_commit_identity(g))
+                return git_blob_sha(text)
+            result = repo.update_file(file_path, commit_message, text, sha)
+            blob_cache.put(result["content"].sha, text.encode())
+            return result["content"].sha
+
+        try:
+            new_sha = update(content, base_sha)
+            st.success(f"File '{file_path}' updated successfully. This message will self-destruct in 5 seconds...", icon=':material/sentiment_satisfied:')
+            logging.info(f"File '{file_path}' in repo '{repo_name}' updated successfully.")
+            return SaveResult("saved", content, new_sha, content)
+        except WorkingCopyConflict:
+            logging.info(f"File '{file_path}' in repo '{repo_name}' changed upstream, merging.")
+        except GithubException as e:
+            if e.status != 409:
+                raise
+            logging.info(f"File '{file_path}' in repo '{repo_name}' changed upstream, merging.")
+
+        upstream = get_file_with_sha(g, repo_name, file_path)
+        if upstream is None:
+            return SaveResult("error", content, base_sha, base_content)
+        upstream_content, upstream_sha = upstream
+        if upstream_sha == git_blob_sha(content):
+            st.warning(f"'{file_path}' already matches the upstream version, nothing to commit.", icon=':material/info:')
+            return SaveResult("unchanged", content, upstream_sha, upstream_content)
+        merged, conflicts = merge3(base_content, content, upstream_content)
+        if conflicts:
+            st.warning(
+                f"'{file_path}' changed upstream and the edits overlap. Resolve the conflict markers in the editor and save again.",
+                icon=':material/info:'
+            )
+            logging.info(f"Merge conflict while saving '{file_path}' in repo '{repo_name}'.")
+            return SaveResult("conflict", merged, upstream_sha, upstream_content)
+        new_sha = update(merged, upstream_sha)
+        st.success(f"File '{file_path}' changed upstream; your edits were merged and saved.", icon=':material/sentiment_satisfied:')
+        logging.info(f"File '{file_path}' in repo '{repo_name}' merged with upstream and updated.")
+        return SaveResult("merged", merged, new_sha, merged)
+    except WorkingCopyError as e:
+        fail_current_span(e)
+        logging.error(f"Error committing '{file_path}' to the working copy of '{repo_name}': {e}")
+        st.error(f"Error updating file '{file_path}': {e}", icon=':material/sentiment_dissatisfied:')
     except GithubException as e:
+        fail_current_span(e)
         logging.error(f"GitHub Exception while updating file '{file_path}': {e}")
         st.error(f"Error updating file '{file_path}': {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
     except Exception as e:
+        fail_current_span(e)
         logging.exception(f"Unexpected error while updating file '{file_path}': {e}")
         st.error(f"Unexpected error: {str(e)}", icon=':material/sentiment_dissatisfied:')
-    return False
+    return SaveResult("error", content, base_sha, base_content)
+
+@timed("github.update_file")
+def update_file(g: Github, repo_name: str, file_path: str, content: str, commit_message: str) -> bool:
+    """
+    Updates an existing file in the repository, overwriting the current version.
+    Prefer `save_file` for editor sessions, which detects upstream changes.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+        file_path (str): Path to the file.
+        content (str): New content for the file.
+        commit_message (str): Commit message.
 
+    Returns:
+        bool: True if update was successful, else False.
+    """
+    result = save_file(g, repo_name, file_path, content, commit_message, "", "")
+    return result.status in ("saved", "merged", "unchanged")
+
+@timed("github.create_repo")
 def create_repo(g: Github, repo_name: str) -> None:
     """
     Creates a new repository under the authenticated user's account.
@@ -169,12 +719,15 @@ def create_repo(g: Github, repo_name: str) -> None:
         st.success(f"Repository '{repo_name}' created successfully.", icon=':material/sentiment_satisfied:')
         logging.info(f"Repository '{repo_name}' created successfully.")
     except GithubException as e:
+        fail_current_span(e)
         logging.error(f"GitHub Exception while creating repo '{repo_name}': {e}")
         st.error(f"Error creating repository: {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
     except Exception as e:
+        fail_current_span(e)
         logging.exception(f"Unexpected error while creating repo '{repo_name}': {e}")
         st.error(f"Unexpected error: {str(e)}", icon=':material/sentiment_dissatisfied:')
 
+@timed("github.delete_repo")
 def delete_repo(g: Github, repo_name: str) -> None:
     """
     Deletes an existing repository under the authenticated user's account.
@@ -191,12 +744,15 @@ def delete_repo(g: Github, repo_name: str) -> None:
         st.success(f"Repository '{repo_name}' deleted successfully.", icon=':material/sentiment_satisfied:')
         logging.info(f"Repository '{repo_name}' deleted successfully.")
     except GithubException as e:
+        fail_current_span(e)
         logging.error(f"GitHub Exception while deleting repo '{repo_name}': {e}")
         st.error(f"Error deleting repository: {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
     except Exception as e:
+        fail_current_span(e)
         logging.exception(f"Unexpected error while deleting repo '{repo_name}': {e}")
         st.error(f"Unexpected error: {str(e)}", icon=':material/sentiment_dissatisfied:')
 
+@timed("github.create_file")
 def create_file(g: Github, repo_name: str, file_path: str, content: str, commit_message: str) -> None:
     """
     Creates a new file in the specified repository.
@@ -208,20 +764,31 @@ def create_file(g: Github, repo_name: str, file_path: str, content: str, commit_
         content (str): Content of the file.
         commit_message (str): Commit message.
     """
-    repo = get_repo(g, repo_name)
-    if not repo:
-        return
     try:
-        repo.create_file(file_path, commit_message, content)
+        copy = _working_copy(g, repo_name)
+        if copy is not None:
+            copy.commit({file_path: content}, commit_message, expected={file_path: None}, author=get_commit_identity(g))
+        else:
+            repo = get_repo(g, repo_name)
+            if not repo:
+                return
+            repo.create_file(file_path, commit_message, content)
         st.success(f"File '{file_path}' created successfully in '{repo_name}'.", icon=':material/sentiment_satisfied:')
         logging.info(f"File '{file_path}' created in repo '{repo_name}'.")
+    except WorkingCopyError as e:
+        fail_current_span(e)
+        logging.error(f"Error creating file '{file_path}' in the working copy of '{repo_name}': {e}")
+        st.error(f"Error creating file: {e}", icon=':material/sentiment_dissatisfied:')
     except GithubException as e:
+        fail_current_span(e)
         logging.error(f"GitHub Exception while creating file '{file_path}' in repo '{repo_name}': {e}")
         st.error(f"Error creating file: {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
     except Exception as e:
+        fail_current_span(e)
         logging.exception(f"Unexpected error while creating file '{file_path}' in repo '{repo_name}': {e}")
         st.error(f"Unexpected error: {str(e)}", icon=':material/sentiment_dissatisfied:')
 
+@timed("github.delete_file")
 def delete_file(g: Github, repo_name: str, file_path: str, commit_message: str) -> None:
     """
     Deletes a file from the specified repository.
@@ -232,17 +799,142 @@ def delete_file(g: Github, repo_name: str, file_path: str, commit_message: str)
         file_path (str): Path to the file to delete.
         commit_message (str): Commit message.
     """
-    repo = get_repo(g, repo_name)
-    if not repo:
-        return
     try:
-        contents = repo.get_contents(file_path)
-        repo.delete_file(contents.path, commit_message, contents.sha)
+        copy = _working_copy(g, repo_name)
+        if copy is not None:
+            sha = copy.list_files().get(file_path)
+            if sha is None:
+                st.error(f"Not found in '{repo_name}': {file_path}", icon=':material/sentiment_dissatisfied:')
+                return
+            copy.commit({file_path: None}, commit_message, expected={file_path: sha}, author=get_commit_identity(g))
+        else:
+            repo = get_repo(g, repo_name)
+            if not repo:
+                return
+            contents = repo.get_contents(file_path)
+            repo.delete_file(contents.path, commit_message, contents.sha)
         st.success(f"File '{file_path}' deleted successfully from '{repo_name}'.", icon=':material/sentiment_satisfied:')
         logging.info(f"File '{file_path}' deleted from repo '{repo_name}'.")
+    except WorkingCopyError as e:
+        fail_current_span(e)
+        logging.error(f"Error deleting file '{file_path}' in the working copy of '{repo_name}': {e}")
+        st.error(f"Error deleting file: {e}", icon=':material/sentiment_dissatisfied:')
     except GithubException as e:
+        fail_current_span(e)
         logging.error(f"GitHub Exception while deleting file '{file_path}' from repo '{repo_name}': {e}")
         st.error(f"Error deleting file: {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
     except Exception as e:
+        fail_current_span(e)
         logging.exception(f"Unexpected error while deleting file '{file_path}' from repo '{repo_name}': {e}")
         st.error(f"Unexpected error: {str(e)}", icon=':material/sentiment_dissatisfied:')
+
+def _create_blob(repo, content: Union[str, bytes]) -> str:
+    """
+    Uploads one blob and returns its SHA. Runs in a worker thread, so no Streamlit calls.
+    """
+    if isinstance(content, bytes):
+        return repo.create_git_blob(base64.b64encode(content).decode(), "base64").sha
+    return repo.create_git_blob(content, "utf-8").sha
+
+def _tree_modes(repo, tree_sha: str, paths: List[str]) -> Dict[str, str]:
+    """
+    Looks up the file mode of existing paths by walking only the directories that
+    contain them. Runs in a worker thread, so no Streamlit calls.
+    """
+    wanted = set(paths)
+    directories = set()
+    for path in paths:
+        directory = posixpath.dirname(path)
+        while directory:
+            directories.add(directory)
+            directory = posixpath.dirname(directory)
+    modes = {}
+    pending = [("", tree_sha)]
+    while pending:
+        prefix, sha = pending.pop()
+        for element in repo.get_git_tree(sha).tree:
+            path = f"{prefix}{element.path}"
+            if element.type == "tree" and path in directories:
+                pending.append((f"{path}/", element.sha))
+            elif path in wanted:
+                modes[path] = element.mode
+    return modes
+
+@timed("github.commit_changes")
+def commit_changes(
+    g: Github,
+    repo_name: str,
+    changes: Dict[str, Optional[Union[str, bytes]]],
+    commit_message: str,
+    branch: Optional[str] = None,
+    max_workers: int = 8,
+) -> bool:
+    """
+    Commits several file creations, updates and deletions as a single commit
+    through the Git Data API: blobs are uploaded in parallel, followed by one
+    tree, one commit and one ref update.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+        changes (Dict[str, Optional[Union[str, bytes]]]): New content per path; None deletes the file.
+        commit_message (str): Commit message.
+        branch (Optional[str]): Target branch, defaults to the repository's default branch.
+        max_workers (int): Number of parallel blob uploads.
+
+    Returns:
+        bool: True if the commit landed, else False.
+    """
+    if not changes:
+        st.warning("There are no staged changes to commit.", icon=':material/info:')
+        return False
+    try:
+        copy = _working_copy(g, repo_name) if branch is None else None
+        if copy is not None:
+            sha = copy.commit(changes, commit_message, author=get_commit_identity(g))
+            st.success(f"Committed {len(changes)} change(s) to '{repo_name}' as {sha[:7]}.", icon=':material/sentiment_satisfied:')
+            logging.info(f"Committed {len(changes)} change(s) to the working copy of '{repo_name}' ({sha}).")
+            return True
+    except (WorkingCopyError, GithubException) as e:
+        fail_current_span(e)
+        logging.error(f"Error committing changes to the working copy of '{repo_name}': {e}")
+        st.error(f"Error committing changes: {e}", icon=':material/sentiment_dissatisfied:')
+        return False
+    repo = get_repo(g, repo_name)
+    if not repo:
+        return False
+    branch = branch or repo.default_branch
+    try:
+        ref = repo.get_git_ref(f"heads/{branch}")
+        base_commit = repo.get_git_commit(ref.object.sha)
+
+        uploads = {path: content for path, content in changes.items() if content is not None}
+        annotate_current_span(bytes_out=sum(len(content if isinstance(content, bytes) else content.encode()) for content in uploads.values()))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # Changed files keep their mode (e.g. executable); new files are regular files.
+            modes = pool.submit(bind(_tree_modes), repo, base_commit.tree.sha, list(changes))
+            blob_shas = dict(zip(uploads, pool.map(bind(lambda content: _create_blob(repo, content)), uploads.values())))
+            modes = modes.result()
+
+        elements = [InputGitTreeElement(path, modes.get(path, "100644"), "blob", sha=sha) for path, sha in blob_shas.items()]
+        # A null SHA removes the path from the base tree.
+        elements += [
+            InputGitTreeElement(path, modes.get(path, "100644"), "blob", sha=None)
+            for path, content in changes.items() if content is None
+        ]
+        tree = repo.create_git_tree(elements, base_commit.tree)
+        commit = repo.create_git_commit(commit_message, tree, [base_commit])
+        # Not forced: if the branch moved meanwhile the update is rejected instead of dropping commits.
+        ref.edit(commit.sha)
+        st.success(f"Committed {len(changes)} change(s) to '{repo_name}' as {commit.sha[:7]}.", icon=':material/sentiment_satisfied:')
+        logging.info(f"Committed {len(changes)} change(s) to repo '{repo_name}' ({commit.sha}).")
+        return True
+    except GithubException as e:
+        fail_current_span(e)
+        logging.error(f"GitHub Exception while committing changes to repo '{repo_name}': {e}")
+        st.error(f"Error committing changes: {e.data.get('message', str(e))}", icon=':material/sentiment_dissatisfied:')
+    except Exception as e:
+        fail_current_span(e)
+        logging.exception(f"Unexpected error while committing changes to repo '{repo_name}': {e}")
+        st.error(f"Unexpected error: {str(e)}", icon=':material/sentiment_dissatisfied:')
+    return False
@@ -0,0 +1,146 @@
+# llm_cache.py
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+class LLMResponseCache:
+    """
+    Content-addressed cache of LLM completions with a size-bounded in-memory LRU
+    tier and an optional on-disk tier shared by every session in the process.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_prompt: str, file_content: str) -> str:
+        """
+        Hashes every input that determines a temperature-0 completion.
+
+        Args:
+            model (str): Provider model identifier.
+            system_prompt (str): System-level instructions.
+            user_prompt (str): User's prompt.
+            file_content (str): Editor content sent along with the prompt.
+
+        Returns:
+            str: Hex digest used as cache key.
+        """
+        digest = hashlib.sha256()
+        for part in (model, system_prompt, user_prompt, file_content):
+            encoded = part.encode()
+            # Length prefixes keep ("ab", "c") and ("a", "bc") apart.
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks a completion up in memory first, then on disk.
+
+        Args:
+            key (str): Cache key from `key()`.
+
+        Returns:
+            Optional[str]: Cached completion, or None on a miss.
+        """
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return response
+
+        response = self._read_disk(key)
+        with self._lock:
+            if response is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+        self._put_memory(key, response)
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Stores a completion in both tiers.
+
+        Args:
+            key (str): Cache key from `key()`.
+            response (str): Completion text.
+        """
+        self._put_memory(key, response)
+        self._write_disk(key, response)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns hit/miss counters, the hit rate and the memory tier size.
+
+        Returns:
+            Dict[str, float]: Cache statistics.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _put_memory(self, key: str, response: str) -> None:
+        size = len(response.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.encode())
+            self._entries[key] = response
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.encode())
+                self._stats["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.txt")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"LLM cache read failed for {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, response: str) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(response)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"LLM cache write failed for {key}: {e}")
+
+response_cache = LLMResponseCache(
+    max_bytes=int(os.environ.get("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    disk_dir=os.environ.get("LLM_CACHE_DIR") or None,
+)
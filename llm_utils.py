@@ -1,46 +1,435 @@
 # llm_utils.py
 import streamlit as st
 import logging
-from typing import Optional
-import anthropic
-from openai import OpenAI
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
 from os import environ
+from llm_cache import response_cache
+from patch_utils import PatchError, apply_patch
+from clients import get_anthropic_client, get_openai_client
+from metrics import annotate_current_span, fail_current_span, metrics, record_cache, span, timed
+from token_utils import estimate_tokens
 
-def generate_code_with_llm(prompt: str, app_code: str) -> Optional[str]:
+LLM_MODELS = {
+    'Sonnet-3.5': "claude-3-5-sonnet-20240620",
+    'GPT-4o': "gpt-4o",
+}
+
+# Context window (prompt plus answer) and answer limit per model, in tokens.
+MODEL_LIMITS = {
+    "claude-3-5-sonnet-20240620": {"context": 200_000, "output": 8192},
+    "gpt-4o": {"context": 128_000, "output": 16_384},
+}
+# Headroom on top of the expected answer size, for comments and reformatting.
+OUTPUT_MARGIN_TOKENS = 1024
+# Smallest answer a request is sent for.
+MIN_OUTPUT_TOKENS = 1024
+# A patch is expected to be at most this fraction of the file.
+PATCH_OUTPUT_FRACTION = 0.3
+# Generations kept in `st.session_state.token_usage`.
+USAGE_HISTORY = 50
+
+SYSTEM_PROMPT = (
+    "You are an expert Python programmer. Respond only with clean Python code that "
+    "addresses the user's request, do not add (!) any of your explanations, do not add (!) "
+    "any quote characters. You may comment the code using commenting markup ONLY! "
+    "By default, output full code unless specified by the user prompt."
+)
+
+PATCH_SYSTEM_PROMPT = (
+    "You are an expert Python programmer editing an existing file. Respond ONLY with "
+    "SEARCH/REPLACE blocks in exactly this format, one block per change:\n"
+    "<<<<<<< SEARCH\n"
+    "<lines copied verbatim from the current file>\n"
+    "=======\n"
+    "<replacement lines>\n"
+    ">>>>>>> REPLACE\n"
+    "Each SEARCH section must match the current file exactly, including indentation, and "
+    "must be long enough to be unique. Keep blocks small. To add code at the end of the "
+    "file, use an empty SEARCH section. Do not add any explanations or quote characters."
+)
+
+def _build_prompts(prompt: str, app_code: str, patch: bool, context: str = ""):
+    """
+    Returns the system prompt and user message for the requested edit mode.
+    Repository context, if any, goes between the prompt and the file.
+    """
+    if patch:
+        if context:
+            prompt = f"{prompt}\n\n{context}"
+        return PATCH_SYSTEM_PROMPT, f"{prompt}\n\nCurrent file:\n{app_code}"
+    if context:
+        return SYSTEM_PROMPT, f"{prompt}\n\n{context}\n\nFile to edit:\n{app_code}"
+    return SYSTEM_PROMPT, f"{prompt} {app_code}"
+
+def _repo_context(prompt: str, app_code: str, budget: int) -> str:
+    """
+    Selects excerpts of other files in the current repository that are relevant
+    to the prompt. The selection is stored in `st.session_state.last_context`.
+
+    Args:
+        prompt (str): User's prompt.
+        app_code (str): Current file content.
+        budget (int): Token budget for the excerpts.
+
+    Returns:
+        str: Prompt section with the excerpts, empty if disabled or nothing matched.
+    """
+    st.session_state.last_context = None
+    g = st.session_state.get('g')
+    repo_name = st.session_state.get('selected_repo')
+    if not budget or g is None or not repo_name or not app_code.strip():
+        return ""
+    try:
+        from repo_index import format_context, get_repo_index
+        # Never waits for the index: the first generations go without context while it builds.
+        index = get_repo_index(g, repo_name)
+        if index is None:
+            return ""
+        snippets = index.select(st.session_state.get('selected_file', ''), app_code, prompt, budget)
+    except Exception as e:
+        # Context only improves the answer; never fail the generation over it.
+        logging.exception(f"Repository context selection failed: {e}")
+        return ""
+    st.session_state.last_context = {
+        "snippets": len(snippets),
+        "files": len({snippet.chunk.path for snippet in snippets}),
+        "tokens": sum(snippet.chunk.tokens for snippet in snippets),
+    }
+    return format_context(snippets)
+
+def _model_limits() -> Dict[str, int]:
+    return MODEL_LIMITS[LLM_MODELS[st.session_state.get('selected_llm', 'Sonnet-3.5')]]
+
+def fits_full_rewrite(app_code: str) -> bool:
+    """
+    Checks whether the selected model can return the whole file in one answer.
+
+    Args:
+        app_code (str): Current file content.
+
+    Returns:
+        bool: False if a full regeneration would be cut off at the model's output limit.
+    """
+    return estimate_tokens(app_code) + OUTPUT_MARGIN_TOKENS <= _model_limits()["output"]
+
+def expected_output_tokens(app_code: str, patch: bool) -> int:
+    """
+    Sizes `max_tokens` for a request: a fraction of the file for a patch, the
+    model's limit otherwise. A full regeneration may legitimately grow the file
+    far beyond its current size ("build me a dashboard"), so it is only capped
+    where the context window requires it, in `plan_request`.
+
+    Args:
+        app_code (str): Current file content.
+        patch (bool): Whether a patch is requested.
+
+    Returns:
+        int: Output token allowance within the model's limit.
+    """
+    limit = _model_limits()["output"]
+    if not patch or not app_code.strip():
+        return limit
+    expected = estimate_tokens(app_code) * PATCH_OUTPUT_FRACTION
+    return int(min(limit, max(MIN_OUTPUT_TOKENS, expected + OUTPUT_MARGIN_TOKENS)))
+
+@dataclass
+class PromptPlan:
+    """
+    A request sized to the model's context window.
+
+    Attributes:
+        system_prompt (str): System prompt.
+        user_prompt (str): User message, with repository context if any.
+        context (str): The repository context part of the user message.
+        input_tokens (int): Estimated prompt tokens.
+        max_tokens (int): Output token allowance.
+    """
+    system_prompt: str
+    user_prompt: str
+    context: str
+    input_tokens: int
+    max_tokens: int
+
+def plan_request(prompt: str, app_code: str, patch: bool) -> Optional[PromptPlan]:
+    """
+    Builds the prompts for a request and checks them against the selected model's
+    context window before anything is sent. The repository context gets whatever
+    room the prompt, the file and the expected answer leave, up to the session's
+    budget; if the prompt and file alone do not fit, the request is refused.
+
+    Args:
+        prompt (str): User's prompt.
+        app_code (str): Current file content.
+        patch (bool): Whether a patch is requested.
+
+    Returns:
+        Optional[PromptPlan]: The request, or None if it does not fit.
+    """
+    limits = _model_limits()
+    system_prompt, user_prompt = _build_prompts(prompt, app_code, patch)
+    input_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    max_tokens = expected_output_tokens(app_code, patch)
+    room = limits["context"] - input_tokens - max_tokens
+    if room < 0:
+        # Let the answer use what is left, as long as a useful answer still fits.
+        max_tokens += room
+        room = 0
+        if max_tokens < MIN_OUTPUT_TOKENS:
+            st.error(
+                f"The prompt and file take about {input_tokens:,} tokens, which leaves no room for an answer "
+                f"in the {limits['context']:,}-token context of {st.session_state.get('selected_llm')}. "
+                "Shorten the prompt or split the file.",
+                icon=':material/sentiment_dissatisfied:'
+            )
+            return None
+
+    context = _repo_context(prompt, app_code, min(st.session_state.get('context_budget', 0), room))
+    if context:
+        system_prompt, user_prompt = _build_prompts(prompt, app_code, patch, context)
+        input_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    return PromptPlan(system_prompt, user_prompt, context, input_tokens, max_tokens)
+
+def apply_generated_patch(response: str, app_code: str) -> Optional[str]:
+    """
+    Applies a patch-mode response to the current file.
+
+    The result must still compile if the current file does, so a patch that
+    applies textually but breaks the syntax is rejected as well.
+
+    Args:
+        response (str): LLM response with SEARCH/REPLACE blocks.
+        app_code (str): Current file content.
+
+    Returns:
+        Optional[str]: Patched file content, or None if the patch does not apply.
+    """
+    try:
+        patched_code = apply_patch(app_code, response)
+        try:
+            compile(app_code, "<current>", "exec")
+        except SyntaxError:
+            return patched_code
+        try:
+            compile(patched_code, "<patched>", "exec")
+        except SyntaxError as e:
+            raise PatchError(f"Patched file does not compile: {e}")
+        return patched_code
+    except PatchError as e:
+        logging.warning(f"LLM patch rejected: {e}")
+        return None
+
+def generate_code_with_llm(prompt: str, app_code: str, patch: bool = False) -> Optional[str]:
     """
     Generates code using the selected LLM based on the provided prompt and application code.
 
+    Files too long for the model to return in one answer are always edited with a patch.
+
     Args:
         prompt (str): User's prompt for code generation.
         app_code (str): Existing application code.
+        patch (bool): Ask for SEARCH/REPLACE blocks and apply them locally instead of
+            regenerating the whole file. Falls back to full regeneration if the patch
+            does not apply.
 
     Returns:
         Optional[str]: Generated code if successful, else None.
     """
     selected_llm = st.session_state.get('selected_llm', 'Sonnet-3.5')
-    system_prompt = (
-        "You are an expert Python programmer. Respond only with clean Python code that "
-        "addresses the user's request, do not add (!) any of your explanations, do not add (!) "
-        "any quote characters. You may comment the code using commenting markup ONLY! "
-        "By default, output full code unless specified by the user prompt."
-    )
-    full_prompt = f"{prompt} {app_code}"
+    if selected_llm not in LLM_MODELS:
+        st.error("Selected LLM is not supported.", icon=':material/sentiment_dissatisfied:')
+        return None
+    if app_code.strip() and not patch and not fits_full_rewrite(app_code):
+        st.warning(f"This file is too long for {selected_llm} to rewrite in one answer, asking for a patch instead.", icon=':material/info:')
+        patch = True
+    patch = patch and bool(app_code.strip())
+    plan = plan_request(prompt, app_code, patch)
+    if plan is None:
+        return None
 
-    if selected_llm == 'Sonnet-3.5':
-        return generate_with_anthropic(system_prompt, full_prompt)
-    elif selected_llm == 'GPT-4o':
-        return generate_with_openai(system_prompt, full_prompt)
-    else:
+    started = time.perf_counter()
+    cache_key = response_cache.key(LLM_MODELS[selected_llm], plan.system_prompt, prompt + plan.context, app_code)
+    response = None
+    if not st.session_state.get('bypass_llm_cache', False):
+        response = response_cache.get(cache_key)
+        record_cache("llm.response_cache", response is not None)
+    cache_hit = response is not None
+
+    usage = {}
+    if not cache_hit:
+        if selected_llm == 'Sonnet-3.5':
+            response = generate_with_anthropic(plan.system_prompt, plan.user_prompt, plan.max_tokens, usage)
+        else:
+            response = generate_with_openai(plan.system_prompt, plan.user_prompt, plan.max_tokens, usage)
+    total = time.perf_counter() - started
+    # Without streaming the first token is only observable together with the last one.
+    _record_generation(selected_llm, total, total, response or "", streamed=False, cancelled=False, cache_hit=cache_hit, plan=plan, usage=usage)
+
+    patched_code = apply_generated_patch(response, app_code) if patch and response else None
+    # A patch that does not apply must not be cached, or every retry would replay it.
+    if response and not cache_hit and not usage.get("truncated") and (not patch or patched_code is not None):
+        response_cache.put(cache_key, response)
+    if patch and response:
+        if patched_code is None:
+            if not fits_full_rewrite(app_code):
+                st.error("The patch did not apply cleanly, and the file is too long to regenerate in full.", icon=':material/sentiment_dissatisfied:')
+                return None
+            st.warning("The patch did not apply cleanly, regenerating the full file.", icon=':material/info:')
+            return generate_code_with_llm(prompt, app_code, patch=False)
+        return patched_code
+    return response
+
+def stream_code_with_llm(prompt: str, app_code: str, patch: bool = False) -> Optional[Iterator[str]]:
+    """
+    Streams generated code from the selected LLM chunk by chunk.
+
+    Time-to-first-token, total time and token usage are stored in
+    `st.session_state.last_generation` when the stream is exhausted or closed early
+    by the caller. In patch mode the chunks form SEARCH/REPLACE blocks, to be
+    applied with `apply_generated_patch`; callers should ask for a patch when
+    `fits_full_rewrite` is False.
+
+    Args:
+        prompt (str): User's prompt for code generation.
+        app_code (str): Existing application code.
+        patch (bool): Ask for SEARCH/REPLACE blocks instead of the full file.
+
+    Returns:
+        Optional[Iterator[str]]: Iterator of text chunks, or None if the LLM is not
+        supported or the request does not fit the model.
+    """
+    selected_llm = st.session_state.get('selected_llm', 'Sonnet-3.5')
+    if selected_llm not in LLM_MODELS:
         st.error("Selected LLM is not supported.", icon=':material/sentiment_dissatisfied:')
         return None
+    plan = plan_request(prompt, app_code, patch)
+    if plan is None:
+        return None
+
+    cache_key = response_cache.key(LLM_MODELS[selected_llm], plan.system_prompt, prompt + plan.context, app_code)
+    if not st.session_state.get('bypass_llm_cache', False):
+        cached_code = response_cache.get(cache_key)
+        record_cache("llm.response_cache", cached_code is not None)
+        if cached_code is not None:
+            return _timed_stream(selected_llm, _replay(cached_code), cache_key, True, plan, {}, None)
+
+    usage = {}
+    if selected_llm == 'Sonnet-3.5':
+        chunks = stream_with_anthropic(plan.system_prompt, plan.user_prompt, plan.max_tokens, usage)
+    else:
+        chunks = stream_with_openai(plan.system_prompt, plan.user_prompt, plan.max_tokens, usage)
+    return _timed_stream(selected_llm, chunks, cache_key, False, plan, usage, app_code if patch else None)
+
+def _replay(text: str) -> Iterator[str]:
+    """
+    Serves a cached completion through the streaming interface.
+    """
+    yield text
+
+def _timed_stream(
+    selected_llm: str, chunks: Iterator[str], cache_key: str, cache_hit: bool, plan: PromptPlan, usage: Dict,
+    patch_base: Optional[str],
+) -> Iterator[str]:
+    """
+    Passes chunks through while measuring time-to-first-token and total time.
+    Completions that run to the end without an API error are stored in the
+    response cache; patch-mode completions only if they apply to `patch_base`.
+    """
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    completed = False
+    try:
+        for chunk in chunks:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            parts.append(chunk)
+            yield chunk
+        completed = True
+    finally:
+        # Closing the provider stream aborts the HTTP response on early cancel.
+        chunks.close()
+        total = time.perf_counter() - started
+        generated_code = "".join(parts)
+        if (completed and not cache_hit and generated_code.strip() and not usage.get("truncated") and not usage.get("failed")
+                and (patch_base is None or apply_generated_patch(generated_code, patch_base) is not None)):
+            response_cache.put(cache_key, generated_code.strip())
+        if first_token is not None and not cache_hit:
+            metrics.observe("span_seconds", first_token, span=f"llm.{LLM_MODELS[selected_llm]}.first_token")
+        _record_generation(selected_llm, first_token, total, generated_code, streamed=True, cancelled=not completed, cache_hit=cache_hit, plan=plan, usage=usage)
+
+def _record_generation(
+    selected_llm: str,
+    first_token: Optional[float],
+    total: float,
+    text: str,
+    streamed: bool,
+    cancelled: bool,
+    cache_hit: bool,
+    plan: PromptPlan,
+    usage: Dict,
+) -> None:
+    """
+    Stores timings and token usage of the latest generation in the session state
+    and the log, and adds them to the session's totals.
+
+    Token counts are the provider's when it reported them (it does not for
+    cancelled streams), estimates otherwise; cache hits cost no tokens.
+    """
+    if cache_hit:
+        input_tokens, output_tokens = 0, 0
+    else:
+        input_tokens = usage.get("input_tokens", plan.input_tokens)
+        output_tokens = usage.get("output_tokens", estimate_tokens(text))
+    generation = {
+        "llm": selected_llm,
+        "first_token": first_token,
+        "total": total,
+        "chars": len(text),
+        "streamed": streamed,
+        "cancelled": cancelled,
+        "cache_hit": cache_hit,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "estimated_input_tokens": plan.input_tokens,
+        "max_tokens": plan.max_tokens,
+        "tokens_reported": "input_tokens" in usage,
+        "truncated": bool(usage.get("truncated")),
+        "failed": bool(usage.get("failed")),
+    }
+    st.session_state.last_generation = generation
+    st.session_state.token_usage = (st.session_state.get('token_usage') or [])[-(USAGE_HISTORY - 1):] + [generation]
+    totals = dict(st.session_state.get('token_totals') or {"requests": 0, "input_tokens": 0, "output_tokens": 0, "seconds": 0.0})
+    totals["requests"] += 1
+    totals["input_tokens"] += input_tokens
+    totals["output_tokens"] += output_tokens
+    totals["seconds"] += total
+    st.session_state.token_totals = totals
+    if generation["truncated"]:
+        st.warning(
+            f"The answer reached the {plan.max_tokens:,}-token output limit and is incomplete.",
+            icon=':material/info:'
+        )
+
+    ttft = f"{first_token:.2f}s" if first_token is not None else "n/a"
+    logging.info(
+        f"{selected_llm} generation: first token {ttft}, total {total:.2f}s, "
+        f"{len(text)} chars, {input_tokens} input / {output_tokens} output tokens "
+        f"(estimated input {plan.input_tokens}, max_tokens {plan.max_tokens}), "
+        f"streamed={streamed}, cancelled={cancelled}, cache_hit={cache_hit}"
+    )
 
-def generate_with_anthropic(system_prompt: str, user_prompt: str) -> Optional[str]:
+@timed("llm.anthropic.complete")
+def generate_with_anthropic(system_prompt: str, user_prompt: str, max_tokens: int = 8192, usage: Optional[Dict] = None) -> Optional[str]:
     """
     Generates code using the Anthropic LLM.
 
     Args:
         system_prompt (str): System-level instructions for the LLM.
         user_prompt (str): User's prompt.
+        max_tokens (int): Output token allowance.
+        usage (Optional[Dict]): Filled with input_tokens, output_tokens and truncated.
 
     Returns:
         Optional[str]: Generated code if successful, else None.
@@ -50,29 +439,93 @@ def generate_with_anthropic(system_prompt: str, user_prompt: str) -> Optional[st
         st.error("Anthropic API key not found in secrets.", icon=':material/sentiment_dissatisfied:')
         return None
 
-    client = anthropic.Anthropic(api_key=anthropic_api_key)
     try:
-        # Note: The Anthropic library may have different methods; adjust accordingly
-        client = anthropic.Anthropic(api_key=anthropic_api_key)
+        # Pooled client; the SDK itself is imported on first use.
+        client = get_anthropic_client(anthropic_api_key)
         message = client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=8192,
-            temperature=0,
+            model=LLM_MODELS['Sonnet-3.5'],
+            max_tokens=max_tokens,
+            # Not a named parameter in every SDK release; the API accepts it in the body.
+            extra_body={"temperature": 0},
             system=system_prompt,
             messages=[{"role": "user", "content": [{"type": "text", "text": user_prompt}]}])
+        annotate_current_span(
+            tokens_in=message.usage.input_tokens,
+            tokens_out=message.usage.output_tokens,
+            bytes_out=len((system_prompt + user_prompt).encode()),
+            bytes_in=len(message.content[0].text.encode()),
+        )
+        if usage is not None:
+            usage.update(
+                input_tokens=message.usage.input_tokens,
+                output_tokens=message.usage.output_tokens,
+                truncated=message.stop_reason == "max_tokens",
+            )
         return message.content[0].text
     except Exception as e:
+        fail_current_span(e)
         logging.exception(f"Anthropic API error: {e}")
         st.error(f"Anthropic API error: {str(e)}", icon=':material/sentiment_dissatisfied:')
         return None
 
-def generate_with_openai(system_prompt: str, user_prompt: str) -> Optional[str]:
+def stream_with_anthropic(system_prompt: str, user_prompt: str, max_tokens: int = 8192, usage: Optional[Dict] = None) -> Iterator[str]:
+    """
+    Streams code from the Anthropic LLM.
+
+    Args:
+        system_prompt (str): System-level instructions for the LLM.
+        user_prompt (str): User's prompt.
+        max_tokens (int): Output token allowance.
+        usage (Optional[Dict]): Filled with input_tokens, output_tokens and truncated
+            once the stream completes; "failed" is set if it ended on an API error.
+
+    Yields:
+        str: Text chunks as they arrive.
+    """
+    anthropic_api_key = environ.get("ANTHROPIC_API_KEY", "")
+    if not anthropic_api_key:
+        st.error("Anthropic API key not found in secrets.", icon=':material/sentiment_dissatisfied:')
+        return
+
+    with span("llm.anthropic.stream") as llm_span:
+        llm_span.set(bytes_out=len((system_prompt + user_prompt).encode()))
+        try:
+            client = get_anthropic_client(anthropic_api_key)
+            with client.messages.stream(
+                model=LLM_MODELS['Sonnet-3.5'],
+                max_tokens=max_tokens,
+                extra_body={"temperature": 0},
+                system=system_prompt,
+                messages=[{"role": "user", "content": [{"type": "text", "text": user_prompt}]}]) as stream:
+                for text in stream.text_stream:
+                    llm_span.set(bytes_in=len(text.encode()))
+                    yield text
+                final_message = stream.get_final_message()
+                llm_span.set(tokens_in=final_message.usage.input_tokens, tokens_out=final_message.usage.output_tokens)
+                if usage is not None:
+                    usage.update(
+                        input_tokens=final_message.usage.input_tokens,
+                        output_tokens=final_message.usage.output_tokens,
+                        truncated=final_message.stop_reason == "max_tokens",
+                    )
+        except Exception as e:
+            llm_span.fail(e)
+            logging.exception(f"Anthropic API error: {e}")
+            st.error(f"Anthropic API error: {str(e)}", icon=':material/sentiment_dissatisfied:')
+            if usage is not None:
+                # The chunks so far are a cut-off answer, not a complete one.
+                usage["failed"] = True
+
+@timed("llm.openai.complete")
+def generate_with_openai(system_prompt: str, user_prompt: str, max_tokens: int = 8192, usage: Optional[Dict] = None) -> Optional[str]:
     """
     Generates code using the OpenAI LLM.
 
     Args:
         system_prompt (str): System-level instructions for the LLM.
         user_prompt (str): User's prompt.
+        max_tokens (int): Output token allowance.
+        usage (Optional[Dict]): Filled with input_tokens, output_tokens and truncated.
 
     Returns:
         Optional[str]: Generated code if successful, else None.
@@ -82,17 +535,86 @@ def generate_with_openai(system_prompt: str, user_prompt: str) -> Optional[str]:
         st.error("OpenAI API key not found in secrets.", icon=':material/sentiment_dissatisfied:')
         return None
 
-    client = OpenAI(api_key=openai_api_key)
     try:
+        client = get_openai_client(openai_api_key)
         completion = client.chat.completions.create(
-            model="gpt-4o",
+            model=LLM_MODELS['GPT-4o'],
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
-            ]
+            ],
+            max_tokens=max_tokens
         )
+        annotate_current_span(
+            tokens_in=completion.usage.prompt_tokens if completion.usage else None,
+            tokens_out=completion.usage.completion_tokens if completion.usage else None,
+            bytes_out=len((system_prompt + user_prompt).encode()),
+            bytes_in=len(completion.choices[0].message.content.encode()),
+        )
+        if usage is not None and completion.usage:
+            usage.update(
+                input_tokens=completion.usage.prompt_tokens,
+                output_tokens=completion.usage.completion_tokens,
+                truncated=completion.choices[0].finish_reason == "length",
+            )
         return completion.choices[0].message.content.strip()
     except Exception as e:
+        fail_current_span(e)
         logging.exception(f"OpenAI API error: {e}")
         st.error(f"OpenAI API error: {str(e)}", icon=':material/sentiment_dissatisfied:')
         return None
+
+def stream_with_openai(system_prompt: str, user_prompt: str, max_tokens: int = 8192, usage: Optional[Dict] = None) -> Iterator[str]:
+    """
+    Streams code from the OpenAI LLM.
+
+    Args:
+        system_prompt (str): System-level instructions for the LLM.
+        user_prompt (str): User's prompt.
+        max_tokens (int): Output token allowance.
+        usage (Optional[Dict]): Filled with input_tokens, output_tokens and truncated
+            once the stream completes; "failed" is set if it ended on an API error.
+
+    Yields:
+        str: Text chunks as they arrive.
+    """
+    openai_api_key = environ.get("OPENAI_API_KEY", "")
+    if not openai_api_key:
+        st.error("OpenAI API key not found in secrets.", icon=':material/sentiment_dissatisfied:')
+        return
+
+    with span("llm.openai.stream") as llm_span:
+        llm_span.set(bytes_out=len((system_prompt + user_prompt).encode()))
+        try:
+            client = get_openai_client(openai_api_key)
+            stream = client.chat.completions.create(
+                model=LLM_MODELS['GPT-4o'],
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=max_tokens,
+                stream=True,
+                # The last chunk then carries the token usage.
+                stream_options={"include_usage": True}
+            )
+            try:
+                for chunk in stream:
+                    if chunk.usage:
+                        llm_span.set(tokens_in=chunk.usage.prompt_tokens, tokens_out=chunk.usage.completion_tokens)
+                        if usage is not None:
+                            usage.update(input_tokens=chunk.usage.prompt_tokens, output_tokens=chunk.usage.completion_tokens)
+                    if chunk.choices and chunk.choices[0].finish_reason == "length" and usage is not None:
+                        usage["truncated"] = True
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        llm_span.set(bytes_in=len(chunk.choices[0].delta.content.encode()))
+                        yield chunk.choices[0].delta.content
+            finally:
+                stream.close()
+        except Exception as e:
+            llm_span.fail(e)
+            logging.exception(f"OpenAI API error: {e}")
+            st.error(f"OpenAI API error: {str(e)}", icon=':material/sentiment_dissatisfied:')
+            if usage is not None:
+                # The chunks so far are a cut-off answer, not a complete one.
+                usage["failed"] = True
@@ -0,0 +1,108 @@
+# merge_utils.py
+
+import hashlib
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+def git_blob_sha(content: str) -> str:
+    """
+    Computes the git blob SHA of text content, as GitHub reports it for files.
+
+    Args:
+        content (str): File content.
+
+    Returns:
+        str: Hex SHA-1 of the blob object.
+    """
+    data = content.encode()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def _intersect(a: Tuple[int, int], b: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    start, end = max(a[0], b[0]), min(a[1], b[1])
+    return (start, end) if start < end else None
+
+def _sync_regions(base: List[str], ours: List[str], theirs: List[str]):
+    """
+    Yields regions (base_start, base_end, ours_start, ours_end, theirs_start,
+    theirs_end) that are identical in all three versions, ending with an empty
+    sentinel region.
+    """
+    ours_matches = SequenceMatcher(None, base, ours, autojunk=False).get_matching_blocks()
+    theirs_matches = SequenceMatcher(None, base, theirs, autojunk=False).get_matching_blocks()
+    i = j = 0
+    while i < len(ours_matches) and j < len(theirs_matches):
+        ours_base, ours_start, ours_len = ours_matches[i]
+        theirs_base, theirs_start, theirs_len = theirs_matches[j]
+        overlap = _intersect((ours_base, ours_base + ours_len), (theirs_base, theirs_base + theirs_len))
+        if overlap:
+            start, end = overlap
+            ours_sub = ours_start + (start - ours_base)
+            theirs_sub = theirs_start + (start - theirs_base)
+            yield start, end, ours_sub, ours_sub + end - start, theirs_sub, theirs_sub + end - start
+        if ours_base + ours_len < theirs_base + theirs_len:
+            i += 1
+        else:
+            j += 1
+    yield len(base), len(base), len(ours), len(ours), len(theirs), len(theirs)
+
+def merge3(base: str, ours: str, theirs: str, ours_label: str = "editor", theirs_label: str = "upstream") -> Tuple[str, bool]:
+    """
+    Three-way merges two edited versions of a text against their common base,
+    line by line. Overlapping edits are kept side by side between git-style
+    conflict markers.
+
+    Args:
+        base (str): Common ancestor (the version the editor was loaded from).
+        ours (str): Local edits (the editor buffer).
+        theirs (str): Upstream version.
+        ours_label (str): Label of the local side in conflict markers.
+        theirs_label (str): Label of the upstream side in conflict markers.
+
+    Returns:
+        Tuple[str, bool]: Merged text and whether it contains conflicts.
+    """
+    base_lines = base.splitlines(keepends=True)
+    ours_lines = ours.splitlines(keepends=True)
+    theirs_lines = theirs.splitlines(keepends=True)
+    merged: List[str] = []
+    conflicts = False
+
+    def terminated(lines: List[str]) -> List[str]:
+        # Conflict markers must start on their own line.
+        if lines and not lines[-1].endswith("\n"):
+            return lines[:-1] + [lines[-1] + "\n"]
+        return lines
+
+    base_pos = ours_pos = theirs_pos = 0
+    for base_start, base_end, ours_start, ours_end, theirs_start, theirs_end in _sync_regions(base_lines, ours_lines, theirs_lines):
+        base_chunk = base_lines[base_pos:base_start]
+        ours_chunk = ours_lines[ours_pos:ours_start]
+        theirs_chunk = theirs_lines[theirs_pos:theirs_start]
+        if ours_chunk or theirs_chunk:
+            if ours_chunk == theirs_chunk or theirs_chunk == base_chunk:
+                merged.extend(ours_chunk)
+            elif ours_chunk == base_chunk:
+                merged.extend(theirs_chunk)
+            else:
+                conflicts = True
+                merged.append(f"<<<<<<< {ours_label}\n")
+                merged.extend(terminated(ours_chunk))
+                merged.append("=======\n")
+                merged.extend(terminated(theirs_chunk))
+                merged.append(f">>>>>>> {theirs_label}\n")
+        merged.extend(base_lines[base_start:base_end])
+        base_pos, ours_pos, theirs_pos = base_end, ours_end, theirs_end
+    return "".join(merged), conflicts
+
+def has_conflict_markers(content: str) -> bool:
+    """
+    Checks whether text still contains unresolved conflict markers from `merge3`.
+
+    Args:
+        content (str): Text to check.
+
+    Returns:
+        bool: True if a complete conflict block is present.
+    """
+    lines = content.splitlines()
+    return any(line.startswith("<<<<<<< ") for line in lines) and any(line.startswith(">>>>>>> ") for line in lines)
@@ -0,0 +1,393 @@
+# metrics.py
+
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import environ
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_span_logger = logging.getLogger("streamcoder.spans")
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram with interpolated quantiles.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates a quantile by linear interpolation inside its bucket.
+
+        Args:
+            q (float): Quantile between 0 and 1.
+
+        Returns:
+            Optional[float]: Estimated value in seconds, or None without observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return self.max  # beyond the largest bound
+                estimate = lower + (self.buckets[index] - lower) * (rank - seen) / bucket_count
+                return min(estimate, self.max)
+            seen += bucket_count
+        return self.max
+
+class MetricsStore:
+    """
+    In-process store of span histograms and counters, shared by every session.
+    """
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple]:
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def summary(self) -> List[Dict]:
+        """
+        Aggregates everything recorded per span, for the admin page.
+
+        Returns:
+            List[Dict]: One row per span with count, errors, latency quantiles,
+            payload bytes, tokens and cache hit rate.
+        """
+        rows: Dict[str, Dict] = {}
+        with self._lock:
+            for (name, labels), histogram in self._histograms.items():
+                if name != "span_seconds":
+                    continue
+                span_name = dict(labels)["span"]
+                rows[span_name] = {
+                    "span": span_name,
+                    "count": histogram.count,
+                    "p50_ms": _ms(histogram.quantile(0.5)),
+                    "p95_ms": _ms(histogram.quantile(0.95)),
+                    "p99_ms": _ms(histogram.quantile(0.99)),
+                    "mean_ms": _ms(histogram.sum / histogram.count),
+                    "errors": 0,
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                    "tokens_in": 0,
+                    "tokens_out": 0,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
+                }
+            for (name, labels), value in self._counters.items():
+                labels = dict(labels)
+                row = rows.get(labels.get("span"))
+                if row is None:
+                    continue
+                if name == "span_total" and labels.get("outcome") == "error":
+                    row["errors"] += int(value)
+                elif name in ("span_bytes_total", "span_tokens_total"):
+                    row[f"{name.split('_')[1]}_{labels['direction']}"] += int(value)
+                elif name == "span_cache_total":
+                    row["cache_hits" if labels["result"] == "hit" else "cache_misses"] += int(value)
+        return sorted(rows.values(), key=lambda row: row["span"])
+
+    def render_prometheus(self, prefix: str = "streamcoder_") -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Metric name prefix.
+
+        Returns:
+            str: Exposition text.
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        declared = set()
+        for (name, labels), histogram in histograms:
+            metric = prefix + name
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            metric = prefix + name
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+metrics = MetricsStore()
+
+class Span:
+    """
+    One timed operation. Attributes set with `set()` are recorded when it ends.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.attributes: Dict[str, object] = {}
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> "Span":
+        """
+        Records payload and result details: bytes_in, bytes_out, tokens_in,
+        tokens_out (added up when set repeatedly), cache_hit, and free-form fields
+        that only go to the structured log.
+        """
+        for key, value in attributes.items():
+            if key in ("bytes_in", "bytes_out", "tokens_in", "tokens_out") and value is not None:
+                self.attributes[key] = self.attributes.get(key, 0) + value
+            else:
+                self.attributes[key] = value
+        return self
+
+    def fail(self, error: object) -> None:
+        """
+        Marks the span as failed, for errors that are handled instead of raised.
+        """
+        self.error = type(error).__name__ if isinstance(error, BaseException) else str(error)
+
+    def finish(self, outcome: Optional[str] = None) -> None:
+        duration = time.perf_counter() - self.started
+        outcome = outcome or ("error" if self.error else "ok")
+        metrics.observe("span_seconds", duration, span=self.name)
+        metrics.inc("span_total", span=self.name, outcome=outcome)
+        for key in ("bytes_in", "bytes_out", "tokens_in", "tokens_out"):
+            if self.attributes.get(key):
+                kind, direction = key.split("_")
+                metrics.inc(f"span_{kind}_total", self.attributes[key], span=self.name, direction=direction)
+        if self.attributes.get("cache_hit") is not None:
+            metrics.inc("span_cache_total", span=self.name, result="hit" if self.attributes["cache_hit"] else "miss")
+        _span_logger.log(
+            logging.INFO if JSON_LOGS else logging.DEBUG,
+            f"{self.name} {outcome} in {duration * 1000:.1f} ms",
+            extra={"span": dict(self.attributes, name=self.name, outcome=outcome, error=self.error, duration_ms=round(duration * 1000, 2))},
+        )
+
+_current = threading.local()
+
+def current_span() -> Optional[Span]:
+    """
+    Returns the innermost open span of the calling thread, if any.
+    """
+    stack = getattr(_current, "stack", None)
+    return stack[-1] if stack else None
+
+def fail_current_span(error: object) -> None:
+    """
+    Marks the innermost open span as failed; a no-op outside of spans.
+
+    Args:
+        error (object): Exception or message.
+    """
+    span_ = current_span()
+    if span_ is not None:
+        span_.fail(error)
+
+def annotate_current_span(**attributes) -> None:
+    """
+    Sets attributes (see `Span.set`) on the innermost open span; a no-op outside of spans.
+    """
+    span_ = current_span()
+    if span_ is not None:
+        span_.set(**attributes)
+
+@contextmanager
+def span(name: str):
+    """
+    Times a block and records it under `name`. Exceptions mark the span as
+    failed and propagate; control flow such as a generator closed early or a
+    Streamlit rerun is recorded as cancelled.
+
+    Args:
+        name (str): Span name, e.g. "github.get_repo".
+
+    Yields:
+        Span: The open span, to attach payload details to.
+    """
+    span_ = Span(name)
+    stack = _current.__dict__.setdefault("stack", [])
+    stack.append(span_)
+    outcome = None
+    try:
+        yield span_
+    except Exception as e:
+        span_.fail(e)
+        raise
+    except BaseException:
+        # Generator closed early, st.rerun()/st.stop(), interpreter shutdown.
+        outcome = "cancelled"
+        raise
+    finally:
+        stack.remove(span_)
+        span_.finish(outcome)
+
+def timed(name: str) -> Callable:
+    """
+    Decorator that wraps every call of a function in a span.
+
+    Args:
+        name (str): Span name.
+
+    Returns:
+        Callable: Decorator.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_cache(name: str, hit: bool) -> None:
+    """
+    Counts a cache lookup that is not part of a timed span.
+
+    Args:
+        name (str): Span name the lookup is reported under.
+        hit (bool): Whether the lookup hit.
+    """
+    metrics.inc("span_cache_total", span=name, result="hit" if hit else "miss")
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line, including span fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if hasattr(record, "span"):
+            entry["span"] = record.span
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+JSON_LOGS = environ.get("LOG_FORMAT", "").lower() == "json"
+
+def configure_logging() -> None:
+    """
+    Switches the root logger to JSON lines (file LOG_FILE, default app.log) when
+    LOG_FORMAT=json; otherwise leaves the logging setup untouched.
+    """
+    if not JSON_LOGS:
+        return
+    root = logging.getLogger()
+    if any(isinstance(handler.formatter, JsonFormatter) for handler in root.handlers):
+        return
+    handler = logging.FileHandler(environ.get("LOG_FILE", "app.log"))
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(environ.get("LOG_LEVEL", "INFO").upper())
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+
+def start_metrics_server() -> Optional[int]:
+    """
+    Serves the Prometheus export on http://0.0.0.0:METRICS_PORT/metrics from a
+    daemon thread, once per process. Does nothing when METRICS_PORT is unset.
+
+    Returns:
+        Optional[int]: Port served on, or None.
+    """
+    global _server
+    port = environ.get("METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                logging.error(f"Could not start the metrics endpoint on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            logging.info(f"Serving Prometheus metrics on port {port}.")
+        return _server.server_address[1]
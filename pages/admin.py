@@ -0,0 +1,65 @@
+import streamlit as st
+import hmac
+import time
+from os import environ
+from metrics import metrics
+from github_cache import cache_stats
+from blob_cache import blob_cache
+from llm_cache import response_cache
+
+def check_access() -> None:
+    """
+    Asks for ADMIN_PASSWORD and stops the page unless it is entered. The page
+    stays closed when no password is configured.
+
+    Returns:
+        None: Returns only if access is granted; otherwise the script run stops.
+    """
+    password = environ.get("ADMIN_PASSWORD")
+    if not password:
+        # Fail closed: the page shows cache contents and usage, so it is off unless protected.
+        st.warning("The admin page is disabled. Set ADMIN_PASSWORD to enable it.", icon=':material/info:')
+        st.stop()
+    entered = st.text_input("Admin password:", type="password")
+    if not hmac.compare_digest(entered.encode(), password.encode()):
+        if entered:
+            st.error("Wrong password.", icon=':material/sentiment_dissatisfied:')
+        st.stop()
+
+def show_metrics() -> None:
+    """
+    Shows the span latencies and cache statistics collected in this process,
+    with a Prometheus export and a reset button.
+
+    Returns:
+        None
+    """
+    st.subheader("Latency and throughput")
+    st.caption(f"Collected in this process over the last {(time.time() - metrics.started) / 60:.0f} min.")
+    rows = metrics.summary()
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("No spans recorded yet.", icon=':material/info:')
+
+    st.subheader("Caches")
+    github_col, blob_col, llm_col = st.columns(3)
+    github_stats = cache_stats()
+    github_col.metric("GitHub conditional cache", f"{github_stats['hits']} hits", f"{github_stats['entries']} entries", delta_color="off")
+    blob_stats = blob_cache.stats()
+    blob_col.metric("Blob cache", f"{blob_stats['hits']} hits", f"{blob_stats['bytes'] / 2**20:.1f} MB", delta_color="off")
+    llm_stats = response_cache.stats()
+    llm_col.metric("LLM response cache", f"{llm_stats['hit_rate']:.0%} hit rate", f"{llm_stats['entries']} entries", delta_color="off")
+
+    with st.expander("Prometheus export"):
+        exposition = metrics.render_prometheus()
+        st.download_button("Download", exposition, file_name="streamcoder.prom", mime="text/plain")
+        st.code(exposition, language=None)
+
+    if st.button("Reset metrics"):
+        metrics.reset()
+        st.rerun()
+
+if __name__ == "__main__":
+    check_access()
+    show_metrics()
@@ -1,12 +1,18 @@
 import streamlit as st
-from github import Github, GithubException
+from github import GithubException
 import base64
 from os import environ
-import importlib
-import re
-
-def custom_import(module_name):
-    return importlib.import_module(module_name)
+import hashlib
+import time
+from datetime import datetime
+from sandbox_store import sandbox_store
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from sandbox_runner import get_sandbox_pool
+from sandbox_compiler import compile_sandbox_code, make_import_helpers, split_sandbox_cells
+from sandbox_profiler import RunProfiler
+from auth import get_github_token
+from clients import get_github_client, get_authenticated_login
+from metrics import span
 
 def get_file_content(repo, file_path):
     try:
@@ -16,64 +22,145 @@ def get_file_content(repo, file_path):
         st.error(f"Error reading file: {str(e)}")
         return None
 
-def preprocess_code(code_content):
-    import_lines = []
-    other_lines = []
-    
-    import_pattern = re.compile(r'^import\s+(.+)$')
-    from_import_pattern = re.compile(r'^from\s+(\S+)\s+import\s+(.+)$')
-    
-    for line in code_content.split('\n'):
-        stripped_line = line.strip()
-        if stripped_line.startswith('import '):
-            match = import_pattern.match(stripped_line)
-            if match:
-                modules = match.group(1).split(',')
-                for module in modules:
-                    module = module.strip()
-                    if ' as ' in module:
-                        original, alias = module.split(' as ')
-                        import_lines.append(f"{alias.strip()} = custom_import('{original.strip()}')")
-                    else:
-                        import_lines.append(f"{module} = custom_import('{module}')")
-        elif stripped_line.startswith('from '):
-            match = from_import_pattern.match(stripped_line)
-            if match:
-                module, attributes = match.groups()
-                attrs = [attr.strip() for attr in attributes.split(',')]
-                for attr in attrs:
-                    if ' as ' in attr:
-                        original, alias = attr.split(' as ')
-                        import_lines.append(f"{alias.strip()} = custom_import('{module}').{original.strip()}")
-                    else:
-                        import_lines.append(f"{attr} = custom_import('{module}').{attr}")
-        else:
-            other_lines.append(line)
-    
-    return '\n'.join(import_lines + other_lines)
+def load_sandbox_code():
+    snapshot_id = st.query_params.get("snapshot") or st.session_state.get("sandbox_snapshot")
+    if snapshot_id:
+        code_content = sandbox_store.get(snapshot_id)
+        if code_content is not None:
+            return code_content
+        st.warning("This sandbox snapshot has expired, showing the last committed sandbox instead.")
+
+    # Fall back to the copy committed to the sandbox repository.
+    g = get_github_client(get_github_token())
+    repo = g.get_repo(f"{get_authenticated_login(g)}/streamcoder")
+    return get_file_content(repo, 'pages/sandbox.txt')
+
+# Profiled runs kept per session for comparison.
+PROFILE_HISTORY = int(environ.get("SANDBOX_PROFILE_HISTORY", "5"))
+
+def render_profile(profile, code_content):
+    """
+    Shows a run's profile under the output and keeps it in the session's
+    history of profiled runs, compared against the previous one.
+    """
+    history = st.session_state.setdefault("sandbox_profiles", [])
+    previous = history[-1] if history else None
+    history.append({
+        "Time": datetime.now().strftime("%H:%M:%S"),
+        "Code": hashlib.sha1(code_content.encode()).hexdigest()[:7],
+        "Wall (s)": round(profile["wall_time"], 3),
+        "CPU (s)": round(profile["cpu_time"], 3),
+        "Peak memory (MB)": round(profile["peak_bytes"] / 1024 / 1024, 1),
+    })
+    del history[:-PROFILE_HISTORY]
+
+    with st.expander("Profile", expanded=True):
+        wall_col, cpu_col, memory_col = st.columns(3)
+        for col, label, column, unit in (
+            (wall_col, "Wall time", "Wall (s)", "s"),
+            (cpu_col, "CPU time", "CPU (s)", "s"),
+            (memory_col, "Peak memory", "Peak memory (MB)", "MB"),
+        ):
+            value = history[-1][column]
+            # Lower is better, so increases show in red.
+            delta = f"{round(value - previous[column], 3):+g} {unit}" if previous else None
+            col.metric(label, f"{value:g} {unit}", delta=delta, delta_color="inverse")
+        if profile["lines"]:
+            st.markdown("**Hot lines** (share of sampled time, library calls counted on the line that made them)")
+            st.dataframe(
+                [{"Line": row["line"], "Share": f"{row['share']:.0%}", "Seconds": round(row["seconds"], 3), "Code": row["code"]} for row in profile["lines"]],
+                hide_index=True, width="stretch",
+            )
+        if profile["functions"]:
+            st.markdown("**Your functions and cells** (`<module>` is top-level code)")
+            st.dataframe(
+                [{"Function": row["function"], "Line": row["line"], "Calls": row["calls"], "Own (s)": round(row["own_s"], 4), "Total (s)": round(row["total_s"], 4)} for row in profile["functions"]],
+                hide_index=True, width="stretch",
+            )
+        if profile["library"]:
+            st.markdown("**Library functions** (by own time)")
+            st.dataframe(
+                [{"Function": row["function"], "Calls": row["calls"], "Own (s)": round(row["own_s"], 4), "Total (s)": round(row["total_s"], 4)} for row in profile["library"]],
+                hide_index=True, width="stretch",
+            )
+        if len(history) > 1:
+            st.markdown("**Recent profiled runs**")
+            st.dataframe(list(reversed(history)), hide_index=True, width="stretch")
 
 def execute_sandbox_code():
-    github_token = environ.get("HUBGIT_TOKEN")
-    g = Github(github_token)
+    # Incremental runs re-execute only changed cells (split at "# %%" lines or
+    # top-level statements) and the cells depending on them.
+    incremental = (
+        environ.get("SANDBOX_INCREMENTAL", "true").lower() in ("1", "true", "yes")
+        and environ.get("SANDBOX_IN_PROCESS", "").lower() not in ("1", "true", "yes")
+    )
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx else ""
+    if incremental and st.sidebar.button("Run all cells", help="Discard the kept state and run the whole script again."):
+        get_sandbox_pool().reset_session(session_id)
+    profile_runs = st.sidebar.toggle(
+        "Profile runs", key="sandbox_profile",
+        help="Measure time, peak memory and hot spots of the script. Profiling slows the run down.",
+    )
+    profile = None
     try:
-        repo = g.get_user().get_repo("streamcoder")
-        file_path = 'pages/sandbox.txt'
-        code_content = get_file_content(repo, file_path)
+        code_content = load_sandbox_code()
         if code_content is not None:
-            preprocessed_code = preprocess_code(code_content)
-            
-            #st.text_area("Preprocessed Code", preprocessed_code, height=300) #For debugging purposes
-            
-            global_env = {
-                "__builtins__": __builtins__,
-                "st": st,
-                "custom_import": custom_import
-            }
             try:
-                exec(preprocessed_code, global_env)
-                st.success("Code executed successfully!")
-            except Exception as e:
+                # Reruns triggered by widgets hit the code cache and skip parsing and compiling.
+                code, compile_time, cached = compile_sandbox_code(code_content)
+                cells = split_sandbox_cells(code_content) if incremental else None
+            except SyntaxError as e:
                 st.error(f"Error executing code: {str(e)}")
+                return
+
+            with span("sandbox.execute") as run_span:
+                run_span.set(bytes_out=len(code_content.encode()), cache_hit=cached)
+                if environ.get("SANDBOX_IN_PROCESS", "").lower() in ("1", "true", "yes"):
+                    global_env = {
+                        "__builtins__": __builtins__,
+                        "st": st,
+                        **make_import_helpers()
+                    }
+                    profiler = RunProfiler(code.co_filename, code_content) if profile_runs else None
+                    started = time.perf_counter()
+                    try:
+                        if profiler:
+                            with profiler:
+                                exec(code, global_env)
+                        else:
+                            exec(code, global_env)
+                        st.success("Code executed successfully!")
+                    except Exception as e:
+                        run_span.fail(e)
+                        st.error(f"Error executing code: {str(e)}")
+                    exec_time = time.perf_counter() - started
+                    profile = profiler.report() if profiler else None
+                else:
+                    # Run in a warm, resource-limited worker process; its st calls are served here.
+                    if incremental:
+                        # The session's worker keeps the state of unchanged cells between reruns.
+                        result = get_sandbox_pool().run_cells(session_id, cells, code_content, profile=profile_runs)
+                        run_span.set(cells_run=result.cells_run, cells_cached=result.cells_cached)
+                    else:
+                        result = get_sandbox_pool().run(code, code_content, profile=profile_runs)
+                    if result.ok:
+                        st.success("Code executed successfully!")
+                    else:
+                        run_span.fail(result.error)
+                        st.error(f"Error executing code: {result.error}")
+                        if result.traceback:
+                            with st.expander("Traceback"):
+                                st.code(result.traceback, language="python")
+                    exec_time = result.exec_time
+                    profile = result.profile
+            st.caption(
+                f"Compile: {compile_time * 1000:.1f} ms{' (cached)' if cached else ''} · "
+                f"Execution: {exec_time:.2f} s"
+                + (f" · Cells: {result.cells_run} run, {result.cells_cached} unchanged" if incremental else "")
+            )
+            if profile:
+                render_profile(profile, code_content)
     except Exception as e:
         st.error(f"Error: {str(e)}")
 
@@ -0,0 +1,109 @@
+# patch_utils.py
+
+import re
+from typing import List, Tuple
+
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER_MARKER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+_BLOCK_PATTERN = re.compile(
+    r"^<<<<<<< SEARCH[ \t]*\n(.*?)^=======[ \t]*\n(.*?)^>>>>>>> REPLACE[ \t]*$",
+    re.MULTILINE | re.DOTALL,
+)
+
+class PatchError(ValueError):
+    """
+    Raised when an LLM patch is malformed or does not apply to the current file.
+    """
+
+def parse_search_replace_blocks(patch_text: str) -> List[Tuple[str, str]]:
+    """
+    Parses SEARCH/REPLACE blocks from an LLM response.
+
+    Args:
+        patch_text (str): Response containing one or more blocks.
+
+    Returns:
+        List[Tuple[str, str]]: (search, replace) pairs in order of appearance.
+
+    Raises:
+        PatchError: If no complete block is found or markers are unbalanced.
+    """
+    blocks = [(search, replace) for search, replace in _BLOCK_PATTERN.findall(patch_text)]
+    if not blocks:
+        raise PatchError("No SEARCH/REPLACE blocks found in the response.")
+    if patch_text.count(SEARCH_MARKER) != len(blocks) or patch_text.count(REPLACE_MARKER) != len(blocks):
+        raise PatchError("Unbalanced SEARCH/REPLACE markers in the response.")
+    return blocks
+
+def _locate(content: str, search: str) -> Tuple[int, int]:
+    """
+    Finds the unique span of `search` in `content`, tolerating trailing whitespace
+    differences per line.
+    """
+    count = content.count(search)
+    if count == 1:
+        start = content.index(search)
+        return start, start + len(search)
+    if count > 1:
+        raise PatchError(f"SEARCH text matches {count} locations:\n{search}")
+
+    # Models often drop trailing spaces; retry line by line with rstrip().
+    search_lines = [line.rstrip() for line in search.splitlines()]
+    content_lines = content.splitlines(keepends=True)
+    matches = []
+    for i in range(len(content_lines) - len(search_lines) + 1):
+        window = content_lines[i:i + len(search_lines)]
+        if [line.rstrip() for line in window] == search_lines:
+            matches.append(i)
+    if len(matches) != 1:
+        reason = "does not match" if not matches else f"matches {len(matches)} locations"
+        raise PatchError(f"SEARCH text {reason}:\n{search}")
+    start = sum(len(line) for line in content_lines[:matches[0]])
+    end = start + sum(len(line) for line in content_lines[matches[0]:matches[0] + len(search_lines)])
+    return start, end
+
+def apply_search_replace_blocks(content: str, blocks: List[Tuple[str, str]]) -> str:
+    """
+    Applies SEARCH/REPLACE blocks to a file, one after the other.
+
+    An empty SEARCH section appends the REPLACE section to the end of the file.
+
+    Args:
+        content (str): Current file content.
+        blocks (List[Tuple[str, str]]): Parsed (search, replace) pairs.
+
+    Returns:
+        str: Patched file content.
+
+    Raises:
+        PatchError: If a SEARCH section is missing from the file or ambiguous.
+    """
+    for search, replace in blocks:
+        if not search.strip():
+            separator = "" if not content or content.endswith("\n") else "\n"
+            content = f"{content}{separator}{replace}"
+            continue
+        start, end = _locate(content, search)
+        # Keep the file's line ending after the block if the model left it off.
+        if content[start:end].endswith("\n") and replace and not replace.endswith("\n"):
+            replace += "\n"
+        content = content[:start] + replace + content[end:]
+    return content
+
+def apply_patch(content: str, patch_text: str) -> str:
+    """
+    Parses and applies an LLM patch response.
+
+    Args:
+        content (str): Current file content.
+        patch_text (str): LLM response with SEARCH/REPLACE blocks.
+
+    Returns:
+        str: Patched file content.
+
+    Raises:
+        PatchError: If the patch cannot be parsed or applied.
+    """
+    return apply_search_replace_blocks(content, parse_search_replace_blocks(patch_text))
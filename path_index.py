@@ -0,0 +1,301 @@
+# path_index.py
+
+import bisect
+import itertools
+import posixpath
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from metrics import timed
+
+# Matches returned per query.
+PATH_RESULTS = 50
+# Substring matches ranked per query; beyond this, shorter paths win.
+MAX_RANKED = 200
+# Tokens found in more than this fraction of segments or paths are matched by
+# scanning the joined paths instead.
+DENSE_FRACTION = 0.01
+# File names checked per fuzzy query, shortest paths first.
+MAX_FUZZY_CHECKS = 2000
+# Segment lookups kept per index; typing a query refines the previous lookup.
+_MAX_LOOKUPS = 64
+
+def _segments(postings: Dict[str, array]) -> Tuple[str, array]:
+    """
+    Joins segment strings into one newline-separated blob for C-speed scanning,
+    with the offset each segment starts at.
+    """
+    offsets = array("I")
+    offset = 0
+    for segment in postings:
+        offsets.append(offset)
+        offset += len(segment) + 1
+    return "\n".join(postings), offsets
+
+def _lines_containing(blob: str, offsets: array, needle: str) -> Iterator[int]:
+    """
+    Yields the numbers of the lines of a blob that contain a string, in order.
+    """
+    position = blob.find(needle)
+    while position >= 0:
+        line = bisect.bisect_right(offsets, position) - 1
+        yield line
+        if line + 1 >= len(offsets):
+            break
+        position = blob.find(needle, offsets[line + 1])
+
+class PathIndex:
+    """
+    Search index over the file paths of one repository tree.
+
+    Directories and file names are indexed as separate segment lists (a tree of
+    100k files has far fewer distinct ones), each with the ids of the paths it
+    occurs in. The most selective query token is looked up in the segment blobs
+    and only its candidate paths are checked against the other tokens; lookups
+    are kept, so each keystroke only filters the segments the previous one found.
+    Queries without enough substring hits fall back to subsequence matching of
+    file names ("ghops" finds "github_ops.py"), with candidates narrowed by
+    per-character postings.
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        # Shortest paths first: ids double as the tie-break rank.
+        self.paths = sorted(paths, key=lambda path: (len(path), path))
+        self._lower = [path.lower() for path in self.paths]
+        directories: Dict[str, array] = {}
+        names: Dict[str, array] = {}
+        for i, path in enumerate(self._lower):
+            directory, _, name = path.rpartition("/")
+            postings = directories.get(directory)
+            if postings is None:
+                directories[directory] = postings = array("I")
+            postings.append(i)
+            postings = names.get(name)
+            if postings is None:
+                names[name] = postings = array("I")
+            postings.append(i)
+        self._blob = "\n".join(self._lower)
+        self._offsets = array("I")
+        offset = 0
+        for path in self._lower:
+            self._offsets.append(offset)
+            offset += len(path) + 1
+        self._directories = list(directories.values())
+        self._directory_strings = list(directories)
+        self._directory_ids = {directory: i for i, directory in enumerate(self._directory_strings)}
+        self._directory_blob, self._directory_offsets = _segments(directories)
+        self._names = list(names.values())
+        self._name_strings = list(names)
+        self._name_blob, self._name_offsets = _segments(names)
+        self._lookups: "OrderedDict[str, Tuple[List[int], List[int]]]" = OrderedDict()
+        self._lookups_lock = threading.Lock()
+        self._name_chars: Dict[str, Set[int]] = {}
+        for i, name in enumerate(self._name_strings):
+            for char in set(name):
+                self._name_chars.setdefault(char, set()).add(i)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def siblings(self, path: str) -> List[str]:
+        """
+        Lists the files in the same directory as a path, in tree order.
+
+        Args:
+            path (str): File path.
+
+        Returns:
+            List[str]: Paths of the directory's files, including `path` if it exists.
+        """
+        directory = posixpath.dirname(path)
+        i = self._directory_ids.get(directory.lower())
+        if i is None:
+            return []
+        return sorted(self.paths[j] for j in self._directories[i] if posixpath.dirname(self.paths[j]) == directory)
+
+    def _segments_containing(self, part: str) -> Optional[Tuple[List[int], List[int]]]:
+        """
+        Returns the file names and directories containing a string, refining the
+        longest earlier lookup that is a substring of it; None if the string is
+        too common to be worth looking up.
+        """
+        with self._lookups_lock:
+            base = max((key for key in self._lookups if key in part), key=len, default=None)
+            if base == part:
+                self._lookups.move_to_end(part)
+                return self._lookups[part]
+            previous = self._lookups.get(base) if base is not None else None
+        if previous is None:
+            limit = int(len(self._lower) * DENSE_FRACTION)
+            names = list(itertools.islice(_lines_containing(self._name_blob, self._name_offsets, part), limit + 1))
+            directories = list(itertools.islice(
+                _lines_containing(self._directory_blob, self._directory_offsets, part), limit + 1 - len(names)
+            ))
+            if len(names) + len(directories) > limit:
+                return None
+        else:
+            names = [i for i in previous[0] if part in self._name_strings[i]]
+            directories = [i for i in previous[1] if part in self._directory_strings[i]]
+        with self._lookups_lock:
+            self._lookups[part] = (names, directories)
+            while len(self._lookups) > _MAX_LOOKUPS:
+                self._lookups.popitem(last=False)
+        return names, directories
+
+    def _candidates(self, token: str) -> Optional[Tuple[int, List[array], List[array]]]:
+        """
+        Finds the paths whose file name or directory contains a token.
+
+        Returns:
+            Optional[Tuple[int, List[array], List[array]]]: Number of candidates, and
+            the path ids of the matching file names and directories; None if the
+            token is too short or too common to look up.
+        """
+        # A token spanning "/" cannot match one segment; look up its longest part.
+        part = max(token.split("/"), key=len)
+        if len(part) < 3:
+            return None
+        segments = self._segments_containing(part)
+        if segments is None:
+            return None
+        names, directories = segments
+        by_name = [self._names[i] for i in names]
+        by_directory = [self._directories[i] for i in directories]
+        return sum(map(len, by_name)) + sum(map(len, by_directory)), by_name, by_directory
+
+    def _substring_matches(self, tokens: List[str]) -> List[int]:
+        """
+        Returns the ids of paths containing every token, best first.
+        """
+        # Walk the candidates of the most selective token and check the others.
+        candidates = [(self._candidates(token), token) for token in tokens]
+        found, token = min(
+            ((found, token) for found, token in candidates if found is not None),
+            key=lambda item: item[0][0], default=(None, max(tokens, key=len)),
+        )
+        if found is None and "/" not in token and token not in self._name_blob and token not in self._directory_blob:
+            # Short tokens are not looked up, but a token within one segment can
+            # be ruled out on the segment blobs, which are much smaller.
+            return []
+        if found is None or found[0] > len(self._lower) * DENSE_FRACTION:
+            # Common tokens: matches are dense, so scanning the joined paths
+            # shortest first reaches enough of them quickly.
+            ordered: Iterable[int] = _lines_containing(self._blob, self._offsets, token)
+        else:
+            # File name hits first, each part shortest first.
+            ordered = itertools.chain(
+                sorted(itertools.chain.from_iterable(found[1])), sorted(itertools.chain.from_iterable(found[2]))
+            )
+        matches, seen = [], set()
+        for i in ordered:
+            if i in seen:
+                continue
+            seen.add(i)
+            path = self._lower[i]
+            if all(token in path for token in tokens):
+                matches.append(i)
+                if len(matches) >= MAX_RANKED:
+                    break
+
+        def rank(i: int) -> Tuple[int, int, int]:
+            name = self._lower[i].rpartition("/")[2]
+            in_name = sum(token in name for token in tokens)
+            prefix = any(name.startswith(token) for token in tokens)
+            return -in_name, -prefix, i
+        return sorted(matches, key=rank)
+
+    def _fuzzy_matches(self, query: str, limit: int, exclude: Set[int]) -> List[int]:
+        """
+        Returns the ids of paths whose file name contains the query's characters
+        in order, tightest matches first.
+        """
+        postings = sorted((self._name_chars.get(char, set()) for char in set(query)), key=len)
+        names = postings[0].intersection(*postings[1:])
+        pattern = re.compile(".*?".join(re.escape(char) for char in query))
+        spans = []
+        # Name ids follow the paths' order, so the shortest paths are tried first.
+        for name in sorted(names)[:MAX_FUZZY_CHECKS]:
+            match = pattern.search(self._name_strings[name])
+            if match:
+                spans.append((match.end() - match.start(), name))
+                if len(spans) >= MAX_RANKED:
+                    break
+        ids = []
+        for _, name in sorted(spans):
+            ids += [i for i in self._names[name] if i not in exclude]
+            if len(ids) >= limit:
+                break
+        return ids[:limit]
+
+    @timed("path_index.search")
+    def search(self, query: str, limit: int = PATH_RESULTS) -> List[str]:
+        """
+        Finds the paths matching a query, best first.
+
+        Whitespace-separated tokens must all occur in the path; paths matching
+        them in the file name rank first, then shorter paths. If fewer than
+        `limit` paths match, paths containing the query's characters in order
+        are appended.
+
+        Args:
+            query (str): Search text, matched case-insensitively.
+            limit (int): Maximum number of paths to return.
+
+        Returns:
+            List[str]: Matching paths, at most `limit`. An empty query returns the
+            shortest paths.
+        """
+        tokens = query.lower().split()
+        if not tokens:
+            return self.paths[:limit]
+        matches = self._substring_matches(tokens)[:limit]
+        if len(matches) < limit:
+            matches += self._fuzzy_matches("".join(tokens), limit - len(matches), set(matches))
+        return [self.paths[i] for i in matches]
+
+def group_by_directory(paths: List[str]) -> List[Tuple[str, List[str]]]:
+    """
+    Groups ranked paths by directory, ordering the groups by their best match.
+
+    Args:
+        paths (List[str]): Paths, best first.
+
+    Returns:
+        List[Tuple[str, List[str]]]: Directory ("" for the root) and its paths.
+    """
+    groups: Dict[str, List[str]] = {}
+    for path in paths:
+        groups.setdefault(posixpath.dirname(path), []).append(path)
+    return list(groups.items())
+
+_indexes: "OrderedDict[Tuple[str, str], PathIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_MAX_INDEXES = 8
+
+@timed("path_index.build")
+def get_path_index(repo_name: str, head_sha: str, paths: Iterable[str]) -> PathIndex:
+    """
+    Returns the path index of a repository tree, building it once per head commit.
+
+    Args:
+        repo_name (str): Name of the repository.
+        head_sha (str): Commit SHA the paths were listed at.
+        paths (Iterable[str]): File paths of the tree.
+
+    Returns:
+        PathIndex: Index over the paths.
+    """
+    key = (repo_name, head_sha)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = PathIndex(paths)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > _MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
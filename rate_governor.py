@@ -0,0 +1,346 @@
+# rate_governor.py
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from os import environ
+from typing import Callable, Dict, Optional, Tuple
+from github import Auth, GithubException
+from github.GithubRetry import GithubRetry
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Below this fraction of the hourly quota, background requests are refused.
+RESERVE_FRACTION = float(environ.get("GITHUB_RESERVE_FRACTION", "0.1"))
+# Below this fraction, sessions are held to their fair share of the quota.
+FAIR_SHARE_FRACTION = float(environ.get("GITHUB_FAIR_SHARE_FRACTION", "0.5"))
+# A session's share never drops below this many requests per window.
+MIN_SESSION_SHARE = int(environ.get("GITHUB_MIN_SESSION_SHARE", "100"))
+# Sessions that made a request within this many seconds count as active.
+SESSION_ACTIVE_SECONDS = 600
+# Longest an interactive request waits out a secondary rate limit before failing.
+MAX_INTERACTIVE_WAIT = float(environ.get("GITHUB_MAX_WAIT_SECONDS", "30"))
+# Background requests hold back this long after any interactive request.
+BACKGROUND_YIELD_SECONDS = 0.5
+# A request that got no response within this many seconds no longer holds quota.
+RESERVATION_SECONDS = 120
+
+class RateLimitDeferred(GithubException):
+    """
+    Raised instead of sending a request the governor did not admit.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(429, {"message": message}, None)
+
+@dataclass
+class _Budget:
+    """
+    Quota state of one credential, shared by every session using it.
+
+    `reported` is the X-RateLimit-Remaining of the latest response; requests
+    admitted since but not answered yet hold a provisional reservation each.
+    """
+    reported: Optional[int] = None
+    reservations: deque = field(default_factory=deque)
+    limit: Optional[int] = None
+    reset: float = 0.0
+    blocked_until: float = 0.0
+    last_interactive: float = 0.0
+    used: Dict[str, int] = field(default_factory=dict)
+    last_seen: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.reported is None:
+            return None
+        return self.reported - len(self.reservations)
+
+_local = threading.local()
+
+def current_context() -> Tuple[str, str]:
+    """
+    Returns the (session id, priority) requests made from this thread are billed to:
+    an explicit `request_scope`, else the Streamlit session running the script
+    (interactive), else an anonymous background job.
+    """
+    scope = getattr(_local, "scope", None)
+    if scope is not None:
+        return scope
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        return ctx.session_id, INTERACTIVE
+    return BACKGROUND, BACKGROUND
+
+@contextmanager
+def request_scope(session_id: str, priority: str):
+    """
+    Bills GitHub requests made inside the block to a session and priority.
+
+    Args:
+        session_id (str): Streamlit session id.
+        priority (str): INTERACTIVE or BACKGROUND.
+    """
+    previous = getattr(_local, "scope", None)
+    _local.scope = (session_id, priority)
+    try:
+        yield
+    finally:
+        _local.scope = previous
+
+def bind(fn: Callable, priority: Optional[str] = None) -> Callable:
+    """
+    Wraps a callable for a worker thread so its GitHub requests are billed to the
+    session (and, unless overridden, the priority) of the calling thread.
+
+    Args:
+        fn (Callable): Function to run in the worker.
+        priority (Optional[str]): Priority override, e.g. BACKGROUND for prefetching.
+
+    Returns:
+        Callable: Wrapped function.
+    """
+    session_id, caller_priority = current_context()
+    scope = (session_id, priority or caller_priority)
+
+    def bound(*args, **kwargs):
+        with request_scope(*scope):
+            return fn(*args, **kwargs)
+    return bound
+
+class RateGovernor:
+    """
+    Admission control for every GitHub request made with a shared credential.
+
+    Interactive requests always go ahead while quota is left; background requests
+    yield to interactive traffic and are refused once the quota runs low. When the
+    quota is contended, each active session is held to an equal share of it, and
+    secondary rate limits pause everyone for a jittered backoff.
+    """
+
+    def __init__(self):
+        self._budgets: Dict[str, _Budget] = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, credential: str) -> _Budget:
+        budget = self._budgets.get(credential)
+        if budget is None:
+            budget = self._budgets[credential] = _Budget()
+        return budget
+
+    @staticmethod
+    def _share(budget: _Budget, now: float) -> int:
+        active = sum(1 for seen in budget.last_seen.values() if now - seen < SESSION_ACTIVE_SECONDS)
+        return max(MIN_SESSION_SHARE, (budget.limit or 0) // max(1, active))
+
+    def observe(self, credential: str, remaining: int, limit: int, reset: float) -> None:
+        """
+        Records the quota reported by a response's X-RateLimit-* headers. The
+        header is authoritative: it replaces the local estimate on every response.
+
+        Args:
+            credential (str): Credential fingerprint.
+            remaining (int): X-RateLimit-Remaining.
+            limit (int): X-RateLimit-Limit.
+            reset (float): X-RateLimit-Reset (epoch seconds).
+        """
+        if limit < 0:
+            return  # no response yet
+        with self._lock:
+            budget = self._budget(credential)
+            if reset != budget.reset:
+                # A new window: forget the per-session usage of the last one.
+                budget.used.clear()
+            budget.reported, budget.limit, budget.reset = remaining, limit, reset
+
+    def settle(self, credential: str, status: int) -> None:
+        """
+        Releases the reservation of a request once its response arrived. A 304
+        Not Modified costs no quota, so it is not billed to the session either.
+
+        Args:
+            credential (str): Credential fingerprint.
+            status (int): HTTP status of the response.
+        """
+        session_id = current_context()[0]
+        with self._lock:
+            budget = self._budget(credential)
+            if budget.reservations:
+                budget.reservations.popleft()
+            if status == 304 and budget.used.get(session_id):
+                budget.used[session_id] -= 1
+
+    def admit(self, credential: str) -> None:
+        """
+        Blocks until the next request of the calling thread may be sent.
+
+        Args:
+            credential (str): Credential fingerprint.
+
+        Raises:
+            RateLimitDeferred: If the request must not be sent now.
+        """
+        session_id, priority = current_context()
+        while True:
+            with self._lock:
+                budget = self._budget(credential)
+                now = time.time()
+                if budget.reset and now >= budget.reset:
+                    # The window rolled over; the next response reports the new one.
+                    budget.used.clear()
+                    budget.reservations.clear()
+                    budget.reported, budget.reset = budget.limit, 0.0
+                while budget.reservations and now - budget.reservations[0] > RESERVATION_SECONDS:
+                    # Failed requests never settle.
+                    budget.reservations.popleft()
+                wait = max(0.0, budget.blocked_until - now)
+                if priority == BACKGROUND:
+                    if wait or self._low(budget, RESERVE_FRACTION) or self._over_share(budget, session_id, now):
+                        raise RateLimitDeferred("GitHub quota is reserved for interactive requests.")
+                    wait = max(0.0, budget.last_interactive + BACKGROUND_YIELD_SECONDS - now)
+                else:
+                    if budget.remaining is not None and budget.remaining <= 0:
+                        raise RateLimitDeferred(f"GitHub rate limit exhausted, resets in {self._minutes(budget, now)} min.")
+                    if self._low(budget, FAIR_SHARE_FRACTION) and self._over_share(budget, session_id, now):
+                        raise RateLimitDeferred(
+                            f"This session used its share of the shared GitHub quota, resets in {self._minutes(budget, now)} min."
+                        )
+                    if wait > MAX_INTERACTIVE_WAIT:
+                        raise RateLimitDeferred(f"GitHub asked to slow down, retry in {wait:.0f} s.")
+                    budget.last_interactive = now
+                if not wait:
+                    budget.used[session_id] = budget.used.get(session_id, 0) + 1
+                    budget.last_seen[session_id] = now
+                    # Provisional until the response's headers report the real quota.
+                    budget.reservations.append(now)
+                    return
+            time.sleep(wait)
+
+    @staticmethod
+    def _low(budget: _Budget, fraction: float) -> bool:
+        return budget.remaining is not None and budget.limit is not None and budget.remaining < budget.limit * fraction
+
+    def _over_share(self, budget: _Budget, session_id: str, now: float) -> bool:
+        return budget.limit is not None and budget.used.get(session_id, 0) >= self._share(budget, now)
+
+    @staticmethod
+    def _minutes(budget: _Budget, now: float) -> int:
+        return max(0, int((budget.reset - now) // 60) + 1)
+
+    def back_off(self, credential: str, delay: float) -> float:
+        """
+        Pauses every request of a credential after a secondary rate limit.
+
+        Args:
+            credential (str): Credential fingerprint.
+            delay (float): Base delay in seconds (Retry-After or retry backoff).
+
+        Returns:
+            float: Jittered delay actually applied.
+        """
+        # Jitter keeps sessions that were throttled together from retrying in lockstep.
+        jittered = delay * random.uniform(1.0, 1.5) + random.uniform(0, 1)
+        with self._lock:
+            budget = self._budget(credential)
+            budget.blocked_until = max(budget.blocked_until, time.time() + jittered)
+        logging.warning(f"GitHub secondary rate limit, backing off {jittered:.1f}s.")
+        return jittered
+
+    def snapshot(self, credential: str, session_id: Optional[str] = None) -> Dict[str, Optional[float]]:
+        """
+        Returns the quota state for display.
+
+        Args:
+            credential (str): Credential fingerprint.
+            session_id (Optional[str]): Session to report usage for, defaults to the caller's.
+
+        Returns:
+            Dict[str, Optional[float]]: remaining, limit, reset_in (seconds),
+            blocked_for (seconds), session_used and session_share.
+        """
+        session_id = session_id or current_context()[0]
+        with self._lock:
+            budget = self._budget(credential)
+            now = time.time()
+            return {
+                "remaining": budget.remaining,
+                "limit": budget.limit,
+                "reset_in": max(0.0, budget.reset - now) if budget.reset else None,
+                "blocked_for": max(0.0, budget.blocked_until - now),
+                "session_used": budget.used.get(session_id, 0),
+                "session_share": self._share(budget, now) if budget.limit else None,
+            }
+
+governor = RateGovernor()
+
+class GovernedToken(Auth.Token):
+    """
+    Token auth that passes every PyGithub request through the governor. PyGithub
+    calls `authentication()` right before sending each request, and keeps the
+    X-RateLimit-* headers of the latest response on its requester.
+    """
+
+    def __init__(self, token: str, credential: str):
+        super().__init__(token)
+        self.credential = credential
+        self.requester = None
+
+    def authentication(self, headers: dict) -> None:
+        if self.requester is not None:
+            remaining, limit = self.requester.rate_limiting
+            governor.observe(self.credential, remaining, limit, self.requester.rate_limiting_resettime)
+        governor.admit(self.credential)
+        super().authentication(headers)
+
+class GovernedRetry(GithubRetry):
+    """
+    GithubRetry whose waits are jittered and shared with the governor, so other
+    sessions pause too instead of running into the same secondary limit.
+    """
+
+    def __init__(self, credential: str = "", **kwargs):
+        self.credential = credential
+        super().__init__(**kwargs)
+
+    def new(self, **kwargs):
+        kwargs["credential"] = self.credential
+        return super().new(**kwargs)
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        # urllib3 asks this for every response, which makes it the place to settle the request.
+        governor.settle(self.credential, status_code)
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def sleep(self, response=None) -> None:
+        delay = (self.get_retry_after(response) if response is not None else None) or self.get_backoff_time()
+        if delay <= 0:
+            return
+        # Never park a request thread until a primary limit resets; the retry then fails fast.
+        time.sleep(min(governor.back_off(self.credential, delay), MAX_INTERACTIVE_WAIT))
+
+def observe_headers(credential: str, status: int, headers) -> None:
+    """
+    Settles a request made outside PyGithub and feeds its X-RateLimit-* headers
+    to the governor.
+
+    Args:
+        credential (str): Credential fingerprint.
+        status (int): HTTP status of the response.
+        headers: Response headers (case-insensitive mapping).
+    """
+    governor.settle(credential, status)
+    try:
+        governor.observe(
+            credential,
+            int(float(headers["X-RateLimit-Remaining"])),
+            int(float(headers["X-RateLimit-Limit"])),
+            float(headers["X-RateLimit-Reset"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        pass
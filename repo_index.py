@@ -0,0 +1,439 @@
+# repo_index.py
+
+import ast
+import functools
+import hashlib
+import logging
+import math
+import posixpath
+import re
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from os import environ
+from typing import Dict, List, Optional, Set, Tuple
+from github import Github
+from github_ops import fetch_files, list_file_entries
+from metrics import annotate_current_span, timed
+from rate_governor import BACKGROUND, bind
+from token_utils import estimate_tokens
+
+# Files with these extensions are indexed; Python files are also parsed for symbols and imports.
+INDEX_EXTENSIONS = {".py", ".pyi", ".md", ".rst", ".txt", ".toml", ".cfg", ".ini", ".yaml", ".yml", ".json", ".js", ".ts"}
+# At most this many files (smallest first) of at most this size are indexed per repository.
+INDEX_MAX_FILES = int(environ.get("INDEX_MAX_FILES", "2000"))
+INDEX_MAX_FILE_BYTES = int(float(environ.get("INDEX_MAX_FILE_KB", "256")) * 1024)
+# Lines per chunk for files that are not split along definitions.
+CHUNK_LINES = 40
+# Definitions longer than this are split into windows of CHUNK_LINES.
+MAX_CHUNK_LINES = 120
+
+# BM25 parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Score bonuses on top of BM25 for code the current file depends on directly.
+IMPORTED_SYMBOL_BOOST = 8.0
+IMPORTED_FILE_BOOST = 2.0
+REFERENCED_SYMBOL_BOOST = 1.0
+
+_STOPWORDS = {
+    "def", "class", "self", "cls", "return", "import", "from", "as", "if", "else", "elif", "for",
+    "in", "is", "not", "and", "or", "none", "true", "false", "with", "try", "except", "finally",
+    "raise", "pass", "lambda", "yield", "while", "the", "to", "of", "a", "an", "str", "int", "py",
+}
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+def terms(text: str) -> List[str]:
+    """
+    Splits text into lowercase search terms: whole identifiers plus their
+    snake_case and camelCase parts, without keywords and stop words.
+
+    Args:
+        text (str): Code or prose.
+
+    Returns:
+        List[str]: Terms, with repetitions.
+    """
+    result = []
+    for identifier in _IDENTIFIER.findall(text):
+        result.extend(_identifier_terms(identifier))
+    return result
+
+@functools.lru_cache(maxsize=65536)
+def _identifier_terms(identifier: str) -> Tuple[str, ...]:
+    lowered = identifier.lower()
+    parts = [part.lower() for word in identifier.split("_") for part in _CAMEL.findall(word)]
+    candidates = ([lowered] if len(parts) != 1 or parts[0] != lowered else []) + parts
+    return tuple(term for term in candidates if len(term) > 1 and term not in _STOPWORDS)
+
+@dataclass
+class Chunk:
+    """
+    A contiguous piece of a file that is scored and sent as a unit.
+
+    Attributes:
+        path (str): File path.
+        start (int): First line (1-based).
+        end (int): Last line (inclusive).
+        text (str): Lines start to end.
+        symbols (Set[str]): Names defined in the chunk.
+        tokens (int): Estimated token count of the text.
+        term_counts (Counter): Search term frequencies.
+    """
+    path: str
+    start: int
+    end: int
+    text: str
+    symbols: Set[str] = field(default_factory=set)
+    tokens: int = 0
+    term_counts: Counter = field(default_factory=Counter)
+
+@dataclass
+class FileIndex:
+    """
+    Chunks, imported modules and defined symbols of one file version.
+    """
+    path: str
+    chunks: List[Chunk]
+    imports: List[Tuple[str, int, List[str]]]  # (module, relative level, imported names)
+    symbols: Set[str]
+
+def _line_chunks(path: str, lines: List[str], start: int, end: int, symbols: Set[str] = frozenset()) -> List[Chunk]:
+    """
+    Splits lines start..end (1-based, inclusive) into chunks of CHUNK_LINES.
+    """
+    chunks = []
+    for first in range(start, end + 1, CHUNK_LINES):
+        last = min(end, first + CHUNK_LINES - 1)
+        text = "".join(lines[first - 1:last])
+        if text.strip():
+            chunks.append(Chunk(path, first, last, text, set(symbols)))
+    return chunks
+
+def _python_structure(path: str, text: str) -> Tuple[List[Chunk], List[Tuple[str, int, List[str]]], Set[str]]:
+    """
+    Chunks a Python file along its top-level definitions and collects its imports.
+
+    Raises:
+        SyntaxError: If the file does not parse.
+    """
+    tree = ast.parse(text)
+    lines = text.splitlines(keepends=True)
+    chunks, imports, symbols = [], [], set()
+    pending_start = None  # first line of a run of module-level statements
+
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imports.extend((alias.name, 0, []) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append((node.module or "", node.level, [alias.name for alias in node.names]))
+
+        start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+        end = node.end_lineno or node.lineno
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if pending_start is not None:
+                chunks.extend(_line_chunks(path, lines, pending_start, start - 1))
+                pending_start = None
+            defined = {node.name}
+            if isinstance(node, ast.ClassDef):
+                defined |= {item.name for item in node.body if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))}
+            symbols |= defined
+            if end - start + 1 <= MAX_CHUNK_LINES:
+                chunks.append(Chunk(path, start, end, "".join(lines[start - 1:end]), defined))
+            else:
+                chunks.extend(_line_chunks(path, lines, start, end, defined))
+        else:
+            for target in getattr(node, "targets", [getattr(node, "target", None)]):
+                if isinstance(target, ast.Name):
+                    symbols.add(target.id)
+            if pending_start is None:
+                pending_start = start
+    if pending_start is not None:
+        chunks.extend(_line_chunks(path, lines, pending_start, len(lines)))
+    return chunks, imports, symbols
+
+# Analysis of a file version depends only on its blob, so it is shared across
+# repositories and survives commits that do not touch the file.
+_analyses: "OrderedDict[Tuple[str, str], FileIndex]" = OrderedDict()
+_analyses_lock = threading.Lock()
+_MAX_ANALYSES = 20000
+
+def analyze_file(path: str, text: str, sha: Optional[str] = None) -> FileIndex:
+    """
+    Splits a file into chunks and extracts its symbols and imports.
+
+    Args:
+        path (str): File path.
+        text (str): File content.
+        sha (Optional[str]): Blob SHA; when given the analysis is cached under it.
+
+    Returns:
+        FileIndex: The analysis.
+    """
+    if sha:
+        with _analyses_lock:
+            cached = _analyses.get((path, sha))
+            if cached is not None:
+                _analyses.move_to_end((path, sha))
+                return cached
+
+    chunks, imports, symbols = None, [], set()
+    if path.endswith((".py", ".pyi")):
+        try:
+            chunks, imports, symbols = _python_structure(path, text)
+        except (SyntaxError, ValueError):
+            chunks = None
+    if chunks is None:
+        lines = text.splitlines(keepends=True)
+        chunks = _line_chunks(path, lines, 1, len(lines))
+    for chunk in chunks:
+        chunk.tokens = estimate_tokens(chunk.text)
+        # The path is searchable too, so "the config loader" finds config/loader.py.
+        chunk.term_counts = Counter(terms(chunk.text) + terms(path))
+    analysis = FileIndex(path, chunks, imports, symbols)
+
+    if sha:
+        with _analyses_lock:
+            _analyses[(path, sha)] = analysis
+            while len(_analyses) > _MAX_ANALYSES:
+                _analyses.popitem(last=False)
+    return analysis
+
+def module_names(path: str) -> List[str]:
+    """
+    Returns the dotted module names a Python file can be imported as, e.g.
+    "src/pkg/mod.py" -> ["src.pkg.mod", "pkg.mod"].
+    """
+    stem = path[:-len(posixpath.splitext(path)[1])]
+    if stem.endswith("/__init__"):
+        stem = stem[:-len("/__init__")]
+    parts = stem.split("/")
+    names = [".".join(parts)]
+    # Source roots that are not packages themselves.
+    if len(parts) > 1 and parts[0] in ("src", "lib", "python"):
+        names.append(".".join(parts[1:]))
+    return names
+
+@dataclass
+class Snippet:
+    """
+    A chunk chosen for a prompt, with its relevance score.
+    """
+    chunk: Chunk
+    score: float
+
+class RepoIndex:
+    """
+    Lexical (BM25) index over the chunks of a repository's text files, plus a
+    module map for resolving the imports of the file being edited.
+
+    Args:
+        files (Dict[str, FileIndex]): Analyses by path.
+    """
+
+    def __init__(self, files: Dict[str, FileIndex]):
+        self.files = files
+        self.chunks = [chunk for analysis in files.values() for chunk in analysis.chunks]
+        self.modules: Dict[str, str] = {}
+        for path in files:
+            if path.endswith((".py", ".pyi")):
+                for name in module_names(path):
+                    self.modules.setdefault(name, path)
+        self.document_frequency: Counter = Counter()
+        for chunk in self.chunks:
+            self.document_frequency.update(chunk.term_counts.keys())
+        self.average_length = (
+            sum(sum(chunk.term_counts.values()) for chunk in self.chunks) / len(self.chunks) if self.chunks else 0.0
+        )
+
+    def resolve_import(self, current_path: str, module: str, level: int, names: List[str]) -> List[str]:
+        """
+        Maps an import statement of the current file to repository paths.
+
+        Args:
+            current_path (str): Path of the importing file.
+            module (str): Imported module ("" for `from . import x`).
+            level (int): Number of leading dots of a relative import.
+            names (List[str]): Names imported with `from ... import`.
+
+        Returns:
+            List[str]: Paths of the imported modules (submodules named in `names` included).
+        """
+        if level:
+            package = posixpath.dirname(current_path).split("/") if posixpath.dirname(current_path) else []
+            package = package[:len(package) - (level - 1)] if level > 1 else package
+            module = ".".join([part for part in package if part] + ([module] if module else []))
+        candidates = [module] + [f"{module}.{name}" if module else name for name in names]
+        return [self.modules[candidate] for candidate in candidates if candidate in self.modules]
+
+    def _bm25(self, query: Counter, chunk: Chunk) -> float:
+        length = sum(chunk.term_counts.values())
+        score = 0.0
+        for term, weight in query.items():
+            frequency = chunk.term_counts.get(term)
+            if not frequency:
+                continue
+            documents = self.document_frequency[term]
+            idf = math.log(1 + (len(self.chunks) - documents + 0.5) / (documents + 0.5))
+            norm = frequency * (BM25_K1 + 1) / (
+                frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / (self.average_length or 1))
+            )
+            score += weight * idf * norm
+        return score
+
+    @timed("repo_index.select")
+    def select(self, current_path: str, current_text: str, prompt: str, budget_tokens: int) -> List[Snippet]:
+        """
+        Picks the chunks of other files most relevant to a prompt about the
+        current file, within a token budget.
+
+        Chunks are ranked by BM25 against the prompt, with bonuses for definitions
+        the current file imports by name, for other code of modules it imports and
+        for definitions of names it uses.
+
+        Args:
+            current_path (str): Path of the file being edited (excluded from the result).
+            current_text (str): Its current content, which may differ from the indexed one.
+            prompt (str): User prompt.
+            budget_tokens (int): Maximum estimated tokens of the selected chunk texts.
+
+        Returns:
+            List[Snippet]: Chosen chunks in path and line order.
+        """
+        if budget_tokens <= 0 or not self.chunks:
+            return []
+        current = analyze_file(current_path or "untitled.py", current_text)
+        imported_files: Set[str] = set()
+        imported_symbols: Set[str] = set()
+        for module, level, names in current.imports:
+            imported_files.update(self.resolve_import(current_path, module, level, names))
+            imported_symbols.update(names)
+        referenced = {term for chunk in current.chunks for term in chunk.term_counts}
+
+        query = Counter(terms(prompt))
+
+        ranked = []
+        for chunk in self.chunks:
+            if chunk.path == current_path:
+                continue
+            score = self._bm25(query, chunk)
+            if chunk.symbols & imported_symbols and chunk.path in imported_files:
+                score += IMPORTED_SYMBOL_BOOST
+            elif chunk.path in imported_files:
+                score += IMPORTED_FILE_BOOST
+            score += REFERENCED_SYMBOL_BOOST * len({symbol.lower() for symbol in chunk.symbols} & referenced)
+            if score > 0:
+                ranked.append(Snippet(chunk, score))
+        ranked.sort(key=lambda snippet: snippet.score, reverse=True)
+
+        chosen, used = [], 0
+        for snippet in ranked:
+            if used + snippet.chunk.tokens <= budget_tokens:
+                chosen.append(snippet)
+                used += snippet.chunk.tokens
+        annotate_current_span(tokens_out=used)
+        return sorted(chosen, key=lambda snippet: (snippet.chunk.path, snippet.chunk.start))
+
+def format_context(snippets: List[Snippet]) -> str:
+    """
+    Renders chosen snippets as a prompt section.
+
+    Args:
+        snippets (List[Snippet]): Output of `RepoIndex.select`.
+
+    Returns:
+        str: Prompt text, empty if there are no snippets.
+    """
+    if not snippets:
+        return ""
+    parts = ["Relevant excerpts from other files of the repository, for reference only:"]
+    for snippet in snippets:
+        chunk = snippet.chunk
+        parts.append(f"# {chunk.path}, lines {chunk.start}-{chunk.end}\n{chunk.text.rstrip()}")
+    return "\n\n".join(parts)
+
+def _indexable(path: str, size: int) -> bool:
+    # The working copy reports size 0 for blobs it has not downloaded; empty files index to nothing anyway.
+    return posixpath.splitext(path)[1].lower() in INDEX_EXTENSIONS and size <= INDEX_MAX_FILE_BYTES
+
+_indexes: "OrderedDict[Tuple[str, str], RepoIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_MAX_INDEXES = 8
+_build_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="repo-index")
+_building: Set[Tuple[str, str]] = set()
+
+def get_repo_index(g: Github, repo_name: str) -> Optional[RepoIndex]:
+    """
+    Returns the index of a repository's default branch without waiting for it.
+    A missing index is built in the background (see `warm_repo_index`); until
+    it is ready the previous index of the repository is returned, if any.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+
+    Returns:
+        Optional[RepoIndex]: The index, or None if it is not built yet or the
+        repository cannot be listed.
+    """
+    entries = list_file_entries(g, repo_name)
+    if not entries:
+        return None
+    # Smallest files first: more files fit, and huge generated files rarely help.
+    wanted = sorted(
+        ((path, sha, size) for path, (sha, size) in entries.items() if _indexable(path, size)),
+        key=lambda entry: entry[2],
+    )[:INDEX_MAX_FILES]
+    key = (repo_name, hashlib.sha1("".join(f"{path}{sha}" for path, sha, _ in sorted(wanted)).encode()).hexdigest())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+        if key not in _building:
+            _building.add(key)
+            _build_executor.submit(bind(_build_index, priority=BACKGROUND), g, repo_name, key, wanted)
+        return next((index for (name, _), index in reversed(_indexes.items()) if name == repo_name), None)
+
+def warm_repo_index(g: Github, repo_name: str) -> None:
+    """
+    Starts building the index of a repository in the background, so that
+    repository context is ready by the first generation.
+
+    Args:
+        g (Github): Authenticated GitHub client.
+        repo_name (str): Name of the repository.
+    """
+    try:
+        get_repo_index(g, repo_name)
+    except Exception as e:
+        logging.debug(f"Warming the index of '{repo_name}' failed: {e}")
+
+@timed("repo_index.build")
+def _build_index(g: Github, repo_name: str, key: Tuple[str, str], wanted: List[Tuple[str, str, int]]) -> None:
+    """
+    Builds an index from the files in `wanted`. Files come through the blob
+    cache, and unchanged blobs keep their analysis, so rebuilding after a
+    commit is cheap. Runs in a worker thread.
+    """
+    try:
+        files = fetch_files(g, repo_name, [path for path, _, _ in wanted], max_bytes=INDEX_MAX_FILE_BYTES)
+        analyses = {}
+        for path, file in files.items():
+            if file.binary or file.truncated:
+                continue
+            analyses[path] = analyze_file(path, file.text, file.sha)
+        index = RepoIndex(analyses)
+        annotate_current_span(bytes_in=sum(len(file.data) for file in files.values()))
+        logging.info(f"Indexed {len(analyses)} files ({len(index.chunks)} chunks) of '{repo_name}'.")
+        with _indexes_lock:
+            _indexes[key] = index
+            while len(_indexes) > _MAX_INDEXES:
+                _indexes.popitem(last=False)
+    except Exception as e:
+        logging.exception(f"Indexing '{repo_name}' failed: {e}")
+    finally:
+        with _indexes_lock:
+            _building.discard(key)
@@ -0,0 +1,358 @@
+# sandbox_compiler.py
+
+import ast
+import hashlib
+import importlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import CodeType
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+# Lines that start a new cell, as in "percent"-format scripts (Jupytext, VS Code).
+_CELL_MARKER = re.compile(r"^#\s*%%")
+# Methods that usually change their object in place. Calls to them, and calls
+# passing `inplace=True`, count as changing the object's variable.
+_MUTATING_METHODS = frozenset({
+    "append", "extend", "insert", "pop", "remove", "clear", "update", "sort", "reverse", "add",
+    "discard", "setdefault", "popitem", "fit", "partial_fit", "fit_transform", "set_params",
+    "set_index", "reset_index", "rename", "fillna", "dropna", "drop", "drop_duplicates", "replace",
+    "sort_values", "sort_index", "set_axis", "resize", "fill", "seed",
+})
+
+class ImportRewriter(ast.NodeTransformer):
+    """
+    Rewrites absolute imports anywhere in the sandbox script into calls to the
+    sandbox's `custom_import` / `custom_import_from` helpers, keeping the original
+    line numbers. Relative, star and `__future__` imports are left untouched.
+    """
+
+    def visit_Import(self, node: ast.Import):
+        statements = []
+        for alias in node.names:
+            if alias.asname:
+                # import a.b as c  ->  c = custom_import('a.b')
+                statements.append(self._assign(alias.asname, self._call("custom_import", alias.name)))
+            else:
+                top_level = alias.name.split(".")[0]
+                if top_level != alias.name:
+                    # import a.b  ->  custom_import('a.b'); a = custom_import('a')
+                    statements.append(ast.Expr(self._call("custom_import", alias.name)))
+                statements.append(self._assign(top_level, self._call("custom_import", top_level)))
+        return [ast.copy_location(statement, node) for statement in statements]
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.level or node.module == "__future__" or any(alias.name == "*" for alias in node.names):
+            return node
+        statements = [
+            self._assign(alias.asname or alias.name, self._call("custom_import_from", node.module, alias.name))
+            for alias in node.names
+        ]
+        return [ast.copy_location(statement, node) for statement in statements]
+
+    @staticmethod
+    def _call(helper: str, *arguments: str) -> ast.Call:
+        return ast.Call(
+            func=ast.Name(id=helper, ctx=ast.Load()),
+            args=[ast.Constant(value=argument) for argument in arguments],
+            keywords=[],
+        )
+
+    @staticmethod
+    def _assign(name: str, value: ast.expr) -> ast.Assign:
+        return ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=value)
+
+def preprocess_code(code_content: str, filename: str = "<sandbox>") -> ast.Module:
+    """
+    Parses sandbox code and routes its imports through the sandbox helpers.
+
+    Args:
+        code_content (str): Sandbox source code.
+        filename (str): Name used in syntax errors.
+
+    Returns:
+        ast.Module: Rewritten module, ready to compile.
+
+    Raises:
+        SyntaxError: If the code does not parse.
+    """
+    tree = ImportRewriter().visit(ast.parse(code_content, filename=filename))
+    return ast.fix_missing_locations(tree)
+
+def make_import_helpers(resolve: Optional[Callable[[str], object]] = None) -> Dict[str, Callable]:
+    """
+    Builds the `custom_import` / `custom_import_from` helpers the rewritten code calls.
+
+    Args:
+        resolve (Optional[Callable[[str], object]]): Module resolver, defaults to
+            importlib.import_module.
+
+    Returns:
+        Dict[str, Callable]: Helpers to merge into the execution globals.
+    """
+    custom_import = resolve or importlib.import_module
+
+    def custom_import_from(module_name: str, name: str):
+        module = custom_import(module_name)
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            # `from package import submodule` where the submodule is not loaded yet.
+            try:
+                return custom_import(f"{module_name}.{name}")
+            except ImportError:
+                raise ImportError(f"cannot import name '{name}' from '{module_name}'") from None
+
+    return {"custom_import": custom_import, "custom_import_from": custom_import_from}
+
+class _CodeCache:
+    """
+    Bounded LRU of compiled sandbox code objects keyed by a hash of the source.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            code = self._entries.get(key)
+            if code is not None:
+                self._entries.move_to_end(key)
+            return code
+
+    def put(self, key: str, code: Any) -> None:
+        with self._lock:
+            self._entries[key] = code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+_code_cache = _CodeCache()
+_cells_cache = _CodeCache()
+
+def compile_sandbox_code(code_content: str, filename: str = "<sandbox>") -> Tuple[CodeType, float, bool]:
+    """
+    Preprocesses and compiles sandbox code, reusing the code object for source it
+    has seen before, so widget-triggered reruns skip parsing and compilation.
+
+    Args:
+        code_content (str): Sandbox source code.
+        filename (str): Name used in tracebacks.
+
+    Returns:
+        Tuple[CodeType, float, bool]: Code object, seconds spent compiling and
+        whether it came from the cache.
+
+    Raises:
+        SyntaxError: If the code does not parse.
+    """
+    started = time.perf_counter()
+    key = hashlib.sha256(f"{filename}\0{code_content}".encode()).hexdigest()
+    code = _code_cache.get(key)
+    if code is not None:
+        return code, time.perf_counter() - started, True
+    code = compile(preprocess_code(code_content, filename), filename, "exec")
+    _code_cache.put(key, code)
+    return code, time.perf_counter() - started, False
+
+@dataclass(frozen=True)
+class SandboxCell:
+    """
+    One cell of a sandbox script with the global names it reads and writes.
+
+    Attributes:
+        key (str): Hash of the cell's code, ignoring comments, formatting and line numbers.
+        code (CodeType): Compiled cell, with the script's line numbers.
+        first_line (int): Line the cell starts at.
+        writes (FrozenSet[str]): Global names the cell binds, deletes or may change in place.
+        mutates (FrozenSet[str]): Global names the cell, or a function it defines,
+            may change in place.
+        providers (Tuple[int, ...]): Indexes of the cells that wrote the names this
+            cell reads, including the names read by the functions it uses: the
+            last earlier writer of each name, else the last later one.
+    """
+    key: str
+    code: CodeType
+    first_line: int
+    writes: FrozenSet[str]
+    mutates: FrozenSet[str]
+    providers: Tuple[int, ...]
+
+class _CellNames(ast.NodeVisitor):
+    """
+    Collects the global names a cell reads, binds and may change in place. Names
+    bound inside functions, classes, lambdas and comprehensions are local to them
+    and ignored; names read there are deferred reads, made whenever the function
+    is called, and globals changed in place there count as the cell's own.
+    """
+
+    def __init__(self):
+        self.reads: Set[str] = set()
+        self.deferred: Set[str] = set()
+        self.writes: Set[str] = set()
+        self.mutates: Set[str] = set()
+        self._depth = 0
+        # Names bound in each enclosing function, class, lambda or comprehension.
+        self._scopes: List[Set[str]] = []
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            (self.reads if self._depth == 0 else self.deferred).add(node.id)
+        elif self._depth == 0:
+            self.writes.add(node.id)
+
+    def visit_Global(self, node: ast.Global):
+        self.writes.update(node.names)
+
+    def _visit_scope(self, node: ast.AST, outer: List[ast.AST], inner: List[ast.AST]):
+        for child in outer:
+            self.visit(child)
+        declared = {name for child in inner for statement in ast.walk(child)
+                    if isinstance(statement, (ast.Global, ast.Nonlocal)) for name in statement.names}
+        bound = {child.id for child in inner for child in ast.walk(child)
+                 if isinstance(child, ast.Name) and not isinstance(child.ctx, ast.Load)}
+        arguments = getattr(node, "args", None)
+        if isinstance(arguments, ast.arguments):
+            bound.update(arg.arg for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs)
+            bound.update(arg.arg for arg in (arguments.vararg, arguments.kwarg) if arg)
+        self._scopes.append(bound - declared)
+        self._depth += 1
+        for child in inner:
+            self.visit(child)
+        self._depth -= 1
+        self._scopes.pop()
+
+    def visit_FunctionDef(self, node):
+        if self._depth == 0:
+            self.writes.add(node.name)
+        self._visit_scope(node, node.decorator_list + node.args.defaults + [d for d in node.args.kw_defaults if d], node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        if self._depth == 0:
+            self.writes.add(node.name)
+        self._visit_scope(node, node.decorator_list + node.bases + node.keywords, node.body)
+
+    def visit_Lambda(self, node: ast.Lambda):
+        self._visit_scope(node, node.args.defaults + [d for d in node.args.kw_defaults if d], [node.body])
+
+    def _visit_comprehension(self, node):
+        self._visit_scope(node, [], [child for child in ast.iter_child_nodes(node)])
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension
+
+    def _mutate(self, target: ast.AST):
+        while isinstance(target, (ast.Attribute, ast.Subscript)):
+            target = target.value
+        if isinstance(target, ast.Name) and not any(target.id in scope for scope in self._scopes):
+            self.mutates.add(target.id)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if not isinstance(node.ctx, ast.Load):
+            self._mutate(node)
+        self.generic_visit(node)
+
+    visit_Subscript = visit_Attribute
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        # `b += [2]` extends the list `b` may share with other names.
+        if isinstance(node.target, ast.Name):
+            self.reads.add(node.target.id)
+        self._mutate(node.target)
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        if isinstance(node.func, ast.Attribute) and (
+            node.func.attr in _MUTATING_METHODS
+            or any(keyword.arg == "inplace" and getattr(keyword.value, "value", False) is True for keyword in node.keywords)
+        ):
+            self._mutate(node.func.value)
+        self.generic_visit(node)
+
+def _imported_names(tree: ast.Module) -> Set[str]:
+    """
+    Returns the names the script binds to modules, i.e. the targets of the
+    `custom_import` calls the import rewriter produced.
+    """
+    names = set()
+    for node in tree.body:
+        if (
+            isinstance(node, ast.Assign) and isinstance(node.value, ast.Call)
+            and isinstance(node.value.func, ast.Name) and node.value.func.id in ("custom_import", "custom_import_from")
+        ):
+            names.update(target.id for target in node.targets if isinstance(target, ast.Name))
+    return names
+
+def split_sandbox_cells(code_content: str, filename: str = "<sandbox>") -> List[SandboxCell]:
+    """
+    Splits sandbox code into cells at `# %%` marker lines, or, without markers,
+    at every top-level statement, and works out which cells each one depends on.
+    Cell lists are cached by source like `compile_sandbox_code`'s code objects.
+
+    Args:
+        code_content (str): Sandbox source code.
+        filename (str): Name used in tracebacks.
+
+    Returns:
+        List[SandboxCell]: Cells in script order, empty ones left out.
+
+    Raises:
+        SyntaxError: If the code does not parse.
+    """
+    cache_key = hashlib.sha256(f"{filename}\0{code_content}".encode()).hexdigest()
+    cells = _cells_cache.get(cache_key)
+    if cells is not None:
+        return cells
+    tree = preprocess_code(code_content, filename)
+    markers = [number for number, line in enumerate(code_content.splitlines(), 1) if _CELL_MARKER.match(line)]
+    groups: List[List[ast.stmt]] = []
+    if markers:
+        boundaries = [0] + markers
+        grouped: Dict[int, List[ast.stmt]] = {}
+        for statement in tree.body:
+            cell = sum(1 for boundary in boundaries[1:] if boundary < statement.lineno)
+            grouped.setdefault(cell, []).append(statement)
+        groups = [grouped[cell] for cell in sorted(grouped)]
+    else:
+        groups = [[statement] for statement in tree.body]
+
+    # Module aliases and `st` are never replaced by a cell's own copy.
+    unchanged = _imported_names(tree) | {"st"}
+    analysed = []
+    for statements in groups:
+        module = ast.Module(body=statements, type_ignores=[])
+        names = _CellNames()
+        names.visit(module)
+        mutates = frozenset(names.mutates - unchanged)
+        analysed.append((
+            hashlib.sha256(ast.dump(module).encode()).hexdigest(),
+            compile(module, filename, "exec"),
+            statements[0].lineno,
+            frozenset(names.writes | mutates),
+            mutates,
+            names.reads | names.deferred | mutates,
+            names.deferred,
+        ))
+    cells = []
+    for i, (key, code, first_line, writes, mutates, reads, _) in enumerate(analysed):
+        # A cell using a function also reads what the function reads, as of this cell.
+        providers, pending, seen = set(), list(reads), set(reads)
+        while pending:
+            name = pending.pop()
+            earlier = [j for j in range(i) if name in analysed[j][3]]
+            later = [j for j in range(i + 1, len(analysed)) if name in analysed[j][3]]
+            if not earlier and not later:
+                continue
+            provider = earlier[-1] if earlier else later[-1]
+            providers.add(provider)
+            for deferred in analysed[provider][6] - seen:
+                seen.add(deferred)
+                pending.append(deferred)
+        cells.append(SandboxCell(key, code, first_line, writes, mutates, tuple(sorted(providers))))
+    _cells_cache.put(cache_key, cells)
+    return cells
@@ -0,0 +1,127 @@
+# sandbox_profiler.py
+
+import cProfile
+import os
+import posixpath
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rows kept per hot-spot table.
+PROFILE_ROWS = 15
+# Seconds between samples of the line the script is executing.
+SAMPLE_INTERVAL = 0.005
+
+class _LineSampler(threading.Thread):
+    """
+    Samples, at a fixed interval, which line of the script a thread is in: the
+    innermost frame of the script's own code, so time spent in library calls
+    counts towards the line that made them.
+    """
+
+    def __init__(self, thread_id: int, filename: str):
+        super().__init__(name="sandbox-line-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.filename = filename
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            self.samples += 1
+            while frame is not None and frame.f_code.co_filename != self.filename:
+                frame = frame.f_back
+            if frame is not None:
+                self.counts[frame.f_lineno] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+def _cpu_time() -> float:
+    times = os.times()
+    return times.user + times.system
+
+class RunProfiler:
+    """
+    Profiles one sandbox run: wall and CPU time, peak traced memory, cProfile
+    function statistics and sampled line hot spots of the script's own code.
+    Use it as a context manager around the run; `report` returns plain data that
+    can cross the process boundary.
+    """
+
+    def __init__(self, filename: str, source: str, ignore: Tuple[str, ...] = ()):
+        self.filename = filename
+        # Files of the harness running the script, left out of the library table.
+        self.ignore = set(ignore)
+        self.lines = source.splitlines()
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_bytes = 0
+        self._profile = cProfile.Profile()
+        self._sampler: Optional[_LineSampler] = None
+
+    def __enter__(self) -> "RunProfiler":
+        tracemalloc.start()
+        self._sampler = _LineSampler(threading.get_ident(), self.filename)
+        self._sampler.start()
+        self._cpu_started = _cpu_time()
+        self._started = time.perf_counter()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        self._profile.disable()
+        self.wall_time = time.perf_counter() - self._started
+        self.cpu_time = _cpu_time() - self._cpu_started
+        self._sampler.stop()
+        self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return False
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Summarises the run.
+
+        Returns:
+            Dict[str, Any]: "wall_time" and "cpu_time" in seconds, "peak_bytes",
+            and hot-spot rows: "lines" (script lines by share of samples),
+            "functions" (script functions and cells by cumulative time) and
+            "library" (other functions by own time).
+        """
+        functions: List[Dict[str, Any]] = []
+        library: List[Dict[str, Any]] = []
+        for (filename, line, name), (_, calls, own, total, _) in pstats.Stats(self._profile).stats.items():
+            if filename == self.filename:
+                functions.append({
+                    "function": name, "line": line, "calls": calls, "own_s": own, "total_s": total,
+                })
+            elif own > 0 and filename not in self.ignore:
+                location = f"{posixpath.basename(filename)}:{line}" if line else filename
+                library.append({
+                    "function": f"{name} ({location})", "calls": calls, "own_s": own, "total_s": total,
+                })
+        samples = max(self._sampler.samples, 1) if self._sampler else 1
+        lines = [
+            {
+                "line": line,
+                "share": count / samples,
+                "seconds": count / samples * self.wall_time,
+                "code": self.lines[line - 1].strip() if 0 < line <= len(self.lines) else "",
+            }
+            for line, count in (self._sampler.counts.most_common(PROFILE_ROWS) if self._sampler else [])
+        ]
+        return {
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_bytes": self.peak_bytes,
+            "lines": lines,
+            "functions": sorted(functions, key=lambda row: -row["total_s"])[:PROFILE_ROWS],
+            "library": sorted(library, key=lambda row: -row["own_s"])[:PROFILE_ROWS],
+        }
@@ -0,0 +1,1253 @@
+# sandbox_runner.py
+
+import builtins
+import contextlib
+import datetime
+import decimal
+import gc
+import hashlib
+import importlib
+import io
+import itertools
+import linecache
+import logging
+import marshal
+import multiprocessing
+import os
+import pickle
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from types import CodeType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sandbox_compiler import SandboxCell, make_import_helpers
+from sandbox_profiler import RunProfiler
+
+# Heavy libraries from requirements.txt that sandbox scripts commonly import. The
+# forkserver imports them once; every worker forked from it starts warm.
+PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "pyarrow",
+    "matplotlib",
+    "matplotlib.pyplot",
+    "seaborn",
+    "plotly.express",
+    "sklearn",
+    "sklearn.ensemble",
+    "sklearn.model_selection",
+    "statsmodels.api",
+    "yfinance",
+    "rdkit.Chem",
+]
+
+# Decorators that only make sense inside the Streamlit process; in a single-use
+# worker they are applied as no-ops.
+_LOCAL_DECORATORS = {
+    "cache_data",
+    "cache_resource",
+    "fragment",
+    "experimental_fragment",
+    "experimental_memo",
+    "experimental_singleton",
+}
+
+# Streamlit calls whose None result is not a widget value; any other value a cell
+# receives from Streamlit (widget values, session state) makes it re-run every time.
+_OUTPUT_CALLS = frozenset({"write", "set_page_config", "logo"})
+# Stored render calls per session worker; cells beyond this are re-run instead of replayed.
+_MAX_RECORDING_BYTES = 32 * 1024 * 1024
+
+# Streamlit functions, element methods and attributes sandbox code may use; the
+# Streamlit side refuses every other name. Secrets, connections, options, page
+# navigation and the app's own session state stay out of reach.
+_STREAMLIT_API = frozenset({
+    # Text and data
+    "write", "markdown", "title", "header", "subheader", "caption", "text", "code", "latex", "divider",
+    "badge", "html", "json", "metric", "dataframe", "data_editor", "table", "column_config",
+    "AreaChartColumn", "AudioColumn", "BarChartColumn", "ButtonColumn", "CheckboxColumn", "Column",
+    "DateColumn", "DatetimeColumn", "ImageColumn", "JsonColumn", "LineChartColumn", "LinkColumn",
+    "ListColumn", "MarkdownColumn", "MultiselectColumn", "NumberColumn", "ProgressColumn",
+    "SelectboxColumn", "TextColumn", "TimeColumn", "VideoColumn",
+    # Charts and media
+    "area_chart", "bar_chart", "line_chart", "scatter_chart", "map", "altair_chart", "vega_lite_chart",
+    "plotly_chart", "pydeck_chart", "graphviz_chart", "echarts_chart", "mermaid_chart", "add_rows",
+    "image", "audio", "video", "pdf", "logo",
+    # Widgets
+    "button", "download_button", "link_button", "checkbox", "toggle", "radio", "selectbox", "multiselect",
+    "slider", "select_slider", "pills", "segmented_control", "feedback", "text_input", "number_input",
+    "text_area", "date_input", "time_input", "datetime_input", "file_uploader", "camera_input",
+    "audio_input", "color_picker", "chat_input",
+    # Layout and status
+    "columns", "tabs", "expander", "container", "empty", "sidebar", "bottom", "popover", "form",
+    "form_submit_button", "chat_message", "space", "progress", "spinner", "status", "update", "toast",
+    "balloons", "snow", "error", "warning", "info", "success", "exception",
+    # Control flow and state
+    "set_page_config", "stop", "rerun", "session_state",
+})
+# Dunder protocols `_RemoteObject` forwards to Streamlit objects other than the module.
+_PROTOCOL_METHODS = frozenset({
+    "__getitem__", "__setitem__", "__delitem__", "__contains__", "__len__", "__enter__", "__exit__",
+})
+# Session-state keys of sandbox code, widget keys included, are stored under this
+# prefix, apart from the app's own keys.
+_STATE_PREFIX = "sandbox:"
+
+@dataclass
+class SandboxLimits:
+    """
+    Per-run resource limits of a sandbox worker.
+    """
+    cpu_seconds: int = 30
+    memory_mb: int = 1024
+    wall_seconds: float = 60.0
+
+@dataclass
+class SandboxResult:
+    """
+    Outcome of one sandbox run.
+    """
+    ok: bool
+    error: Optional[str] = None
+    traceback: Optional[str] = None
+    exec_time: float = 0.0
+    cpu_time: float = 0.0
+    wall_time: float = 0.0
+    cells_run: int = 0
+    cells_cached: int = 0
+    profile: Optional[Dict[str, Any]] = None
+
+class SandboxProxyError(RuntimeError):
+    """
+    Raised inside the worker when a proxied Streamlit call fails in the server.
+    """
+
+class SandboxFile(io.BytesIO):
+    """
+    Picklable stand-in for Streamlit's UploadedFile.
+    """
+
+    def __init__(self, data: bytes = b"", name: Optional[str] = None, type: Optional[str] = None):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+        self.size = len(data)
+
+class _Handle:
+    """
+    Reference to an object that stays in the Streamlit process.
+    """
+
+    def __init__(self, handle_id: int):
+        self.handle_id = handle_id
+
+class _Array:
+    """
+    Numpy array sent by a worker as its raw data.
+    """
+
+    def __init__(self, dtype: str, shape: Tuple[int, ...], data: bytes):
+        self.dtype = dtype
+        self.shape = shape
+        self.data = data
+
+class _Frame:
+    """
+    Pandas DataFrame, or Series if `series`, sent by a worker as Arrow IPC data.
+    """
+
+    def __init__(self, data: bytes, series: bool):
+        self.data = data
+        self.series = series
+
+class _Image:
+    """
+    Image, e.g. a rendered matplotlib figure, sent by a worker as PNG data.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+class _Figure:
+    """
+    Plotly figure sent by a worker as its JSON.
+    """
+
+    def __init__(self, data: str):
+        self.data = data
+
+# The only classes the Streamlit side rebuilds from a worker's messages; see `_load_message`.
+_WIRE_CLASSES = {
+    ("builtins", "complex"): complex,
+    ("builtins", "range"): range,
+    ("builtins", "slice"): slice,
+    ("builtins", "RuntimeError"): RuntimeError,
+    ("datetime", "date"): datetime.date,
+    ("datetime", "time"): datetime.time,
+    ("datetime", "datetime"): datetime.datetime,
+    ("datetime", "timedelta"): datetime.timedelta,
+    ("datetime", "timezone"): datetime.timezone,
+    ("decimal", "Decimal"): decimal.Decimal,
+    **{(__name__, cls.__name__): cls for cls in (_Handle, _Array, _Frame, _Image, _Figure)},
+}
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _passthrough_decorator(*args, **kwargs):
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return args[0]
+    return lambda func: func
+
+def _png(save, **options) -> bytes:
+    buffer = io.BytesIO()
+    save(buffer, format="png", **options)
+    return buffer.getvalue()
+
+def _frame_to_wire(value, pandas) -> "_Frame":
+    import pyarrow
+    series = isinstance(value, pandas.Series)
+    frame = value.to_frame() if series else value
+    try:
+        table = pyarrow.Table.from_pandas(frame)
+    except Exception:
+        # Mixed-type object columns have no Arrow type; Streamlit shows them as text too.
+        table = pyarrow.Table.from_pandas(frame.astype(str))
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return _Frame(sink.getvalue().to_pybytes(), series)
+
+def _to_wire(value):
+    """
+    Converts an argument of a Streamlit call to what the Streamlit side accepts
+    from a worker: builtin scalars, containers, dates and times, handles of
+    Streamlit objects, and arrays, DataFrames, images and plotly figures as data.
+    Anything else is sent as its string form.
+    """
+    if isinstance(value, _RemoteObject):
+        return _Handle(value._handle)
+    if value is None or isinstance(value, bool):
+        return value if value is None else bool(value)
+    for plain in (int, float, complex, str, bytes, decimal.Decimal):
+        if isinstance(value, plain):
+            return value if type(value) is plain else plain(value)
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        for method in ("to_pydatetime", "to_pytimedelta"):
+            if hasattr(value, method):
+                value = getattr(value, method)()
+        tzinfo = getattr(value, "tzinfo", None)
+        if tzinfo is not None and not isinstance(tzinfo, datetime.timezone):
+            # Only fixed offsets cross the pipe, not time zone database entries.
+            offset = value.utcoffset()
+            value = value.replace(tzinfo=datetime.timezone(offset) if offset is not None else None)
+        return value
+    if isinstance(value, dict):
+        return {_to_wire(key): _to_wire(item) for key, item in value.items()}
+    for container in (list, tuple, set, frozenset):
+        if isinstance(value, container):
+            return container(_to_wire(item) for item in value)
+    if isinstance(value, io.BytesIO):
+        return value.getvalue()
+    if isinstance(value, BaseException):
+        return RuntimeError(f"{type(value).__name__}: {value}")
+    numpy, pandas = sys.modules.get("numpy"), sys.modules.get("pandas")
+    module = type(value).__module__ or ""
+    try:
+        if numpy is not None and isinstance(value, numpy.generic):
+            return _to_wire(value.item())
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            if value.dtype.hasobject or value.dtype.names:
+                return _to_wire(value.tolist())
+            return _Array(value.dtype.str, value.shape, value.tobytes())
+        if pandas is not None and isinstance(value, (pandas.DataFrame, pandas.Series)):
+            return _frame_to_wire(value, pandas)
+        if pandas is not None and isinstance(value, pandas.Index):
+            return _to_wire(value.tolist())
+        if module.startswith("pandas") and type(value).__name__ == "Styler":
+            return _to_wire(value.data)
+        if module.startswith("matplotlib") and hasattr(value, "savefig"):
+            return _Image(_png(value.savefig, bbox_inches="tight", dpi=200))
+        if module.startswith("PIL") and hasattr(value, "save"):
+            return _Image(_png(value.save))
+        if module.startswith("plotly") and hasattr(value, "to_json"):
+            return _Figure(value.to_json())
+        if module.startswith("altair") and hasattr(value, "to_dict"):
+            return _to_wire(value.to_dict())
+    except Exception as e:
+        print(f"sandbox: {type(value).__name__} cannot be sent to Streamlit ({e}), sending its text", file=sys.stderr)
+    return str(value)
+
+def _wire_arguments(values):
+    """
+    Converts the arguments of a Streamlit call with `_to_wire`, dropping those
+    that cannot cross the process boundary (e.g. callbacks defined in the
+    sandbox script).
+    """
+    def sendable(value):
+        return isinstance(value, _RemoteObject) or not callable(value)
+    if isinstance(values, dict):
+        dropped = [key for key, value in values.items() if not sendable(value)]
+        for key in dropped:
+            print(f"sandbox: argument '{key}' cannot be sent to Streamlit and was ignored", file=sys.stderr)
+        return {key: _to_wire(value) for key, value in values.items() if key not in dropped}
+    return tuple(_to_wire(value) if sendable(value) else None for value in values)
+
+# Values the running cell received from Streamlit; None outside incremental runs.
+_received: Optional[List[Any]] = None
+
+def _is_handle_result(value) -> bool:
+    return isinstance(value, _RemoteObject) or (
+        type(value) in (list, tuple) and len(value) > 0 and all(isinstance(item, _RemoteObject) for item in value)
+    )
+
+class _RemoteObject:
+    """
+    Worker-side proxy that forwards attribute access, calls and the usual dunder
+    protocols to an object living in the Streamlit process. Instances come from
+    the subclass `_connect` makes for the worker's pipe.
+    """
+    __slots__ = ("_handle", "_attr_cache", "_name")
+
+    def __init__(self, handle: int, name: Optional[str] = None):
+        object.__setattr__(self, "_handle", handle)
+        object.__setattr__(self, "_attr_cache", {})
+        object.__setattr__(self, "_name", name)
+
+    def _exchange(self, message):
+        raise NotImplementedError
+
+    def _request(self, kind, handle, name, args, kwargs):
+        reply = self._exchange((kind, handle, name, _wire_arguments(args), _wire_arguments(kwargs)))
+        if reply[0] == "error":
+            raise SandboxProxyError(f"{reply[1]}: {reply[2]}")
+        value = _decode_reply(type(self), reply[1])
+        name = name or self._name
+        if _received is not None and kind != "setattr" and name not in ("__enter__", "__exit__"):
+            # Anything but a Streamlit object (or an output call's None) is input to the cell.
+            if not _is_handle_result(value) and not (value is None and name in _OUTPUT_CALLS):
+                _received.append(value)
+        return value
+
+    def _call_method(self, name: str, *args):
+        return self._request("call", self._handle, name, args, {})
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name == "pyplot":
+            return self._pyplot
+        if self._handle == 0 and name in _LOCAL_DECORATORS:
+            return _passthrough_decorator
+        if name == "altair_chart":
+            # Charts cross the pipe as their Vega-Lite spec.
+            name = "vega_lite_chart"
+        cached = self._attr_cache.get(name)
+        if cached is not None:
+            return cached
+        value = self._request("getattr", self._handle, name, (), {})
+        if isinstance(value, _RemoteObject):
+            object.__setattr__(value, "_name", name)
+        # Module-level Streamlit functions never change, so skip the round trip next time.
+        if self._handle == 0 and isinstance(value, _RemoteObject):
+            self._attr_cache[name] = value
+        return value
+
+    def _pyplot(self, fig=None, clear_figure=False, **kwargs):
+        """
+        Renders a matplotlib figure in the worker, like `st.pyplot` does, and shows
+        it with `image`: figures do not cross the pipe.
+        """
+        if fig is None and "matplotlib.pyplot" in sys.modules:
+            fig = sys.modules["matplotlib.pyplot"].gcf()
+        options = {key: kwargs.pop(key) for key in ("width", "use_container_width", "alt") if key in kwargs}
+        image = _png(fig.savefig, **{"bbox_inches": "tight", "dpi": 200, **kwargs})
+        if clear_figure:
+            fig.clf()
+        return self._request("call", self._handle, "image", (image,), options)
+
+    def __setattr__(self, name: str, value):
+        self._request("setattr", self._handle, name, (value,), {})
+
+    def __call__(self, *args, **kwargs):
+        return self._request("call", self._handle, None, args, kwargs)
+
+    def __getitem__(self, key):
+        return self._call_method("__getitem__", key)
+
+    def __setitem__(self, key, value):
+        self._call_method("__setitem__", key, value)
+
+    def __delitem__(self, key):
+        self._call_method("__delitem__", key)
+
+    def __contains__(self, key):
+        return self._call_method("__contains__", key)
+
+    def __len__(self):
+        return self._call_method("__len__")
+
+    def __iter__(self):
+        return iter(self._request("list", self._handle, None, (), {}))
+
+    def __enter__(self):
+        entered = self._call_method("__enter__")
+        return self if entered is None else entered
+
+    def __exit__(self, exc_type, exc, tb):
+        self._call_method("__exit__", None, None, None)
+        return False
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f"<streamlit object {self._handle}>"
+
+    def __reduce__(self):
+        return (_Handle, (self._handle,))
+
+def _connect(conn) -> type:
+    """
+    Returns the `_RemoteObject` class of a worker, talking to the Streamlit side
+    over `conn`. Only this closure holds the pipe, so there is no `st._conn` for
+    sandbox code to pick up; the Streamlit side trusts nothing a worker sends either way.
+    """
+    class _Proxy(_RemoteObject):
+        __slots__ = ()
+
+        def _exchange(self, message):
+            conn.send(message)
+            return conn.recv()
+
+    return _Proxy
+
+def _decode_reply(proxy, value):
+    if isinstance(value, _Handle):
+        return proxy(value.handle_id)
+    if type(value) in (list, tuple):
+        return type(value)(_decode_reply(proxy, item) for item in value)
+    if type(value) is dict:
+        return {key: _decode_reply(proxy, item) for key, item in value.items()}
+    return value
+
+def _make_resolver(st_proxy):
+    """
+    Returns a module resolver for the sandbox's import helpers that maps Streamlit
+    to the proxy.
+    """
+    def resolve(module_name):
+        if module_name == "streamlit" or module_name.startswith("streamlit."):
+            target = st_proxy
+            for part in module_name.split(".")[1:]:
+                target = getattr(target, part)
+            return target
+        return importlib.import_module(module_name)
+    return resolve
+
+def _apply_limits(limits: SandboxLimits, persistent: bool = False) -> None:
+    try:
+        import resource
+    except ImportError:
+        return
+    if persistent:
+        # CPU time adds up over a session worker's runs: each run gets its
+        # allowance on top of what was used so far.
+        hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        soft = int(_cpu_time()) + limits.cpu_seconds
+        resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+    else:
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+    memory = limits.memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+def _cpu_time() -> float:
+    times = os.times()
+    return times.user + times.system
+
+def _rss_bytes() -> int:
+    """
+    Returns the worker's resident memory.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _format_error(e: BaseException, filename: str) -> Tuple[str, str]:
+    """
+    Returns the message and the script-only traceback of an exception.
+    """
+    frames = [frame for frame in traceback.extract_tb(e.__traceback__) if frame.filename == filename]
+    return str(e) or type(e).__name__, "".join(traceback.format_list(frames) + traceback.format_exception_only(type(e), e))
+
+def _worker_main(conn) -> None:
+    """
+    Entry point of a sandbox worker: waits for one job, runs it and exits. A
+    job of cells turns the worker into a session worker instead; see `_cell_loop`.
+    """
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    try:
+        job = conn.recv()
+    except (EOFError, KeyboardInterrupt):
+        return
+    if "cells" in job:
+        _cell_loop(conn, job)
+        return
+    _apply_limits(job["limits"])
+
+    filename = job["filename"]
+    source = job["source"]
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    st_proxy = _connect(conn)(0)
+    global_env = {
+        "__builtins__": builtins,
+        "__name__": "__main__",
+        "st": st_proxy,
+        **make_import_helpers(_make_resolver(st_proxy)),
+    }
+    result = {"ok": True, "error": None, "traceback": None}
+    profiler = RunProfiler(filename, source, ignore=(__file__,)) if job.get("profile") else None
+    cpu_started = _cpu_time()
+    started = time.perf_counter()
+    try:
+        with profiler or contextlib.nullcontext():
+            exec(marshal.loads(job["code"]), global_env)
+    except BaseException as e:
+        result["ok"] = False
+        result["error"], result["traceback"] = _format_error(e, filename)
+    result["exec_time"] = time.perf_counter() - started
+    result["cpu_time"] = _cpu_time() - cpu_started
+    result["profile"] = profiler.report() if profiler else None
+    conn.send(("done", result))
+
+# Stored for a name a cell deleted or left unbound.
+_UNBOUND = object()
+
+class _CellOutputs:
+    """
+    Worker-side store of the globals each executed cell left behind, keyed by the
+    cell's effective key, least recently used first.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Keys of cells that received widget values; they always run.
+        self.volatile = set()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        values = self._entries.get(key)
+        if values is not None:
+            self._entries.move_to_end(key)
+        return values
+
+    def put(self, key: str, values: Dict[str, Any]) -> None:
+        self._entries[key] = values
+        self._entries.move_to_end(key)
+
+    def evict(self, max_bytes: int, keep: set) -> None:
+        """
+        Drops entries of cells outside the latest run, least recently used first,
+        until the worker's resident memory is within `max_bytes`.
+        """
+        for key in [key for key in self._entries if key not in keep]:
+            if _rss_bytes() <= max_bytes:
+                break
+            del self._entries[key]
+            gc.collect()
+
+    def keys(self) -> List[str]:
+        return list(self._entries)
+
+def _cell_key(cell: Dict[str, Any], cells: List[Dict[str, Any]], effective: List[str]) -> str:
+    """
+    Combines a cell's code hash with the effective keys of the cells it reads
+    from, so a change anywhere upstream changes the key.
+    """
+    parts = [cell["key"]] + [effective[p] if p < len(effective) else cells[p]["key"] for p in cell["providers"]]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+def _digest(values: List[Any]) -> str:
+    try:
+        data = pickle.dumps(values)
+    except Exception:
+        data = repr(values).encode()
+    return hashlib.sha256(data).hexdigest()
+
+def _run_cells(conn, job: Dict[str, Any], namespace: Dict[str, Any], st_proxy: _RemoteObject, outputs: _CellOutputs) -> Dict[str, Any]:
+    """
+    Runs one incremental job: every cell whose key has stored outputs gets them
+    restored and its render calls replayed by the Streamlit side, the others run.
+    """
+    _apply_limits(job["limits"], persistent=True)
+    filename = job["filename"]
+    source = job["source"]
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    # The same dict every run, so functions defined by restored cells see this run's globals.
+    namespace.clear()
+    namespace.update({
+        "__builtins__": builtins,
+        "__name__": "__main__",
+        "st": st_proxy,
+        **make_import_helpers(_make_resolver(st_proxy)),
+    })
+    # Handles of module-level functions belong to the previous run.
+    st_proxy._attr_cache.clear()
+    cells = job["cells"]
+    effective: List[str] = []
+    result = {"ok": True, "error": None, "traceback": None, "cells_run": 0, "cells_cached": 0}
+    profiler = RunProfiler(filename, source, ignore=(__file__,)) if job.get("profile") else None
+    cpu_started = _cpu_time()
+    started = time.perf_counter()
+    with profiler or contextlib.nullcontext():
+        _run_cell_list(conn, cells, namespace, outputs, filename, effective, result)
+    result["exec_time"] = time.perf_counter() - started
+    result["cpu_time"] = _cpu_time() - cpu_started
+    result["profile"] = profiler.report() if profiler else None
+    used = set(effective)
+    outputs.volatile &= used
+    outputs.evict(job["state_bytes"], used)
+    result["cached"] = outputs.keys()
+    return result
+
+def _run_cell_list(
+    conn, cells: List[Dict[str, Any]], namespace: Dict[str, Any], outputs: _CellOutputs,
+    filename: str, effective: List[str], result: Dict[str, Any],
+) -> None:
+    """
+    Restores or runs each cell in order, stopping at the first error.
+
+    Stored outputs are the live objects the cells left behind, so restoring them
+    keeps every alias intact. That only holds while nothing changes them in place:
+    any object may be shared between names, so a script with a cell that changes
+    a global in place runs all its cells and stores nothing.
+    """
+    global _received
+    cacheable = not any(cell["mutates"] for cell in cells)
+    for cell in cells:
+        key = _cell_key(cell, cells, effective)
+        stored = outputs.get(key) if cacheable and key not in outputs.volatile else None
+        conn.send(("cell", key, stored is not None))
+        if conn.recv()[1]:
+            for name, value in stored.items():
+                if value is _UNBOUND:
+                    namespace.pop(name, None)
+                else:
+                    namespace[name] = value
+            effective.append(key)
+            result["cells_cached"] += 1
+            continue
+        _received = []
+        try:
+            exec(marshal.loads(cell["code"]), namespace)
+        except BaseException as e:
+            result["ok"] = False
+            result["error"], result["traceback"] = _format_error(e, filename)
+            break
+        finally:
+            received, _received = _received, None
+        result["cells_run"] += 1
+        if received:
+            # Downstream cells stay cached as long as the widget values do not change.
+            outputs.volatile.add(key)
+            effective.append(hashlib.sha256(f"{key}\0{_digest(received)}".encode()).hexdigest())
+        else:
+            outputs.volatile.discard(key)
+            if cacheable:
+                outputs.put(key, {name: namespace.get(name, _UNBOUND) for name in cell["writes"]})
+            effective.append(key)
+
+def _cell_loop(conn, job: Dict[str, Any]) -> None:
+    """
+    Main loop of a session worker: runs incremental jobs, keeping the script's
+    globals and the stored cell outputs between them, until the Streamlit side
+    closes the pipe.
+    """
+    st_proxy = _connect(conn)(0)
+    namespace: Dict[str, Any] = {}
+    outputs = _CellOutputs()
+    while True:
+        conn.send(("done", _run_cells(conn, job, namespace, st_proxy, outputs)))
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+
+# ---------------------------------------------------------------------------
+# Streamlit side
+# ---------------------------------------------------------------------------
+
+class _WireUnpickler(pickle.Unpickler):
+    """
+    Unpickler that rebuilds only the classes in `_WIRE_CLASSES`.
+    """
+
+    def find_class(self, module: str, name: str):
+        cls = _WIRE_CLASSES.get((module, name))
+        if cls is None:
+            raise pickle.UnpicklingError(f"{module}.{name} is not accepted from a sandbox worker")
+        return cls
+
+# Requests for Streamlit objects a worker may send, besides "done" and "cell".
+_REQUEST_KINDS = frozenset({"call", "getattr", "setattr", "list"})
+
+def _load_message(raw: bytes) -> tuple:
+    """
+    Unpickles a message from a sandbox worker. Sandbox code can write any pickle
+    to the pipe, and unpickling arbitrary classes would run its code in the
+    Streamlit process, so only plain data and the wire classes are accepted.
+
+    Args:
+        raw (bytes): Message as received.
+
+    Returns:
+        tuple: ("done", result), ("cell", key, restore) or (kind, handle, name, args, kwargs).
+
+    Raises:
+        pickle.UnpicklingError: If the message holds anything else or has the wrong shape.
+    """
+    try:
+        message = _WireUnpickler(io.BytesIO(raw)).load()
+    except pickle.UnpicklingError:
+        raise
+    except Exception as e:
+        raise pickle.UnpicklingError(f"Malformed message: {e}") from e
+    kind = message[0] if type(message) is tuple and message else None
+    if (
+        (kind == "done" and len(message) == 2 and type(message[1]) is dict)
+        or (kind == "cell" and len(message) == 3 and type(message[1]) is str and type(message[2]) is bool)
+        or (
+            kind in _REQUEST_KINDS and len(message) == 5 and type(message[1]) is int
+            and (message[2] is None or type(message[2]) is str)
+            and type(message[3]) is tuple and type(message[4]) is dict
+            and all(type(key) is str for key in message[4])
+        )
+    ):
+        return message
+    raise pickle.UnpicklingError("Malformed message")
+
+class _SandboxState(MutableMapping):
+    """
+    Session state as sandbox code sees it: only its own keys, widget keys
+    included, which live under `_STATE_PREFIX` in Streamlit's session state.
+    The app's keys, e.g. the GitHub token, are neither visible nor writable.
+    """
+    # Methods sandbox code may call besides the mapping protocol.
+    METHODS = frozenset({"get", "keys", "values", "items", "setdefault", "pop", "update", "clear", "to_dict"})
+
+    def __init__(self, state):
+        object.__setattr__(self, "_state", state)
+
+    def __getitem__(self, key):
+        return self._state[f"{_STATE_PREFIX}{key}"]
+
+    def __setitem__(self, key, value):
+        self._state[f"{_STATE_PREFIX}{key}"] = value
+
+    def __delitem__(self, key):
+        del self._state[f"{_STATE_PREFIX}{key}"]
+
+    def __iter__(self):
+        return iter([key[len(_STATE_PREFIX):] for key in list(self._state) if str(key).startswith(_STATE_PREFIX)])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __getattr__(self, name: str):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(f"st.session_state has no attribute \"{name}\"")
+
+    def __setattr__(self, name: str, value):
+        self[name] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+@dataclass
+class _Session:
+    """
+    Session worker of one Streamlit session, with the render calls of the cells
+    whose outputs it keeps, as (message, handle ids of the reply) per call.
+    """
+    process: Any
+    conn: Any
+    recordings: Dict[str, List[Tuple[bytes, List[int]]]] = field(default_factory=dict)
+    recording_bytes: int = 0
+    current: Optional[Tuple[str, List[Tuple[bytes, List[int]]]]] = None
+    # Handle ids stay unique across runs: objects the worker kept from earlier runs
+    # get their ids bound again when the calls that made them are replayed.
+    handle_ids: Iterator[int] = field(default_factory=lambda: itertools.count(1))
+    last_used: float = 0.0
+    finished: bool = False
+
+    def finish_cell(self, keep: bool = True) -> None:
+        if self.current is not None and keep:
+            key, calls = self.current
+            size = sum(len(raw) for raw, _ in calls)
+            if self.recording_bytes + size <= _MAX_RECORDING_BYTES:
+                self.recordings[key] = calls
+                self.recording_bytes += size
+        self.current = None
+
+    def retain(self, keys: List[str]) -> None:
+        self.recordings = {key: self.recordings[key] for key in keys if key in self.recordings}
+        self.recording_bytes = sum(len(raw) for calls in self.recordings.values() for raw, _ in calls)
+
+def _handle_ids(value) -> List[int]:
+    if isinstance(value, _Handle):
+        return [value.handle_id]
+    if type(value) in (list, tuple):
+        return [handle_id for item in value for handle_id in _handle_ids(item)]
+    if type(value) is dict:
+        return [handle_id for item in value.values() for handle_id in _handle_ids(item)]
+    return []
+
+class SandboxPool:
+    """
+    Pool of pre-started, single-use sandbox worker processes forked from a
+    forkserver that has the common data-science libraries imported already.
+    Incremental runs check a worker out per Streamlit session instead and keep
+    it, with the script's state, between reruns.
+    """
+
+    def __init__(
+        self, size: int = 2, preload: Optional[List[str]] = None, limits: Optional[SandboxLimits] = None,
+        max_sessions: int = 4, session_idle_seconds: float = 1800.0, state_mb: Optional[int] = None,
+    ):
+        self.size = size
+        self.limits = limits or SandboxLimits()
+        self.max_sessions = max_sessions
+        self.session_idle_seconds = session_idle_seconds
+        self.state_mb = state_mb if state_mb is not None else self.limits.memory_mb // 2
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            # "__main__" lets the forkserver import the entry script once, so forked
+            # workers do not re-run it during multiprocessing's spawn preparation.
+            self._context.set_forkserver_preload(
+                ["__main__", "sandbox_runner"] + (PRELOAD_MODULES if preload is None else preload)
+            )
+        else:
+            self._context = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._spawn_idle()
+
+    def _spawn_idle(self) -> None:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        with self._lock:
+            self._idle.append((process, parent_conn))
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                process, conn = self._idle.pop(0)
+                if process.is_alive():
+                    break
+                conn.close()
+            else:
+                process = None
+        if process is None:
+            self._spawn_idle()
+            with self._lock:
+                process, conn = self._idle.pop(0)
+        # Refill in the background so the next run starts warm too.
+        threading.Thread(target=self._spawn_idle, daemon=True).start()
+        return process, conn
+
+    def run(
+        self, code: CodeType, source: str, st_module: Any = None, limits: Optional[SandboxLimits] = None,
+        profile: bool = False,
+    ) -> SandboxResult:
+        """
+        Runs compiled sandbox code in a fresh worker, serving its Streamlit calls
+        from this process until it finishes or a limit is hit.
+
+        Args:
+            code (CodeType): Code object from `sandbox_compiler.compile_sandbox_code`.
+            source (str): Original source, used for traceback lines.
+            st_module (Any): Object that proxied `st` calls are served from, defaults to streamlit.
+            limits (Optional[SandboxLimits]): Overrides the pool's default limits.
+            profile (bool): Whether to profile the run; see `sandbox_profiler.RunProfiler`.
+
+        Returns:
+            SandboxResult: Outcome of the run.
+        """
+        if st_module is None:
+            import streamlit as st_module
+        limits = limits or self.limits
+        started = time.perf_counter()
+        process, conn = self._checkout()
+        try:
+            # Code objects cross the pipe as marshal data, so the worker never re-compiles.
+            job = {
+                "code": marshal.dumps(code), "source": source, "filename": code.co_filename, "limits": limits,
+                "profile": profile,
+            }
+            result = self._send(conn, process, job, limits) or self._serve(
+                conn, process, {0: st_module}, started + limits.wall_seconds, limits,
+            )
+        finally:
+            # Workers are single-use: whatever the script did to its interpreter dies with it.
+            conn.close()
+            if process.is_alive():
+                process.kill()
+            process.join(timeout=1)
+        result.wall_time = time.perf_counter() - started
+        return result
+
+    def run_cells(
+        self, session_id: str, cells: List[SandboxCell], source: str, st_module: Any = None,
+        limits: Optional[SandboxLimits] = None, profile: bool = False,
+    ) -> SandboxResult:
+        """
+        Runs sandbox code incrementally in the session's worker: cells whose code
+        and inputs are unchanged since an earlier run are not executed again; their
+        globals are restored in the worker and their Streamlit calls replayed here.
+        Cells that received widget values always run.
+
+        Args:
+            session_id (str): Streamlit session the worker and its state belong to.
+            cells (List[SandboxCell]): Cells from `sandbox_compiler.split_sandbox_cells`.
+            source (str): Original source, used for traceback lines.
+            st_module (Any): Object that proxied `st` calls are served from, defaults to streamlit.
+            limits (Optional[SandboxLimits]): Overrides the pool's default limits.
+            profile (bool): Whether to profile the run; see `sandbox_profiler.RunProfiler`.
+
+        Returns:
+            SandboxResult: Outcome of the run, with the number of cells run and restored.
+        """
+        if st_module is None:
+            import streamlit as st_module
+        limits = limits or self.limits
+        started = time.perf_counter()
+        session = self._session(session_id)
+        session.finished = False
+        try:
+            job = {
+                "cells": [
+                    {
+                        "key": cell.key,
+                        "code": marshal.dumps(cell.code),
+                        "writes": tuple(cell.writes),
+                        "mutates": tuple(cell.mutates),
+                        "providers": cell.providers,
+                    }
+                    for cell in cells
+                ],
+                "source": source,
+                "filename": cells[0].code.co_filename if cells else "<sandbox>",
+                "limits": limits,
+                "state_bytes": self.state_mb * 1024 * 1024,
+                "profile": profile,
+            }
+            result = self._send(session.conn, session.process, job, limits) or self._serve(
+                session.conn, session.process, {0: st_module}, started + limits.wall_seconds, limits, session,
+            )
+        finally:
+            # A run that did not finish leaves the worker mid-script: start over next time.
+            if not session.finished:
+                self.reset_session(session_id)
+        result.wall_time = time.perf_counter() - started
+        return result
+
+    def _session(self, session_id: str) -> _Session:
+        """
+        Returns the session's worker, checking one out of the pool for a new
+        session and retiring idle and least recently used sessions.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if now - session.last_used > self.session_idle_seconds]
+            session = self._sessions.get(session_id)
+            if session is not None and not session.process.is_alive():
+                expired.append(session_id)
+                session = None
+        for sid in expired:
+            self.reset_session(sid)
+        if session is None:
+            process, conn = self._checkout()
+            session = _Session(process, conn)
+            with self._lock:
+                self._sessions[session_id] = session
+                retired = list(self._sessions)[:-self.max_sessions] if len(self._sessions) > self.max_sessions else []
+            for sid in retired:
+                self.reset_session(sid)
+        with self._lock:
+            self._sessions.move_to_end(session_id)
+        session.last_used = now
+        return session
+
+    def reset_session(self, session_id: str) -> None:
+        """
+        Stops a session's worker, discarding its state; the next incremental run
+        of the session starts from scratch.
+
+        Args:
+            session_id (str): Streamlit session id.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        session.conn.close()
+        if session.process.is_alive():
+            session.process.kill()
+        session.process.join(timeout=1)
+
+    def _serve(
+        self, conn, process, objects: Dict[int, Any], deadline: float, limits: SandboxLimits,
+        session: Optional[_Session] = None,
+    ) -> SandboxResult:
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return SandboxResult(ok=False, error=f"Wall-clock limit of {limits.wall_seconds:g}s exceeded.")
+            if not conn.poll(min(remaining, 0.5)):
+                if not process.is_alive():
+                    return self._crashed(process, limits)
+                continue
+            try:
+                raw = conn.recv_bytes()
+            except (EOFError, OSError):
+                process.join(timeout=1)
+                return self._crashed(process, limits)
+            try:
+                message = _load_message(raw)
+                if message[0] == "done":
+                    done = message[1]
+                    result = SandboxResult(
+                        ok=bool(done["ok"]),
+                        error=None if done["error"] is None else str(done["error"]),
+                        traceback=None if done["traceback"] is None else str(done["traceback"]),
+                        exec_time=float(done["exec_time"]),
+                        cpu_time=float(done["cpu_time"]),
+                        cells_run=int(done.get("cells_run", 0)),
+                        cells_cached=int(done.get("cells_cached", 0)),
+                        profile=done.get("profile"),
+                    )
+            except (pickle.UnpicklingError, KeyError, TypeError, ValueError) as e:
+                # The run ends here; the caller stops the worker.
+                logging.warning(f"Refused a message from a sandbox worker: {e}")
+                return SandboxResult(ok=False, error=f"Sandbox process sent a message that was refused ({e}).")
+
+            if message[0] == "done":
+                if session is not None:
+                    # A failed cell's calls are not replayed; its outputs were not stored either.
+                    session.finish_cell(keep=result.ok)
+                    session.retain([key for key in done.get("cached", ()) if type(key) is str])
+                    session.finished = True
+                return result
+            if message[0] == "cell":
+                reply = ("ok", self._begin_cell(session, message[1], message[2], objects))
+            else:
+                # Only ordinary exceptions go back to the worker; Streamlit's rerun/stop
+                # control flow propagates and ends this run.
+                try:
+                    value = self._encode(self._dispatch(message, objects), objects, session.handle_ids if session else None)
+                    reply = ("ok", value)
+                    if session is not None and session.current is not None:
+                        session.current[1].append((raw, _handle_ids(value)))
+                except Exception as e:
+                    reply = ("error", type(e).__name__, str(e))
+            crashed = self._send(conn, process, reply, limits)
+            if crashed is not None:
+                return crashed
+
+    def _begin_cell(self, session: _Session, key: str, restore: bool, objects: Dict[int, Any]) -> bool:
+        """
+        Starts a cell of an incremental run. A cell the worker can restore has its
+        recorded Streamlit calls replayed, handing out the same handle ids as
+        before; otherwise recording of the cell's calls starts.
+
+        Returns:
+            bool: Whether the calls were replayed, so the worker need not run the cell.
+        """
+        session.finish_cell()
+        calls = session.recordings.get(key) if restore else None
+        if calls is not None:
+            try:
+                for raw, handle_ids in calls:
+                    self._encode(self._dispatch(_load_message(raw), objects), objects, itertools.chain(handle_ids, session.handle_ids))
+                return True
+            except Exception as e:
+                logging.warning(f"Replaying a sandbox cell failed, running it instead: {e}")
+        session.current = (key, [])
+        return False
+
+    def _dispatch(self, message, objects: Dict[int, Any]):
+        """
+        Serves one request of sandbox code. Only the names in `_STREAMLIT_API`,
+        the forwarded protocols of objects it got back, and its own session-state
+        keys are served.
+
+        Raises:
+            PermissionError: If the request is for anything else.
+        """
+        kind, handle, name, args, kwargs = message
+        target = objects[handle]
+        args = self._decode(args, objects)
+        kwargs = self._decode(kwargs, objects)
+        if isinstance(target, _SandboxState):
+            allowed = (
+                name is None or name in _SandboxState.METHODS or name in _PROTOCOL_METHODS
+                or (kind in ("getattr", "setattr") and not name.startswith("_"))
+            )
+        elif kind in ("getattr", "call"):
+            allowed = name is None or name in _STREAMLIT_API or (handle != 0 and name in _PROTOCOL_METHODS)
+        else:
+            allowed = kind == "list" and handle != 0
+        if not allowed or kind not in _REQUEST_KINDS:
+            raise PermissionError(f"st.{name or kind} is not available in the sandbox")
+        if kind == "getattr":
+            value = getattr(target, name)
+            return _SandboxState(value) if handle == 0 and name == "session_state" else value
+        if kind == "setattr":
+            setattr(target, name, args[0])
+            return None
+        if kind == "list":
+            return list(target)
+        if name is not None:
+            target = getattr(target, name)
+        if isinstance(kwargs.get("key"), str) and not isinstance(objects[handle], _SandboxState):
+            # Widget values land in session state under their key.
+            kwargs["key"] = f"{_STATE_PREFIX}{kwargs['key']}"
+        return target(*args, **kwargs)
+
+    def _decode(self, value, objects: Dict[int, Any]):
+        if isinstance(value, _Handle):
+            return objects[value.handle_id]
+        if type(value) in (list, tuple):
+            return type(value)(self._decode(item, objects) for item in value)
+        if type(value) is dict:
+            return {key: self._decode(item, objects) for key, item in value.items()}
+        if isinstance(value, _Array):
+            import numpy
+            dtype = numpy.dtype(value.dtype)
+            if dtype.hasobject:
+                raise TypeError("Arrays of Python objects cannot be sent to Streamlit")
+            return numpy.frombuffer(value.data, dtype=dtype).reshape(value.shape)
+        if isinstance(value, _Frame):
+            import pyarrow
+            frame = pyarrow.ipc.open_stream(value.data).read_all().to_pandas()
+            return frame.iloc[:, 0] if value.series else frame
+        if isinstance(value, _Image):
+            from PIL import Image
+            return Image.open(io.BytesIO(value.data))
+        if isinstance(value, _Figure):
+            import plotly.io
+            return plotly.io.from_json(value.data)
+        return value
+
+    def _encode(self, value, objects: Dict[int, Any], ids: Optional[Iterator[int]] = None):
+        if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+            return value
+        if isinstance(value, io.BytesIO):
+            return SandboxFile(value.getvalue(), getattr(value, "name", None), getattr(value, "type", None))
+        if type(value) in (list, tuple):
+            return type(value)(self._encode(item, objects, ids) for item in value)
+        if type(value) is dict:
+            return {key: self._encode(item, objects, ids) for key, item in value.items()}
+        if (
+            not callable(value) and not isinstance(value, _SandboxState)
+            and not (type(value).__module__ or "").startswith("streamlit")
+        ):
+            try:
+                pickle.dumps(value)
+                return value
+            except Exception:
+                pass
+        handle_id = next(ids) if ids is not None else len(objects)
+        objects[handle_id] = value
+        return _Handle(handle_id)
+
+    @classmethod
+    def _send(cls, conn, process, message, limits: SandboxLimits) -> Optional[SandboxResult]:
+        """
+        Sends a message to a worker.
+
+        Returns:
+            Optional[SandboxResult]: None, or the crash result if the worker died;
+            the caller then stops it and the pool starts a new one.
+        """
+        try:
+            conn.send(message)
+            return None
+        except (BrokenPipeError, EOFError, OSError):
+            process.join(timeout=1)
+            return cls._crashed(process, limits)
+
+    @staticmethod
+    def _crashed(process, limits: SandboxLimits) -> SandboxResult:
+        exitcode = process.exitcode
+        if hasattr(signal, "SIGXCPU") and exitcode == -signal.SIGXCPU:
+            return SandboxResult(ok=False, error=f"CPU time limit of {limits.cpu_seconds}s exceeded.")
+        if exitcode == -signal.SIGKILL:
+            return SandboxResult(ok=False, error=f"Sandbox process was killed (memory limit is {limits.memory_mb} MB).")
+        return SandboxResult(ok=False, error=f"Sandbox process exited unexpectedly (exit code {exitcode}).")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            sessions = list(self._sessions)
+        for process, conn in idle:
+            conn.close()
+            process.kill()
+        for session_id in sessions:
+            self.reset_session(session_id)
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+def get_sandbox_pool() -> SandboxPool:
+    """
+    Returns the process-wide sandbox pool, starting it on first use.
+    Size, limits and preloaded modules come from SANDBOX_POOL_SIZE,
+    SANDBOX_CPU_SECONDS, SANDBOX_MEMORY_MB, SANDBOX_WALL_SECONDS and SANDBOX_PRELOAD;
+    session workers of incremental runs from SANDBOX_SESSIONS,
+    SANDBOX_SESSION_IDLE_SECONDS and SANDBOX_STATE_MB (memory above which stored
+    cell outputs are evicted, default half of SANDBOX_MEMORY_MB).
+
+    Returns:
+        SandboxPool: Shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            preload = os.environ.get("SANDBOX_PRELOAD")
+            _pool = SandboxPool(
+                size=int(os.environ.get("SANDBOX_POOL_SIZE", "2")),
+                preload=[module.strip() for module in preload.split(",") if module.strip()] if preload is not None else None,
+                limits=SandboxLimits(
+                    cpu_seconds=int(os.environ.get("SANDBOX_CPU_SECONDS", "30")),
+                    memory_mb=int(os.environ.get("SANDBOX_MEMORY_MB", "1024")),
+                    wall_seconds=float(os.environ.get("SANDBOX_WALL_SECONDS", "60")),
+                ),
+                max_sessions=int(os.environ.get("SANDBOX_SESSIONS", "4")),
+                session_idle_seconds=float(os.environ.get("SANDBOX_SESSION_IDLE_SECONDS", "1800")),
+                state_mb=int(os.environ["SANDBOX_STATE_MB"]) if os.environ.get("SANDBOX_STATE_MB") else None,
+            )
+            logging.info(f"Started sandbox pool with {_pool.size} warm workers.")
+        return _pool
+
+def warm_sandbox_pool() -> None:
+    """
+    Starts the sandbox pool in a background thread so the first sandbox run does
+    not pay for the forkserver's library imports.
+    """
+    if _pool is None:
+        threading.Thread(target=get_sandbox_pool, name="sandbox-warmup", daemon=True).start()
@@ -0,0 +1,99 @@
+# sandbox_store.py
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+class SandboxStore:
+    """
+    Server-side handoff of editor snapshots to the sandbox page. Snapshots live in
+    process memory, are addressed by an unguessable id and are evicted per session
+    (oldest first), globally (least recently used) and by age.
+    """
+
+    def __init__(self, max_snapshots: int = 256, max_per_session: int = 5, ttl_seconds: float = 6 * 3600):
+        self.max_snapshots = max_snapshots
+        self.max_per_session = max_per_session
+        self.ttl_seconds = ttl_seconds
+        # snapshot_id -> (session_id, code, created_at)
+        self._snapshots: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, session_id: str, code: str) -> str:
+        """
+        Stores a snapshot of the editor buffer.
+
+        Args:
+            session_id (str): Streamlit session that produced the snapshot.
+            code (str): Code to hand over to the sandbox.
+
+        Returns:
+            str: Snapshot id to pass to the sandbox page.
+        """
+        snapshot_id = secrets.token_urlsafe(12)
+        with self._lock:
+            self._snapshots[snapshot_id] = (session_id, code, time.time())
+            self._evict()
+        return snapshot_id
+
+    def get(self, snapshot_id: str) -> Optional[str]:
+        """
+        Returns the code of a snapshot, if it has not been evicted.
+
+        Args:
+            snapshot_id (str): Id returned by `put`.
+
+        Returns:
+            Optional[str]: Snapshot code, or None.
+        """
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+            if entry is None or time.time() - entry[2] > self.ttl_seconds:
+                return None
+            self._snapshots.move_to_end(snapshot_id)
+            return entry[1]
+
+    def latest(self, session_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Returns the most recent snapshot of a session.
+
+        Args:
+            session_id (str): Streamlit session id.
+
+        Returns:
+            Optional[Tuple[str, str]]: (snapshot_id, code), or None.
+        """
+        with self._lock:
+            newest = None
+            for snapshot_id, (owner, code, created_at) in self._snapshots.items():
+                if owner == session_id and (newest is None or created_at >= newest[2]):
+                    newest = (snapshot_id, code, created_at)
+        return (newest[0], newest[1]) if newest else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "snapshots": len(self._snapshots),
+                "sessions": len({owner for owner, _, _ in self._snapshots.values()}),
+                "bytes": sum(len(code) for _, code, _ in self._snapshots.values()),
+            }
+
+    def _evict(self) -> None:
+        now = time.time()
+        for snapshot_id in [sid for sid, (_, _, created_at) in self._snapshots.items() if now - created_at > self.ttl_seconds]:
+            del self._snapshots[snapshot_id]
+
+        per_session: Dict[str, list] = {}
+        for snapshot_id, (owner, _, created_at) in self._snapshots.items():
+            per_session.setdefault(owner, []).append((created_at, snapshot_id))
+        for snapshots in per_session.values():
+            snapshots.sort()
+            for _, snapshot_id in snapshots[:-self.max_per_session]:
+                del self._snapshots[snapshot_id]
+
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+
+sandbox_store = SandboxStore()
@@ -0,0 +1,102 @@
+# startup_report.py
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+def measure_import(module: str) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """
+    Imports a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): Module to import (e.g. "app").
+
+    Returns:
+        Tuple[float, Dict[str, Tuple[int, int]]]: Total import time in milliseconds and
+        per-module (self, cumulative) times in microseconds.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"Importing '{module}' failed:\n" + "\n".join(errors[-20:]))
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not self_us.isdigit():
+            continue  # header line
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+    return total_ms, modules
+
+def top_level_breakdown(modules: Dict[str, Tuple[int, int]]) -> List[Tuple[str, float]]:
+    """
+    Sums self time per top-level package (anthropic, openai, github, ...).
+
+    Args:
+        modules (Dict[str, Tuple[int, int]]): Output of `measure_import`.
+
+    Returns:
+        List[Tuple[str, float]]: (package, milliseconds), slowest first.
+    """
+    packages: Dict[str, float] = {}
+    for name, (self_us, _) in modules.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + self_us / 1000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Report the cold import time of the app entry point.")
+    parser.add_argument("--module", default="app", help="Entry module to import (default: app).")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to measure; the median is reported.")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages to list.")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.environ.get("STARTUP_BUDGET_MS", "0")),
+        help="Fail (exit 1) if the median cold import time exceeds this many milliseconds.",
+    )
+    parser.add_argument(
+        "--forbid",
+        default="",
+        help="Comma-separated packages that must not be imported at startup (e.g. anthropic,openai).",
+    )
+    args = parser.parse_args()
+
+    runs = [measure_import(args.module) for _ in range(max(args.runs, 1))]
+    totals = [total_ms for total_ms, _ in runs]
+    median_ms = statistics.median(totals)
+    # Break down the run closest to the median.
+    _, modules = min(runs, key=lambda run: abs(run[0] - median_ms))
+
+    print(f"Cold import of '{args.module}': median {median_ms:.0f} ms over {len(runs)} runs "
+          f"(min {min(totals):.0f} ms, max {max(totals):.0f} ms)")
+    print(f"{'package':<32}{'self ms':>10}")
+    for package, package_ms in top_level_breakdown(modules)[:args.top]:
+        print(f"{package:<32}{package_ms:>10.1f}")
+
+    failed = False
+    imported_packages = {name.split(".")[0] for name in modules}
+    for package in filter(None, (package.strip() for package in args.forbid.split(","))):
+        if package in imported_packages:
+            print(f"FAIL: '{package}' is imported at startup but should load on first use")
+            failed = True
+    if args.budget_ms and median_ms > args.budget_ms:
+        print(f"FAIL: {median_ms:.0f} ms exceeds the startup budget of {args.budget_ms:.0f} ms")
+        failed = True
+    elif args.budget_ms:
+        print(f"OK: within the startup budget of {args.budget_ms:.0f} ms")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+# test_sandbox_compiler.py
+
+from sandbox_compiler import split_sandbox_cells
+
+def test_method_call_changes_global_in_place():
+    cells = split_sandbox_cells("a = [1]\nb = a\nb.append(2)\n")
+    assert cells[2].mutates == {"b"}
+    assert cells[2].providers == (1,)
+
+def test_augmented_assignment_changes_global_in_place():
+    cells = split_sandbox_cells("a = [1]\nb = a\nb += [2]\nst.write(a)\n")
+    assert cells[2].mutates == {"b"}
+    assert "b" in cells[2].writes
+
+def test_augmented_assignment_to_item_changes_container():
+    cells = split_sandbox_cells("a = [[1]]\nb = a\nb[0] *= 2\n")
+    assert cells[2].mutates == {"b"}
+
+def test_augmented_assignment_to_local_is_not_a_change():
+    cells = split_sandbox_cells("def f(x):\n    x += 1\n    return x\n")
+    assert cells[0].mutates == frozenset()
@@ -0,0 +1,138 @@
+# test_sandbox_runner.py
+
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sandbox_compiler import compile_sandbox_code, split_sandbox_cells
+from sandbox_runner import SandboxPool, _load_message
+
+class FakeStreamlit:
+    """
+    Stands in for the streamlit module on the Streamlit side of the pipe.
+    """
+
+    def __init__(self, delay=0.0):
+        self.written = []
+        self.delay = delay
+        self.session_state = {"github_token": "secret"}
+        self.secrets = {"HUBGIT_TOKEN": "secret"}
+
+    def write(self, *args, **kwargs):
+        time.sleep(self.delay)
+        self.written.append(args)
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SandboxPool(size=1, preload=[])
+    yield pool
+    pool.shutdown()
+
+def run(pool, source, st=None):
+    st = st or FakeStreamlit()
+    return pool.run(compile_sandbox_code(source)[0], source, st_module=st), st.written
+
+def run_cells(pool, session_id, source):
+    st = FakeStreamlit()
+    result = pool.run_cells(session_id, split_sandbox_cells(source), source, st_module=st)
+    assert result.ok, result.error
+    return result, st.written
+
+@pytest.mark.parametrize("edit", ["b += [2]", "b *= 2"])
+def test_augmented_assignment_through_alias_reruns_readers(pool, edit):
+    source = "a = [1]\nb = a\n{}\nst.write(a)\n"
+    _, written = run_cells(pool, f"alias-{edit}", source.format(edit))
+    assert written == [([1, 2] if "+" in edit else [1, 1],)]
+    result, written = run_cells(pool, f"alias-{edit}", source.format(edit.replace("2", "3")))
+    assert written == [([1, 3] if "+" in edit else [1, 1, 1],)]
+    assert result.cells_cached == 0
+
+class Hostile:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return (os.system, (f"touch {self.marker}",))
+
+def test_messages_with_other_classes_are_refused(tmp_path):
+    marker = tmp_path / "pwned"
+    with pytest.raises(pickle.UnpicklingError):
+        _load_message(pickle.dumps(("call", 0, "write", (Hostile(marker),), {})))
+    assert not marker.exists()
+
+def test_hostile_pickle_through_the_pipe_ends_the_run(pool, tmp_path):
+    marker = tmp_path / "pwned"
+    source = f"""
+import gc, os
+from multiprocessing.connection import Connection
+
+class Hostile:
+    def __reduce__(self):
+        return (os.system, ("touch {marker}",))
+
+conn = next(o for o in gc.get_objects() if isinstance(o, Connection))
+conn.send(("call", 0, "write", (Hostile(),), {{}}))
+conn.recv()
+"""
+    result, written = run(pool, source)
+    assert not result.ok and "refused" in result.error
+    assert not marker.exists()
+    assert written == []
+
+def test_only_streamlit_api_is_served(pool):
+    source = """
+for name in ("_conn", "secrets", "write.__globals__"):
+    try:
+        eval("st." + name)
+    except Exception as e:
+        st.write(name, type(e).__name__)
+"""
+    result, written = run(pool, source)
+    assert result.ok, result.error
+    assert written == [("_conn", "SandboxProxyError"), ("secrets", "SandboxProxyError"), ("write.__globals__", "AttributeError")]
+
+def test_session_state_holds_only_sandbox_keys(pool):
+    st = FakeStreamlit()
+    source = """
+st.session_state.x = 1
+st.session_state["y"] = 2
+st.write(sorted(st.session_state), "github_token" in st.session_state, st.session_state.get("github_token"))
+"""
+    result, written = run(pool, source, st)
+    assert result.ok, result.error
+    assert written == [(["x", "y"], False, None)]
+    assert st.session_state == {"github_token": "secret", "sandbox:x": 1, "sandbox:y": 2}
+
+def test_arrays_and_frames_arrive_as_data(pool):
+    source = "import numpy as np\nimport pandas as pd\nst.write(np.arange(3), pd.DataFrame({'a': [1, 2]}), pd.Series([0.5], name='s'))\n"
+    result, written = run(pool, source)
+    assert result.ok, result.error
+    array, frame, series = written[0]
+    np.testing.assert_array_equal(array, np.arange(3))
+    pd.testing.assert_frame_equal(frame, pd.DataFrame({"a": [1, 2]}))
+    pd.testing.assert_series_equal(series, pd.Series([0.5], name="s"))
+
+WORKER_EXITS_MID_CALL = """# %%
+import gc, os
+from multiprocessing.connection import Connection
+
+conn = next(o for o in gc.get_objects() if isinstance(o, Connection))
+conn.send(("call", 0, "write", ("bye",), {}))
+os._exit(3)
+"""
+
+def test_worker_exiting_mid_call_is_a_crash(pool):
+    result, _ = run(pool, WORKER_EXITS_MID_CALL, FakeStreamlit(delay=0.5))
+    assert not result.ok and "exit code 3" in result.error
+    assert run(pool, "st.write(1)\n")[1] == [(1,)]
+
+def test_session_worker_exiting_mid_call_is_replaced(pool):
+    st = FakeStreamlit(delay=0.5)
+    result = pool.run_cells("exits", split_sandbox_cells(WORKER_EXITS_MID_CALL), WORKER_EXITS_MID_CALL, st_module=st)
+    assert not result.ok and "exit code 3" in result.error
+    _, written = run_cells(pool, "exits", "st.write(1)\n")
+    assert written == [(1,)]
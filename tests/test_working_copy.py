@@ -0,0 +1,107 @@
+# test_working_copy.py
+
+import os
+import subprocess
+
+import pytest
+
+from working_copy import WorkingCopy, WorkingCopyConflict
+
+AUTHOR = ("Octo Cat", "1+octocat@users.noreply.github.com")
+
+def git(directory, *args, input=None):
+    return subprocess.run(
+        ["git", "-C", str(directory), *args], input=input, capture_output=True, check=True,
+        env=dict(os.environ, GIT_AUTHOR_NAME="upstream", GIT_AUTHOR_EMAIL="upstream@example.com",
+                 GIT_COMMITTER_NAME="upstream", GIT_COMMITTER_EMAIL="upstream@example.com"),
+    ).stdout.decode()
+
+def push_upstream(remote, tmp_path, files, message):
+    """
+    Commits `files` (path -> content, None deletes) to the remote's main branch
+    from a separate clone, as another user would.
+    """
+    checkout = tmp_path / "upstream"
+    if not checkout.exists():
+        git(tmp_path, "clone", "--quiet", "--branch", "main", str(remote), str(checkout))
+    git(checkout, "pull", "--quiet")
+    for path, content in files.items():
+        if content is None:
+            git(checkout, "rm", "--quiet", path)
+        else:
+            (checkout / path).write_text(content)
+            git(checkout, "add", path)
+    git(checkout, "commit", "--quiet", "-m", message)
+    git(checkout, "push", "--quiet", "origin", "main")
+
+@pytest.fixture
+def remote(tmp_path):
+    remote = tmp_path / "remote.git"
+    git(tmp_path, "init", "--quiet", "--bare", "--initial-branch=main", str(remote))
+    git(remote, "config", "uploadpack.allowFilter", "true")
+    seed = tmp_path / "seed"
+    git(tmp_path, "init", "--quiet", "--initial-branch=main", str(seed))
+    (seed / "lib").mkdir()
+    (seed / "app.py").write_text("print('hello')\n")
+    (seed / "lib" / "util.py").write_text("def util():\n    return 1\n")
+    (seed / "run.sh").write_text("#!/bin/sh\n")
+    os.chmod(seed / "run.sh", 0o755)
+    os.symlink("app.py", seed / "link.py")
+    git(seed, "add", ".")
+    git(seed, "commit", "--quiet", "-m", "initial")
+    git(seed, "push", "--quiet", str(remote), "main")
+    return remote
+
+@pytest.fixture
+def copy(remote, tmp_path):
+    return WorkingCopy(f"file://{remote}", str(tmp_path / "copy")).open()
+
+def test_lists_files_without_downloading_blobs(copy):
+    assert copy.branch == "main"
+    assert sorted(copy.list_files()) == ["app.py", "lib/util.py", "run.sh"]
+    assert len(copy._missing_blobs(copy.head())) == 4
+    assert copy.list_entries()["app.py"][1] == 0
+
+def test_reads_download_only_the_blob_read(copy):
+    assert copy.read("lib/util.py") == b"def util():\n    return 1\n"
+    assert copy.read("missing.py") is None
+    assert len(copy._missing_blobs(copy.head())) == 3
+    assert copy.list_entries()["lib/util.py"][1] == 25
+
+def test_commit_keeps_modes_and_author(copy, remote):
+    copy.commit({"run.sh": "#!/bin/sh\necho hi\n", "new.py": "x = 1\n", "app.py": None}, "edit", author=AUTHOR)
+    assert copy.push() == 1
+    modes = {line.split("\t")[1]: line.split()[0] for line in git(remote, "ls-tree", "main").splitlines()}
+    assert modes == {"lib": "040000", "link.py": "120000", "new.py": "100644", "run.sh": "100755"}
+    assert git(remote, "log", "-1", "--format=%an <%ae>|%cn <%ce>", "main").strip() == (
+        "Octo Cat <1+octocat@users.noreply.github.com>|Octo Cat <1+octocat@users.noreply.github.com>"
+    )
+
+def test_commit_rejects_stale_base(copy):
+    base = copy.list_files()["app.py"]
+    copy.commit({"app.py": "print(1)\n"}, "first", expected={"app.py": base})
+    with pytest.raises(WorkingCopyConflict):
+        copy.commit({"app.py": "print(2)\n"}, "second", expected={"app.py": base})
+    with pytest.raises(WorkingCopyConflict):
+        copy.commit({"app.py": "print(3)\n"}, "create", expected={"app.py": None})
+
+def test_unpushed_commits_are_replayed_onto_remote_changes(copy, remote, tmp_path):
+    copy.commit({"app.py": "print('local')\n"}, "local edit", author=AUTHOR)
+    push_upstream(remote, tmp_path, {"lib/util.py": "def util():\n    return 2\n"}, "remote edit")
+    copy.sync(force=True)
+    assert copy.push_error is None
+    assert copy.read("app.py") == b"print('local')\n"
+    assert copy.read("lib/util.py") == b"def util():\n    return 2\n"
+    assert copy.push() == 1
+    assert git(remote, "log", "--format=%s", "main").split("\n")[:2] == ["local edit", "remote edit"]
+
+def test_conflicting_remote_change_keeps_local_commits(copy, remote, tmp_path):
+    copy.commit({"app.py": "print('local')\n"}, "local edit", author=AUTHOR)
+    push_upstream(remote, tmp_path, {"app.py": "print('remote')\n"}, "remote edit")
+    copy.sync(force=True)
+    assert "app.py" in copy.push_error
+    assert copy.read("app.py") == b"print('local')\n"
+    with pytest.raises(WorkingCopyConflict):
+        copy.push()
+    assert copy.pending() == 1
+    assert git(remote, "show", "main:app.py") == "print('remote')\n"
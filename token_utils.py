@@ -0,0 +1,49 @@
+# token_utils.py
+
+import re
+
+# Pieces a BPE tokenizer splits source code into: runs of letters and of digits,
+# single punctuation characters, and newlines or indentation runs (single spaces
+# merge into the following word).
+_LETTERS = re.compile(r"[A-Za-z]+")
+_DIGITS = re.compile(r"[0-9]+")
+_PUNCTUATION = re.compile(r"[^A-Za-z0-9\s]")
+_BREAKS = re.compile(r"\s{2,}|\n")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens a Claude or GPT tokenizer produces for text,
+    without loading a tokenizer. Meant for budgeting prompts, not for billing.
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Estimated token count.
+    """
+    # Common words are one token, long identifiers several.
+    letters = sum((len(word) + 3) >> 2 for word in _LETTERS.findall(text))
+    digits = sum((len(number) + 2) // 3 for number in _DIGITS.findall(text))
+    return letters + digits + len(_PUNCTUATION.findall(text)) + len(_BREAKS.findall(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts text at a line boundary so that it fits an estimated token count.
+
+    Args:
+        text (str): Text to cut.
+        max_tokens (int): Token limit.
+
+    Returns:
+        str: The longest prefix of whole lines within the limit.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for line in text.splitlines(keepends=True):
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "".join(kept)
@@ -3,7 +3,34 @@
 import streamlit as st
 import time
 import logging
-from github_ops import list_repos, list_files, get_file_content, create_repo, delete_repo, create_file, delete_file, update_file
+import mimetypes
+import posixpath
+import re
+import zipfile
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from typing import Dict, List, Optional, Tuple
+from github import GithubException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from sandbox_store import sandbox_store
+from clients import get_authenticated_login, github_rate_budget
+from rate_governor import bind
+from github_ops import (
+    EDITOR_MAX_BYTES, list_repos, list_files, list_tree, fetch_file, prefetch_files, prefetch_candidates, create_repo, delete_repo, create_file, delete_file, save_file, commit_changes
+)
+from github_cache import cache_stats
+from path_index import PATH_RESULTS, get_path_index, group_by_directory
+from code_search import content_index, refresh_index, repo_key
+from repo_index import warm_repo_index
+
+SANDBOX_URL = "https://streamcoder.ploomberapp.io/sandbox"
+#SANDBOX_URL = "https://streamcoder.streamlit.app/sandbox"
+SANDBOX_REPO = "streamcoder"
+SANDBOX_FILE = "pages/sandbox.txt"
+
+# Optional GitHub mirror of the sandbox; runs off the script thread.
+_sandbox_sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sandbox-sync")
 
 @st.dialog("Create/Delete Repositories")
 def repo_management_dialog():
@@ -56,6 +83,101 @@ def file_management_dialog():
             else:
                 st.error("File path and commit message cannot be empty.", icon=':material/sentiment_dissatisfied:')
 
+def _normalize_repo_path(path: str) -> str:
+    """
+    Normalizes a user supplied or archived path to a repository-relative path,
+    or returns "" if it points outside the repository.
+    """
+    path = posixpath.normpath(path.replace("\\", "/")).lstrip("/")
+    return "" if path in (".", "") or path.startswith("..") else path
+
+def _stage_uploads(uploaded_files, target_dir: str) -> int:
+    """
+    Stages uploaded files; zip archives are expanded into the target directory.
+    """
+    staged = 0
+    for uploaded_file in uploaded_files:
+        data = uploaded_file.getvalue()
+        if uploaded_file.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(BytesIO(data)) as archive:
+                entries = [(info.filename, archive.read(info)) for info in archive.infolist() if not info.is_dir()]
+        else:
+            entries = [(uploaded_file.name, data)]
+        for name, content in entries:
+            path = _normalize_repo_path(posixpath.join(target_dir, name))
+            if not path:
+                continue
+            try:
+                st.session_state.staged_changes[path] = content.decode("utf-8")
+            except UnicodeDecodeError:
+                st.session_state.staged_changes[path] = content
+            staged += 1
+    return staged
+
+@st.dialog("Stage and commit changes", width="large")
+def batch_commit_dialog():
+    """
+    Dialog for staging several edits, creations, deletions and uploads and
+    committing them to a repository as one commit.
+    """
+    repos = list_repos(st.session_state.g)
+    default_repo = st.session_state.get('staged_repo') or st.session_state.get('selected_repo', '')
+    selected_repo = st.selectbox("Choose a repository:", repos, index=repos.index(default_repo) if default_repo in repos else 0)
+
+    if not selected_repo:
+        st.warning("Please select a repository first.", icon=':material/info:')
+        return
+    if st.session_state.get('staged_repo') != selected_repo:
+        # Staged changes belong to a single repository.
+        st.session_state.staged_repo = selected_repo
+        st.session_state.staged_changes = {}
+
+    stage_edit, stage_create, stage_delete, stage_upload = st.tabs(["Editor file", "New file", "Delete", "Upload"])
+    with stage_edit:
+        if st.session_state.get('selected_file') and st.session_state.get('selected_repo') == selected_repo:
+            if st.button(f"Stage editor content of {st.session_state.selected_file}"):
+                st.session_state.staged_changes[st.session_state.selected_file] = st.session_state.file_content
+        else:
+            st.info("Load a file from this repository to stage the editor content.", icon=':material/info:')
+    with stage_create:
+        new_path = st.text_input("File Path:", key="batch_new_path")
+        new_content = st.text_area("File Content:", height=150, key="batch_new_content")
+        if st.button("Stage new file"):
+            path = _normalize_repo_path(new_path)
+            if path:
+                st.session_state.staged_changes[path] = new_content
+            else:
+                st.error("File path cannot be empty.", icon=':material/sentiment_dissatisfied:')
+    with stage_delete:
+        delete_paths = st.multiselect("Files to delete:", list_files(st.session_state.g, selected_repo))
+        if st.button("Stage deletions") and delete_paths:
+            for path in delete_paths:
+                st.session_state.staged_changes[path] = None
+    with stage_upload:
+        target_dir = st.text_input("Target directory:", key="batch_upload_dir")
+        uploaded_files = st.file_uploader("Files or .zip archives:", accept_multiple_files=True, key="batch_uploads")
+        if st.button("Stage uploads") and uploaded_files:
+            st.success(f"Staged {_stage_uploads(uploaded_files, target_dir)} file(s).", icon=':material/sentiment_satisfied:')
+
+    staged_changes = st.session_state.staged_changes
+    st.write(f"**Staged changes ({len(staged_changes)})**")
+    for path, content in list(staged_changes.items()):
+        label_col, remove_col = st.columns([6, 1], vertical_alignment="center")
+        with label_col:
+            action = "delete" if content is None else f"write {len(content):,} {'bytes' if isinstance(content, bytes) else 'chars'}"
+            st.caption(f"`{path}` — {action}")
+        with remove_col:
+            if st.button("Unstage", key=f"unstage_{path}"):
+                del staged_changes[path]
+                st.rerun(scope="fragment")
+
+    commit_message = st.text_input("Commit Message:", key="batch_commit_message")
+    if st.button(f"Commit {len(staged_changes)} change(s)", disabled=not staged_changes, type="primary"):
+        if not commit_message.strip():
+            st.error("Commit message cannot be empty.", icon=':material/sentiment_dissatisfied:')
+        elif commit_changes(st.session_state.g, selected_repo, dict(staged_changes), commit_message.strip()):
+            st.session_state.staged_changes = {}
+
 @st.dialog("Choose file from a repo")
 def file_selector_dialog():
     """
@@ -68,24 +190,218 @@ def file_selector_dialog():
         st.warning("Please select a repository first.", icon=':material/info:')
         return
 
-    files = list_files(st.session_state.g, selected_repo)
-    if not files:
+    head_sha, entries = list_tree(st.session_state.g, selected_repo)
+    if not entries:
         st.warning(f"No files found in repository '{selected_repo}'.", icon=':material/info:')
         return
 
-    selected_file = st.selectbox("Select File to Edit:", files)
+    # Only the best matches are sent to the browser, not the whole tree.
+    index = get_path_index(selected_repo, head_sha, entries)
+    query = st.text_input(
+        "Search files:", key="file_query", type="search", live=True,
+        placeholder="Part of a path or name, e.g. 'pages sandbox' or 'ghops'",
+    )
+    recent = [path for repo, path in st.session_state.recent_files if repo == selected_repo and path in entries]
+    matches = index.search(query) if query.strip() else list(dict.fromkeys(recent + index.search("")))[:PATH_RESULTS]
+    if not matches:
+        st.warning(f"No files match '{query}'.", icon=':material/info:')
+        return
+    groups = group_by_directory(matches)
+    files = [path for _, paths in groups for path in paths]
+    selected_file = st.selectbox(
+        "Select File to Edit:", files, format_func=lambda path: f"{posixpath.dirname(path) or '.'}/ › {posixpath.basename(path)}",
+    )
+    st.caption(f"{len(files)} of {len(index)} files, in {len(groups)} folder(s)")
+    # Warm the blob cache with the files likely to be opened next.
+    prefetch_files(st.session_state.g, selected_repo, entries, prefetch_candidates(index.siblings(selected_file), selected_file, recent))
+    # Build the repository context index before the first generation asks for it.
+    if st.session_state.get('context_budget', 0):
+        warm_repo_index(st.session_state.g, selected_repo)
 
     if st.button("Load File Content"):
         if selected_repo and selected_file:
-            content = get_file_content(st.session_state.g, selected_repo, selected_file)
-            if content is not None:
-                st.session_state.file_content = content
-                st.session_state.selected_repo = selected_repo
-                st.session_state.selected_file = selected_file
-                st.rerun()
+            open_file(selected_repo, selected_file)
         else:
             st.error("Please select both repository and file.", icon=':material/sentiment_dissatisfied:')
 
+    stats = cache_stats()
+    st.caption(
+        f"GitHub cache: {stats['hits']} hits (304) / {stats['misses']} misses, "
+        f"{stats['revalidations']} revalidations, {stats['entries']} entries"
+    )
+    rate_budget_caption()
+
+def open_file(repo_name: str, file_path: str, line: Optional[int] = None) -> None:
+    """
+    Opens a repository file: text files in the editor (or, if too large for it,
+    in the read-only viewer), binary files as an inline preview.
+
+    Args:
+        repo_name (str): Name of the repository.
+        file_path (str): Path of the file.
+        line (Optional[int]): Line to show, for the read-only viewer.
+    """
+    file = fetch_file(st.session_state.g, repo_name, file_path)
+    if file is None:
+        return
+    if file.binary:
+        binary_preview(file)
+    elif file.truncated or file.size > EDITOR_MAX_BYTES:
+        # Too big for the editor component: open the read-only viewer instead.
+        st.session_state.large_file = {
+            'repo': repo_name,
+            'path': file_path,
+            'size': file.size,
+            'truncated': file.truncated,
+            'lines': file.text.splitlines(),
+        }
+        if line:
+            st.session_state.large_file_page = (line - 1) // st.session_state.get('large_file_window', 500) + 1
+        st.rerun()
+    else:
+        content = file.text
+        st.session_state.file_content = content
+        # The editing base: used to skip no-op saves and to merge upstream changes.
+        st.session_state.base_content = content
+        st.session_state.file_sha = file.sha
+        st.session_state.selected_repo = repo_name
+        st.session_state.selected_file = file_path
+        st.session_state.large_file = None
+        st.session_state.recent_files = [[repo_name, file_path]] + [
+            entry for entry in st.session_state.recent_files if entry != [repo_name, file_path]
+        ][:9]
+        if line:
+            st.toast(f"Opened {file_path} at the match on line {line}.", icon=':material/search:')
+        st.rerun()
+
+@st.dialog("Search code in all repositories", width="large")
+def code_search_dialog():
+    """
+    Dialog for searching file contents across the user's repositories and
+    opening a match in the editor.
+    """
+    repos = [repo for repo in list_repos(st.session_state.g) if repo]
+    if not repos:
+        st.warning("No repositories to search.", icon=':material/info:')
+        return
+
+    force = st.button("Refresh index", help="Look for new commits now instead of at most once a minute.")
+    progress = st.empty()
+
+    def show_progress(repo_name: str, done: int, total: int):
+        progress.progress(done / max(total, 1), text=f"Indexing '{repo_name}': {done:,} of {total:,} new files")
+    refresh_index(st.session_state.g, repos, progress=show_progress, force=force)
+    progress.empty()
+
+    query_col, regex_col, case_col = st.columns([6, 1, 1], vertical_alignment="bottom")
+    with query_col:
+        query = st.text_input(
+            "Search:", key='code_search_query', type="search", live=True,
+            placeholder="Text to find, e.g. get_repo or def\\s+save_\\w+ with Regex on",
+        )
+    with regex_col:
+        regex = st.toggle("Regex", key='code_search_regex')
+    with case_col:
+        case_sensitive = st.toggle("Aa", key='code_search_case', help="Match case")
+    stats = content_index.stats()
+    st.caption(f"Index: {stats['files']:,} files in {stats['repos']} repositories, {stats['bytes'] / 1024 / 1024:,.1f} MB")
+    if not query:
+        return
+
+    started = time.perf_counter()
+    try:
+        hits, cut = content_index.search(
+            query, regex=regex, case_sensitive=case_sensitive, repos=[repo_key(st.session_state.g, repo) for repo in repos]
+        )
+    except re.error as e:
+        st.error(f"Invalid regular expression: {e}", icon=':material/sentiment_dissatisfied:')
+        return
+    elapsed = (time.perf_counter() - started) * 1000
+    files: Dict[Tuple[str, str], List] = {}
+    for hit in hits:
+        files.setdefault((hit.repo, hit.path), []).append(hit)
+    st.caption(
+        f"{len(hits)}{'+' if cut else ''} matching lines in {len(files)} files ({elapsed:.0f} ms)"
+        + (" · showing the first ones, refine the search for more" if cut else "")
+    )
+    for number, ((repo, path), file_hits) in enumerate(files.items()):
+        repo_name = repo.split("/", 1)[1]
+        header_col, open_col = st.columns([6, 1], vertical_alignment="center")
+        with header_col:
+            st.markdown(f"**{repo_name}** · `{path}`")
+        with open_col:
+            if st.button("Open", key=f"code_search_open_{number}"):
+                open_file(repo_name, path, line=file_hits[0].line)
+        st.code(
+            "\n".join(f"{hit.line:>5}  {hit.text}" for hit in file_hits),
+            language=posixpath.splitext(path)[1].lstrip(".") or None,
+        )
+
+def rate_budget_caption():
+    """
+    Shows the remaining GitHub API quota and this session's share of it.
+    """
+    budget = github_rate_budget(st.session_state.g)
+    if budget['limit'] is None:
+        return
+    text = f"GitHub API: {budget['remaining']:,} of {budget['limit']:,} requests left"
+    if budget['reset_in'] is not None:
+        text += f", resets in {budget['reset_in'] / 60:.0f} min"
+    text += f" · this session: {budget['session_used']:,} of its {budget['session_share']:,} share"
+    if budget['blocked_for']:
+        text += f" · paused {budget['blocked_for']:.0f} s (secondary rate limit)"
+    st.caption(text)
+
+def binary_preview(file) -> None:
+    """
+    Shows a binary file without decoding it: images inline, anything else as a hex dump.
+
+    Args:
+        file (FileData): File returned by `fetch_file`.
+    """
+    st.warning(f"'{file.path}' is a binary file ({file.size:,} bytes) and cannot be opened in the editor.", icon=':material/info:')
+    mime_type, _ = mimetypes.guess_type(file.path)
+    if mime_type and mime_type.startswith("image/") and not file.truncated:
+        st.image(file.data, caption=file.path)
+        return
+    head = file.data[:512]
+    st.code(
+        "\n".join(
+            f"{offset:08x}  {head[offset:offset + 16].hex(' '):<47}  "
+            f"{''.join(chr(b) if 32 <= b < 127 else '.' for b in head[offset:offset + 16])}"
+            for offset in range(0, len(head), 16)
+        ),
+        language=None
+    )
+
+def large_file_viewer():
+    """
+    Read-only, windowed view of a text file that is too large for the editor.
+    Only the current window of lines is sent to the browser.
+    """
+    view = st.session_state.large_file
+    lines = view['lines']
+    st.info(
+        f"**{view['path']}** ({view['size'] / 1024:,.0f} KB, {len(lines):,} lines) is too large for the editor "
+        f"and is shown read-only{'; only the beginning of the file was read' if view['truncated'] else ''}.",
+        icon=':material/info:'
+    )
+    window_col, page_col, close_col = st.columns([2, 2, 1], vertical_alignment="bottom")
+    with window_col:
+        window = st.select_slider("Lines per page:", [100, 250, 500, 1000, 2000], value=500, key='large_file_window')
+    pages = max(1, -(-len(lines) // window))
+    with page_col:
+        page = st.number_input(f"Page (of {pages:,}):", min_value=1, max_value=pages, value=1, key='large_file_page')
+    with close_col:
+        if st.button("Close viewer"):
+            st.session_state.large_file = None
+            st.rerun()
+    start = (page - 1) * window
+    end = min(start + window, len(lines))
+    st.caption(f"Lines {start + 1:,}-{end:,} of {len(lines):,}")
+    language = posixpath.splitext(view['path'])[1].lstrip(".") or None
+    st.code("\n".join(lines[start:end]), language=language)
+
 @st.dialog("Confirm repo file update")
 def dialog_update():
     """
@@ -100,15 +416,19 @@ def dialog_update():
         if all(key in st.session_state and st.session_state[key] for key in required_keys):
             st.write("***Attempting to update the file...***")
             try:
-                success = update_file(
+                result = save_file(
                     st.session_state.g,
                     st.session_state.selected_repo,
                     st.session_state.selected_file,
                     st.session_state.file_content,
-                    commit_message.strip()
+                    commit_message.strip(),
+                    st.session_state.file_sha,
+                    st.session_state.base_content,
                 )
-                if success:
-                    #st.success(f"File '{st.session_state.selected_file}' updated successfully. This message will self-destruct in 5 seconds...", icon=':material/sentiment_satisfied:')
+                st.session_state.file_content = result.content
+                st.session_state.file_sha = result.sha
+                st.session_state.base_content = result.base_content
+                if result.status != "error":
                     time.sleep(5)
                     st.rerun()
             except Exception as e:
@@ -119,29 +439,48 @@ def dialog_update():
             time.sleep(5)
             st.rerun()
 
+def sandbox_link() -> str:
+    """
+    Returns the sandbox page URL, pointing at the session's latest snapshot if any.
+    """
+    snapshot_id = st.session_state.get('sandbox_snapshot')
+    return f"{SANDBOX_URL}?snapshot={snapshot_id}" if snapshot_id else SANDBOX_URL
+
 def execute_code_sandbox():
     """
-    Executes the code in the sandbox repository by saving it to a specific file.
+    Hands the editor content to the sandbox page through the in-process snapshot store;
+    the next app run shows the confirmation with the sandbox link. Committing it to the
+    sandbox repository is an optional background side effect (SANDBOX_GITHUB_SYNC=1).
+    """
+    ctx = get_script_run_ctx()
+    editor_content = st.session_state.file_content
+    snapshot_id = sandbox_store.put(ctx.session_id if ctx else "", editor_content)
+    st.session_state.sandbox_snapshot = snapshot_id
+    st.session_state.sandbox_saved = True
+    logging.info(f"Code handed to sandbox snapshot '{snapshot_id}'.")
+
+    if environ.get("SANDBOX_GITHUB_SYNC", "").lower() in ("1", "true", "yes"):
+        _sandbox_sync_executor.submit(bind(_commit_sandbox_code), st.session_state.g, editor_content)
+
+def _commit_sandbox_code(g, editor_content: str) -> None:
+    """
+    Commits sandbox code to the sandbox repository. Runs in a worker thread, so it
+    only logs and never touches Streamlit.
     """
+    commit_message = 'Update sandbox.py'
     try:
-        repo = st.session_state.g.get_user().get_repo("streamcoder")  # Update as needed
-        file_path = 'pages/sandbox.txt'
-        editor_content = st.session_state.file_content
-        commit_message = 'Update sandbox.py'
+        repo = g.get_repo(f"{get_authenticated_login(g)}/{SANDBOX_REPO}")
         try:
             # Try to get the file contents (if it exists)
-            contents = repo.get_contents(file_path)
-            repo.update_file(file_path, commit_message, editor_content, contents.sha)
-            st.success(f"Code output saved to {file_path} in the repository.", icon=':material/sentiment_satisfied:')
-            logging.info(f"Code saved to '{file_path}' in repo 'streamcoder'.")
+            contents = repo.get_contents(SANDBOX_FILE)
+            repo.update_file(SANDBOX_FILE, commit_message, editor_content, contents.sha)
+            logging.info(f"Code saved to '{SANDBOX_FILE}' in repo '{SANDBOX_REPO}'.")
         except GithubException as e:
             if e.status == 404:  # File not found
                 # If the file doesn't exist, create it
-                repo.create_file(file_path, commit_message, editor_content)
-                #st.success(f"File '{file_path}' created and code saved in the repository.", icon=':material/sentiment_satisfied:')
-                logging.info(f"File '{file_path}' created and code saved in repo 'streamcoder'.")
+                repo.create_file(SANDBOX_FILE, commit_message, editor_content)
+                logging.info(f"File '{SANDBOX_FILE}' created and code saved in repo '{SANDBOX_REPO}'.")
             else:
                 raise  # Re-raise the exception if it's not a 404 error
     except Exception as e:
-        logging.exception(f"Error saving code output to sandbox: {e}")
-        st.error(f"Error saving code output: {str(e)}", icon=':material/sentiment_dissatisfied:')
+        logging.exception(f"Error saving code output to sandbox repo: {e}")
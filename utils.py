@@ -13,8 +13,20 @@ def initialize_session_state():
         'selected_repo': '',
         'selected_file': '',
         'file_content': '',
+        'editor_text': '',
+        'editor_version': 0,
+        'file_sha': '',
+        'base_content': '',
+        'large_file': None,
+        'recent_files': [],
         'selected_llm': 'Sonnet-3.5',
+        'context_budget': 4000,
+        'token_usage': [],
+        'token_totals': None,
         'sandbox_code': '',
+        'sandbox_snapshot': '',
+        'staged_repo': '',
+        'staged_changes': {},
     }
     for key, default in keys_defaults.items():
         if key not in st.session_state:
@@ -0,0 +1,542 @@
+# working_copy.py
+
+import atexit
+import base64
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from os import environ
+from typing import Dict, List, Optional, Tuple, Union
+
+# Clones live here, one directory per remote URL and branch.
+WORKING_COPY_DIR = environ.get("WORKING_COPY_DIR", os.path.join(os.path.expanduser("~"), ".cache", "streamcoder", "repos"))
+# The remote is fetched at most this often.
+WORKING_COPY_FETCH_SECONDS = float(environ.get("WORKING_COPY_FETCH_SECONDS", "30"))
+# Local commits are pushed together this long after the first unpushed one.
+WORKING_COPY_PUSH_DELAY = float(environ.get("WORKING_COPY_PUSH_DELAY", "10"))
+# Commits made without an author are authored as this.
+_DEFAULT_AUTHOR = ("streamcoder", "streamcoder@users.noreply.github.com")
+# Mode of files a commit creates.
+_FILE_MODE = "100644"
+
+class WorkingCopyError(RuntimeError):
+    """
+    Raised when a git command fails, or when local commits conflict with the remote.
+    """
+
+class WorkingCopyConflict(WorkingCopyError):
+    """
+    Raised when a file changed since the version a change was based on.
+    """
+
+@dataclass
+class _PendingCommit:
+    """
+    A local commit that is not pushed yet, kept as data so it can be replayed
+    onto a remote that moved meanwhile.
+
+    Attributes:
+        message (str): Commit message.
+        changes (Dict[str, Optional[str]]): New blob SHA per path; None deletes the path.
+        bases (Dict[str, Optional[str]]): Blob SHA each path had when the change
+            was made; None if the path did not exist.
+        author (Tuple[str, str]): Name and email of the author, who is also the committer.
+        date (str): Author date in git's internal format, kept when the commit is replayed.
+    """
+    message: str
+    changes: Dict[str, Optional[str]]
+    bases: Dict[str, Optional[str]]
+    author: Tuple[str, str]
+    date: str
+
+class WorkingCopy:
+    """
+    Partial clone of one branch of a repository in a local cache directory:
+    commits and trees are fetched, blobs only when read. Listings, reads and
+    searches are served from the clone. Writes become local commits, built
+    without a checkout, and are pushed in batches.
+
+    The token is sent as an `http.extraHeader` on each remote command and is
+    never written to the clone's configuration.
+    """
+
+    def __init__(self, url: str, directory: str, branch: Optional[str] = None, token: Optional[str] = None):
+        self.url = url
+        self.directory = directory
+        self.branch = branch
+        self.token = token
+        self.push_error: Optional[str] = None
+        self._pending: List[_PendingCommit] = []
+        self._fetched = float("-inf")
+        self._listing: Tuple[Optional[str], Dict[str, str]] = (None, {})
+        self._sizes: Dict[str, int] = {}
+        self._push_timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    def _git(
+        self, *args: str, input: Optional[bytes] = None, env: Optional[Dict[str, str]] = None,
+        remote: bool = False, allowed: Tuple[int, ...] = (0,),
+    ) -> bytes:
+        """
+        Runs a git command in the clone and returns its standard output.
+
+        Raises:
+            WorkingCopyError: If the command exits with a status not in `allowed`.
+        """
+        command = ["git"]
+        if remote and self.token:
+            credentials = base64.b64encode(f"x-access-token:{self.token}".encode()).decode()
+            command += ["-c", f"http.extraHeader=Authorization: Basic {credentials}"]
+        command += ["-C", self.directory, *args]
+        completed = subprocess.run(
+            command,
+            input=input,
+            capture_output=True,
+            env=dict(os.environ, GIT_TERMINAL_PROMPT="0", **(env or {})),
+        )
+        if completed.returncode not in allowed:
+            raise WorkingCopyError(f"git {args[0]} failed: {completed.stderr.decode(errors='replace').strip()}")
+        return completed.stdout
+
+    @property
+    def _remote_ref(self) -> str:
+        return f"refs/remotes/origin/{self.branch}"
+
+    @property
+    def _local_ref(self) -> str:
+        return f"refs/heads/{self.branch}"
+
+    def open(self) -> "WorkingCopy":
+        """
+        Creates the clone on first use and fetches the branch.
+
+        Returns:
+            WorkingCopy: self.
+        """
+        with self._lock:
+            if not os.path.exists(os.path.join(self.directory, "HEAD")):
+                os.makedirs(self.directory, exist_ok=True)
+                self._git("init", "--bare", "--quiet")
+                self._git("remote", "add", "origin", self.url)
+                self._git("config", "core.repositoryformatversion", "1")
+                self._git("config", "extensions.partialClone", "origin")
+                self._git("config", "remote.origin.promisor", "true")
+                self._git("config", "remote.origin.partialCloneFilter", "blob:none")
+            if self.branch is None:
+                # "ref: refs/heads/main\tHEAD" names the default branch.
+                for line in self._git("ls-remote", "--symref", "origin", "HEAD", remote=True).decode().splitlines():
+                    if line.startswith("ref: "):
+                        self.branch = line[len("ref: refs/heads/"):].split("\t")[0]
+                if self.branch is None:
+                    raise WorkingCopyError(f"Cannot determine the default branch of {self.url}.")
+            self.sync(force=True)
+        return self
+
+    def sync(self, force: bool = False) -> None:
+        """
+        Fetches the branch, at most every WORKING_COPY_FETCH_SECONDS unless
+        forced. Unpushed local commits are replayed onto the new remote head; if
+        they conflict with it, reads keep being served from the local commits and
+        the conflict is reported by the next push.
+
+        Args:
+            force (bool): Fetch even if the last fetch is recent.
+
+        Raises:
+            WorkingCopyError: If fetching fails.
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._fetched < WORKING_COPY_FETCH_SECONDS:
+                return
+            self._fetch()
+            try:
+                self._replay(self._rev_parse(self._remote_ref))
+            except WorkingCopyError as e:
+                self.push_error = str(e)
+                logging.warning(e)
+
+    def _fetch(self) -> None:
+        self._git(
+            "fetch", "--quiet", "--no-tags", "--filter=blob:none", "origin",
+            f"+{self._local_ref}:{self._remote_ref}", remote=True,
+        )
+        self._fetched = time.monotonic()
+
+    def _rev_parse(self, ref: str) -> Optional[str]:
+        try:
+            return self._git("rev-parse", "--verify", "--quiet", ref).decode().strip() or None
+        except WorkingCopyError:
+            return None
+
+    def head(self) -> Optional[str]:
+        """
+        Returns the commit reads are served from: the remote head plus any
+        unpushed local commits.
+        """
+        with self._lock:
+            return self._rev_parse(self._local_ref)
+
+    def list_files(self) -> Dict[str, str]:
+        """
+        Lists the files of the branch.
+
+        Returns:
+            Dict[str, str]: Blob SHA per file path (submodules and symlinks excluded).
+        """
+        with self._lock:
+            head = self.head()
+            if head is None:
+                return {}
+            if self._listing[0] != head:
+                # Symlinks are not files to read or edit.
+                files = {path: sha for path, (mode, sha) in self._ls_tree(head).items() if mode != "120000"}
+                self._listing = (head, files)
+            return dict(self._listing[1])
+
+    def list_entries(self) -> Dict[str, Tuple[str, int]]:
+        """
+        Lists the files of the branch with their sizes. Sizes are only known for
+        blobs already downloaded and are 0 for the rest, since asking for them
+        would download the blobs.
+
+        Returns:
+            Dict[str, Tuple[str, int]]: Blob SHA and size per file path.
+        """
+        with self._lock:
+            head = self.head()
+            files = self.list_files()
+            if head is None:
+                return {}
+            missing = set(self._missing_blobs(head))
+            unsized = sorted({sha for sha in files.values() if sha not in self._sizes and sha not in missing})
+            if unsized:
+                output = self._git("cat-file", "--batch-check=%(objectname) %(objectsize)", input="\n".join(unsized).encode() + b"\n")
+                for line in output.decode().splitlines():
+                    sha, size = line.split()
+                    self._sizes[sha] = int(size)
+            return {path: (sha, self._sizes.get(sha, 0)) for path, sha in files.items()}
+
+    def _ls_tree(self, treeish: str, paths: Optional[List[str]] = None) -> Dict[str, Tuple[str, str]]:
+        """
+        Returns the mode and blob SHA per path of a tree (submodules excluded);
+        listing needs no blobs.
+        """
+        output = self._git("ls-tree", "-r", "-z", "--full-tree", treeish, "--", *(paths or []))
+        files = {}
+        for record in output.split(b"\0"):
+            if not record:
+                continue
+            meta, path = record.split(b"\t", 1)
+            mode, kind, sha = meta.decode().split()
+            if kind == "blob":
+                files[path.decode()] = (mode, sha)
+        return files
+
+    def _missing_blobs(self, head: str) -> List[str]:
+        """
+        Returns the blobs of a commit's tree not downloaded yet, without
+        triggering downloads.
+        """
+        output = self._git("rev-list", "--objects", "--no-walk", "--missing=print", head)
+        return [line[1:] for line in output.decode().splitlines() if line.startswith("?")]
+
+    def prefetch(self, paths: Optional[List[str]] = None) -> int:
+        """
+        Downloads the blobs of several files in one request instead of one
+        request per file on first read.
+
+        Args:
+            paths (Optional[List[str]]): Files to download, default all.
+
+        Returns:
+            int: Number of blobs downloaded.
+        """
+        with self._lock:
+            head = self.head()
+            if head is None:
+                return 0
+            missing = self._missing_blobs(head)
+            if paths is not None:
+                files = self.list_files()
+                missing = sorted(set(missing) & {files[path] for path in paths if path in files})
+            if missing:
+                self._git(
+                    "fetch", "--quiet", "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no",
+                    "--filter=blob:none", "--stdin", "origin", input="\n".join(missing).encode() + b"\n", remote=True,
+                )
+            return len(missing)
+
+    def read(self, path: str) -> Optional[bytes]:
+        """
+        Reads a file of the branch.
+
+        Args:
+            path (str): File path.
+
+        Returns:
+            Optional[bytes]: File data, or None if there is no such file.
+        """
+        with self._lock:
+            sha = self.list_files().get(path)
+            if sha is None:
+                return None
+            return self.read_blob(sha)
+
+    def read_blob(self, sha: str) -> bytes:
+        """
+        Reads a blob by SHA, downloading it from the remote if it is missing.
+
+        Args:
+            sha (str): Blob SHA.
+
+        Returns:
+            bytes: Blob data.
+        """
+        with self._lock:
+            data = self._git("cat-file", "blob", sha, remote=True)
+            self._sizes[sha] = len(data)
+            return data
+
+    def grep(self, pattern: str, regex: bool = False, ignore_case: bool = True) -> List[Tuple[str, int, str]]:
+        """
+        Searches the text files of the branch, downloading missing blobs first.
+
+        Args:
+            pattern (str): Substring, or extended regular expression if `regex`.
+            regex (bool): Whether the pattern is a regular expression.
+            ignore_case (bool): Whether letter case is ignored.
+
+        Returns:
+            List[Tuple[str, int, str]]: Path, line number and line of every match.
+        """
+        with self._lock:
+            head = self.head()
+            if head is None:
+                return []
+            self.prefetch()
+            args = ["grep", "-I", "-n", "-z", "--full-name", "-E" if regex else "-F"]
+            if ignore_case:
+                args.append("-i")
+            # git grep exits with 1 when nothing matches.
+            output = self._git(*args, "-e", pattern, head, allowed=(0, 1))
+        matches = []
+        for line in output.decode(errors="replace").splitlines():
+            location, number, text = line.split("\0", 2)
+            matches.append((location.split(":", 1)[1], int(number), text))
+        return matches
+
+    def commit(
+        self, changes: Dict[str, Optional[Union[str, bytes]]], message: str,
+        expected: Optional[Dict[str, Optional[str]]] = None, author: Optional[Tuple[str, str]] = None,
+    ) -> str:
+        """
+        Commits file creations, updates and deletions locally; the commit is
+        pushed with the next batch.
+
+        Args:
+            changes (Dict[str, Optional[Union[str, bytes]]]): New content per path; None deletes the file.
+            message (str): Commit message.
+            expected (Optional[Dict[str, Optional[str]]]): Blob SHA some paths must
+                still have, None for paths that must not exist.
+            author (Optional[Tuple[str, str]]): Name and email the commit is
+                authored and committed as.
+
+        Returns:
+            str: SHA of the local commit.
+
+        Raises:
+            WorkingCopyConflict: If a path does not match `expected`.
+            WorkingCopyError: If a git command fails.
+        """
+        with self._lock:
+            head = self.head()
+            files = self.list_files()
+            changed = sorted(path for path, sha in (expected or {}).items() if files.get(path) != sha)
+            if changed:
+                raise WorkingCopyConflict(f"Changed since it was read: {', '.join(changed)}.")
+            blobs = {}
+            for path, content in changes.items():
+                if content is None:
+                    blobs[path] = None
+                    continue
+                data = content.encode() if isinstance(content, str) else content
+                blobs[path] = self._git("hash-object", "-w", "--stdin", input=data).decode().strip()
+            pending = _PendingCommit(
+                message, blobs, {path: files.get(path) for path in changes},
+                author or _DEFAULT_AUTHOR, f"{int(time.time())} +0000",
+            )
+            new_head = self._commit_tree(head, pending)
+            self._git("update-ref", self._local_ref, new_head, *([head] if head else []))
+            self._pending.append(pending)
+            self._schedule_push()
+            return new_head
+
+    def update_file(
+        self, path: str, content: Union[str, bytes], message: str, author: Optional[Tuple[str, str]] = None,
+    ) -> str:
+        """
+        Commits a new version of one file locally; see `commit`.
+        """
+        return self.commit({path: content}, message, author=author)
+
+    def _commit_tree(self, parent: Optional[str], pending: _PendingCommit) -> str:
+        """
+        Writes a commit applying `pending` on top of `parent` through a temporary
+        index, so neither a checkout nor the other files' blobs are needed.
+        Changed files keep their mode (e.g. executable); new files get _FILE_MODE.
+        """
+        handle, index = tempfile.mkstemp(prefix="index-", dir=self.directory)
+        os.close(handle)
+        os.unlink(index)
+        name, email = pending.author
+        env = {
+            "GIT_INDEX_FILE": index,
+            "GIT_AUTHOR_NAME": name,
+            "GIT_AUTHOR_EMAIL": email,
+            "GIT_AUTHOR_DATE": pending.date,
+            "GIT_COMMITTER_NAME": name,
+            "GIT_COMMITTER_EMAIL": email,
+        }
+        try:
+            modes = {}
+            if parent:
+                self._git("read-tree", parent, env=env)
+                modes = {path: mode for path, (mode, _) in self._ls_tree(parent, list(pending.changes)).items()}
+            # Mode 0 removes a path from the index.
+            entries = "".join(
+                f"0 {'0' * 40}\t{path}\n" if sha is None else f"{modes.get(path, _FILE_MODE)} {sha}\t{path}\n"
+                for path, sha in pending.changes.items()
+            )
+            self._git("update-index", "--index-info", input=entries.encode(), env=env)
+            tree = self._git("write-tree", env=env).decode().strip()
+            parents = ["-p", parent] if parent else []
+            commit = self._git("commit-tree", tree, *parents, input=pending.message.encode(), env=env).decode().strip()
+        finally:
+            if os.path.exists(index):
+                os.unlink(index)
+        return commit
+
+    def _replay(self, onto: Optional[str]) -> None:
+        """
+        Rebuilds the local branch as the remote head plus the unpushed commits.
+
+        Raises:
+            WorkingCopyError: If the remote changed a path an unpushed commit
+                changes too; the local branch is left as it was.
+        """
+        if not self._pending:
+            if onto:
+                self._git("update-ref", self._local_ref, onto)
+            return
+        head = onto
+        for pending in self._pending:
+            current = {path: sha for path, (_, sha) in self._ls_tree(head, list(pending.changes)).items()} if head else {}
+            conflicts = [
+                path for path, base in pending.bases.items()
+                if current.get(path) not in (base, pending.changes[path])
+            ]
+            if conflicts:
+                raise WorkingCopyConflict(
+                    f"Unpushed commit '{pending.message}' conflicts with remote changes to {', '.join(sorted(conflicts))}."
+                )
+            head = self._commit_tree(head, pending)
+        self._git("update-ref", self._local_ref, head)
+
+    def pending(self) -> int:
+        """
+        Returns the number of local commits not pushed yet.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def push(self) -> int:
+        """
+        Pushes all local commits in one push. If the remote moved meanwhile, the
+        commits are replayed onto it first.
+
+        Returns:
+            int: Number of commits pushed.
+
+        Raises:
+            WorkingCopyError: If pushing fails or the commits conflict with the remote.
+        """
+        with self._lock:
+            if self._push_timer:
+                self._push_timer.cancel()
+                self._push_timer = None
+            if not self._pending:
+                return 0
+            for attempt in range(2):
+                try:
+                    # Not forced: a remote that moved rejects the push instead of losing commits.
+                    self._git("push", "--quiet", "origin", f"{self._local_ref}:{self._local_ref}", remote=True)
+                    break
+                except WorkingCopyError:
+                    if attempt:
+                        raise
+                    self._fetch()
+                    self._replay(self._rev_parse(self._remote_ref))
+            count = len(self._pending)
+            self._pending = []
+            self._git("update-ref", self._remote_ref, self.head())
+            self.push_error = None
+            logging.info(f"Pushed {count} commit(s) to {self.url} ({self.branch}).")
+            return count
+
+    def _schedule_push(self) -> None:
+        if self._push_timer is None:
+            self._push_timer = threading.Timer(WORKING_COPY_PUSH_DELAY, self._push_in_background)
+            self._push_timer.daemon = True
+            self._push_timer.start()
+
+    def _push_in_background(self) -> None:
+        with self._lock:
+            self._push_timer = None
+        try:
+            self.push()
+        except WorkingCopyError as e:
+            self.push_error = str(e)
+            logging.error(f"Pushing to {self.url} failed, local commits are kept: {e}")
+
+_working_copies: Dict[Tuple[str, Optional[str]], WorkingCopy] = {}
+_working_copies_lock = threading.Lock()
+
+def get_working_copy(url: str, branch: Optional[str] = None, token: Optional[str] = None) -> WorkingCopy:
+    """
+    Returns the process-wide working copy of a repository branch, cloning it on
+    first use.
+
+    Args:
+        url (str): Remote URL (https or a local path).
+        branch (Optional[str]): Branch, default the remote's default branch.
+        token (Optional[str]): GitHub token for https remotes.
+
+    Returns:
+        WorkingCopy: The opened working copy.
+    """
+    key = (url, branch)
+    with _working_copies_lock:
+        copy = _working_copies.get(key)
+        if copy is None:
+            directory = os.path.join(WORKING_COPY_DIR, hashlib.sha1(f"{url}\0{branch}".encode()).hexdigest()[:16])
+            copy = _working_copies[key] = WorkingCopy(url, directory, branch, token)
+    copy.token = token or copy.token
+    if copy.branch is None or copy.head() is None:
+        copy.open()
+    return copy
+
+@atexit.register
+def _push_all() -> None:
+    """
+    Pushes unpushed commits of every working copy when the process exits.
+    """
+    for copy in list(_working_copies.values()):
+        try:
+            copy.push()
+        except WorkingCopyError as e:
+            logging.error(f"Unpushed commits remain in {copy.directory}: {e}")